@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_meeting_assistant.settings')
+# Serve the ask and list endpoints as native coroutines (api/async_views.py)
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +48,8 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its request span covers the rest of the stack
+    'api.middleware.TraceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +86,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Ingest worker threads share this database with request threads
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -135,6 +140,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 ALLOWED_HOSTS = ['*']
 
 
-# Increase upload limit to 1GB
-DATA_UPLOAD_MAX_MEMORY_SIZE = 1073741824  # 1GB in bytes
-FILE_UPLOAD_MAX_MEMORY_SIZE = 1073741824  # 1GB in bytes
+# Uploaded files stream to disk in 64KB chunks instead of being held in memory.
+# They spool into the ingest staging dir so handing one to a job is a rename,
+# and are SHA-256 hashed on the way in for content-addressed ingest.
+FILE_UPLOAD_HANDLERS = ["api.upload_handlers.HashingTemporaryFileUploadHandler"]
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB; only consulted by the memory handler
+FILE_UPLOAD_TEMP_DIR = os.getenv("INGEST_STAGING_DIR", os.path.join(tempfile.gettempdir(), "aima-ingest"))
+os.makedirs(FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+# Non-file request data (form fields, JSON bodies); file size itself isn't limited by this
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+
+
+# Every log record (and each span line, see api.services.telemetry) goes to
+# stdout as one JSON object carrying the request's trace id.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "api.services.telemetry.JsonLogFormatter"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "stream": "ext://sys.stdout", "formatter": "json"},
+    },
+    "loggers": {
+        "api": {"handlers": ["console"], "level": os.getenv("LOG_LEVEL", "INFO"), "propagate": False},
+        # SPAN_LOGS decides which spans are logged, whatever LOG_LEVEL is
+        "api.spans": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
@@ -1 +1,9 @@
 from django.contrib import admin
+from .models import IngestJob
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ("filename", "kb_id", "status", "stage", "created_at", "updated_at")
+    list_filter = ("status", "kb_id")
+    search_fields = ("filename", "file_key")
@@ -0,0 +1,59 @@
+import os
+import time
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from . import views
+from .services.upstream import run_blocking, iterate_blocking
+
+# Native coroutine versions of the ask and list endpoints, served in place of
+# the DRF views when ASYNC_VIEWS=1 (asgi.py sets it). They call the same
+# _*_response helpers as the DRF views, on the upstream bridge pool, so a
+# request waiting on S3 or Bedrock costs the event loop nothing and
+# upstream.UPSTREAM_LIMITS caps calls per service.
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "0") == "1"
+
+
+def _request_data(request):
+    """
+    The body parsed by DRF's configured parsers, i.e. the sync views' request.data.
+    """
+    return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]).data
+
+
+# csrf_exempt as DRF's api_view does for the sync views
+@csrf_exempt
+@require_POST
+async def ask_question(request):
+    return await run_blocking(views._ask_response)(_request_data(request))
+
+
+@csrf_exempt
+@require_POST
+async def ask_question_stream(request):
+    return await run_blocking(views._ask_stream_response)(_request_data(request), time.perf_counter(), iterate_blocking)
+
+
+@csrf_exempt
+@require_POST
+async def kb_ask_question(request):
+    return await run_blocking(views._kb_ask_response)(request.POST)
+
+
+@csrf_exempt
+@require_POST
+async def kb_ask_question_stream(request):
+    return await run_blocking(views._kb_ask_stream_response)(request.POST, time.perf_counter(), iterate_blocking)
+
+
+@require_GET
+async def list_kb_files(request, kb_id):
+    return await run_blocking(views._kb_files_response)(
+        kb_id, request.headers.get("If-None-Match", ""), bool(request.GET.get("details"))
+    )
+
+
+@require_GET
+async def list_kb_summaries(request, kb_id):
+    return await run_blocking(views._kb_summaries_response)(kb_id)
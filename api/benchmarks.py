@@ -0,0 +1,208 @@
+import io
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+# Local stand-ins for the AWS services the hot paths call, used by
+# `manage.py benchmark_endpoints`. S3 and DynamoDB come from moto; Bedrock and
+# Transcribe are faked here with fixed, configurable latency so runs are
+# deterministic and cost nothing.
+
+EMBEDDING_DIMENSIONS = 1024
+
+TOPICS = {
+    "budget": "budget forecast invoice accrual spend variance quarter approval finance",
+    "hiring": "hiring candidate interview offer onboarding headcount recruiter role",
+    "release": "release deploy rollback pipeline staging regression hotfix changelog",
+    "vendor": "vendor contract shipment delay procurement supplier renewal pricing",
+    "security": "security audit access credentials rotation incident patch compliance",
+    "data": "data warehouse schema migration dashboard metrics ingestion latency",
+}
+FILLER = "we should probably check that next week and then follow up with the team about it".split()
+SPEAKERS = ["Alex", "Sam", "Jordan", "Priya", "Chen", "Maria"]
+
+
+def hashed_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list:
+    """
+    Deterministic bag-of-words embedding (feature hashing), so texts sharing
+    words score as similar the way real embeddings roughly do.
+    """
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        slot = int.from_bytes(digest[:4], "big") % dimensions
+        vector[slot] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class MeetingCorpus:
+    """
+    Synthetic meeting transcripts: speaker turns mixing one or two topics with
+    filler, plus a ticket id per meeting so keyword retrieval has something exact to find.
+    """
+
+    def __init__(self, turns: int = 120, seed: int = 0):
+        self.turns = turns
+        self.seed = seed
+
+    def transcript(self, number: int) -> str:
+        rng = random.Random(f"{self.seed}:{number}")
+        topics = rng.sample(sorted(TOPICS), 2)
+        lines = []
+        for turn in range(self.turns):
+            words = TOPICS[rng.choice(topics)].split()
+            sentence = [rng.choice(words if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(6, 30))]
+            if turn == self.turns // 2:
+                sentence += ["ticket", f"OPS-{number:05d}"]
+            lines.append(f"{rng.choice(SPEAKERS)}: {' '.join(sentence)}.")
+        return "\n".join(lines)
+
+    def question(self, rng: random.Random) -> str:
+        words = TOPICS[rng.choice(sorted(TOPICS))].split()
+        return f"What did we decide about the {' and '.join(rng.sample(words, 2))}? ({rng.randrange(10 ** 6)})"
+
+
+class FakeBedrockRuntime:
+    """
+    bedrock-runtime client answering Titan embedding and Claude messages calls
+    locally after embed_latency / chat_latency seconds.
+    """
+
+    class exceptions:
+        class ThrottlingException(Exception):
+            pass
+
+    def __init__(self, embed_latency: float = 0.0, chat_latency: float = 0.0, answer_words: int = 120):
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.answer_words = answer_words
+        self._lock = threading.Lock()
+        self.stats = {"embed_calls": 0, "chat_calls": 0, "input_tokens": 0, "output_tokens": 0}
+
+    def _chat(self, body: dict) -> tuple:
+        prompt = "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for message in body["messages"]
+            for part in ([message["content"]] if isinstance(message["content"], str) else message["content"])
+        )
+        words = [word for word in prompt.split() if word.isalpha()][-400:] or FILLER
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        if "meeting summaries" in prompt or "condensing part" in prompt:
+            sections = ["Title", "Purpose", "Key Areas", "Pain Points", "Open Questions", "Process Flow"]
+            text = "\n\n".join(
+                f"## {heading}\n" + "\n".join(f"- {' '.join(rng.choices(words, k=12))}" for _ in range(3))
+                for heading in sections
+            )
+        else:
+            text = " ".join(rng.choices(words, k=self.answer_words))
+        input_tokens, output_tokens = len(prompt) // 4, len(text) // 4
+        with self._lock:
+            self.stats["chat_calls"] += 1
+            self.stats["input_tokens"] += input_tokens
+            self.stats["output_tokens"] += output_tokens
+        return text, input_tokens, output_tokens
+
+    def invoke_model(self, body, modelId: str, **kwargs) -> dict:
+        body = json.loads(body)
+        if "inputText" in body:
+            time.sleep(self.embed_latency)
+            with self._lock:
+                self.stats["embed_calls"] += 1
+            payload = {"embedding": hashed_embedding(body["inputText"]), "inputTextTokenCount": len(body["inputText"]) // 4}
+        else:
+            time.sleep(self.chat_latency)
+            text, input_tokens, output_tokens = self._chat(body)
+            payload = {
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8")), "ResponseMetadata": {"RetryAttempts": 0}}
+
+    def invoke_model_with_response_stream(self, body, modelId: str, **kwargs) -> dict:
+        time.sleep(self.chat_latency)
+        text, input_tokens, output_tokens = self._chat(json.loads(body))
+
+        def events():
+            words = text.split(" ")
+            for start in range(0, len(words), 8):
+                delta = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": " ".join(words[start:start + 8]) + " "}}
+                yield {"chunk": {"bytes": json.dumps(delta).encode("utf-8")}}
+            stop = {"type": "message_stop", "amazon-bedrock-invocationMetrics": {
+                "inputTokenCount": input_tokens, "outputTokenCount": output_tokens,
+            }}
+            yield {"chunk": {"bytes": json.dumps(stop).encode("utf-8")}}
+
+        return {"body": events()}
+
+
+class FakeTranscribe:
+    """
+    Transcribe client whose jobs complete latency seconds after they start,
+    writing <job_name>.json to the output bucket like the real service.
+    transcript_for(media_uri) supplies the text.
+    """
+
+    def __init__(self, s3, transcript_for, latency: float = 0.0):
+        self.s3 = s3
+        self.transcript_for = transcript_for
+        self.latency = latency
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start_transcription_job(self, TranscriptionJobName, Media, OutputBucketName, **kwargs):
+        with self._lock:
+            self._jobs[TranscriptionJobName] = {
+                "media": Media["MediaFileUri"], "bucket": OutputBucketName,
+                "created": datetime.now(timezone.utc), "started": time.monotonic(), "status": "IN_PROGRESS",
+            }
+        return {"TranscriptionJob": {"TranscriptionJobName": TranscriptionJobName, "TranscriptionJobStatus": "IN_PROGRESS"}}
+
+    def _advance(self, name: str, job: dict) -> str:
+        if job["status"] == "IN_PROGRESS" and time.monotonic() - job["started"] >= self.latency:
+            text = self.transcript_for(job["media"])
+            body = {"jobName": name, "results": {"transcripts": [{"transcript": text}]}}
+            self.s3.put_object(Bucket=job["bucket"], Key=f"{name}.json", Body=json.dumps(body).encode("utf-8"))
+            job["status"] = "COMPLETED"
+        return job["status"]
+
+    def get_transcription_job(self, TranscriptionJobName):
+        with self._lock:
+            job = self._jobs[TranscriptionJobName]
+            status = self._advance(TranscriptionJobName, job)
+        return {"TranscriptionJob": {"TranscriptionJobName": TranscriptionJobName, "TranscriptionJobStatus": status}}
+
+    def list_transcription_jobs(self, Status=None, MaxResults=100, NextToken=None):
+        with self._lock:
+            summaries = [
+                {"TranscriptionJobName": name, "TranscriptionJobStatus": self._advance(name, job), "CreationTime": job["created"]}
+                for name, job in sorted(self._jobs.items(), key=lambda item: item[1]["created"], reverse=True)
+            ]
+        return {"TranscriptionJobSummaries": [s for s in summaries if Status in (None, s["TranscriptionJobStatus"])]}
+
+
+def latency_summary(samples: list, errors: int = 0, wall_seconds: float = None) -> dict:
+    """
+    Nearest-rank percentiles (milliseconds) and throughput for one endpoint run.
+    """
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000, 2) if ordered else None
+
+    summary = {
+        "count": len(ordered),
+        "errors": errors,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+    }
+    if wall_seconds:
+        summary["throughput_rps"] = round(len(ordered) / wall_seconds, 2)
+    return summary
@@ -0,0 +1,317 @@
+import json
+import os
+import asyncio
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+
+# Service modules read cache and staging paths from the environment at import
+# time, so they are pointed at a scratch directory before anything imports them.
+SCRATCH_PATHS = {
+    "ANSWER_CACHE_PATH": "answer-cache.sqlite3",
+    "EMBEDDING_CACHE_PATH": "embedding-cache.sqlite3",
+    "INGEST_REGISTRY_PATH": "ingest-registry.sqlite3",
+    "INGEST_STAGING_DIR": "staging",
+    "INDEX_STORE_DIR": "index-store",
+}
+ERROR_MARKERS = ("An unexpected error occurred", "rate-limited")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark upload_file, ask_question, kb_ask_question and list_kb_summaries offline: "
+        "moto S3 plus fake Bedrock and Transcribe, on synthetic KBs of growing size."
+    )
+    # System checks import the URLconf (and with it the services) before handle() can redirect their paths
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kb-sizes", type=int, nargs="+", default=[10, 50, 100],
+                            help="Files in the KB at each measurement step (ascending)")
+        parser.add_argument("--kb-id", default="coalition-kb")
+        parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint per step")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+        parser.add_argument("--turns", type=int, default=120, help="Speaker turns per synthetic meeting")
+        parser.add_argument("--files-per-question", type=int, default=5)
+        parser.add_argument("--video-share", type=float, default=0.1,
+                            help="Share of uploads sent as video, i.e. through the fake Transcribe")
+        parser.add_argument("--embed-latency-ms", type=float, default=20)
+        parser.add_argument("--chat-latency-ms", type=float, default=300)
+        parser.add_argument("--transcribe-latency-ms", type=float, default=1000)
+        parser.add_argument("--s3-latency-ms", type=float, default=0, help="Added to every S3 call")
+        parser.add_argument("--ingest-workers", type=int, default=2)
+        parser.add_argument("--asgi", action="store_true",
+                            help="Serve every request on one event loop through Django's async handler, "
+                                 "with the async ask and list views (ASYNC_VIEWS=1), like a single ASGI worker")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this path")
+        parser.add_argument("--baseline", help="Earlier --output JSON to compare p50/p95 against")
+
+    def handle(self, *args, **options):
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise CommandError("benchmark_endpoints needs moto: pip install 'moto[s3,dynamodb]'")
+
+        scratch = tempfile.mkdtemp(prefix="aima-bench-")
+        for name, path in SCRATCH_PATHS.items():
+            os.environ[name] = os.path.join(scratch, path)
+        os.environ["JOB_WORKERS"] = str(options["ingest_workers"])
+        if options["asgi"]:
+            os.environ["ASYNC_VIEWS"] = "1"
+        os.environ.update(AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing", AWS_SESSION_TOKEN="testing")
+        os.environ.pop("ENV", None)  # no STS role assumption
+
+        from django.db import connection
+        from django.test.utils import setup_test_environment, teardown_test_environment
+
+        mock = mock_aws()
+        mock.start()
+        setup_test_environment()
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(scratch, "db.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            mock.stop()
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options["baseline"]:
+            self.compare(results, options["baseline"])
+
+    def create_aws_resources(self, kb_id: str):
+        import boto3
+        from api.services import config
+        from api.services.kb_config import KB_CONFIG
+
+        boto3.resource("dynamodb", region_name=config.AWS_REGION).create_table(
+            TableName="aima-aws-credentials",
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        ).put_item(Item={"id": "default", "access_key": "testing", "secret_key": "testing"})
+
+        s3 = config.get_client("s3")
+        buckets = {config.UPLOAD_BUCKET, config.TRANSCRIPT_BUCKET, config.SUMMARY_BUCKET, config.VECTOR_S3_BUCKET}
+        buckets.update(KB_CONFIG[kb_id]["buckets"].values())
+        for bucket in buckets:
+            s3.create_bucket(Bucket=bucket)
+        return s3
+
+    def install_fakes(self, s3, corpus, options):
+        from api.benchmarks import FakeBedrockRuntime, FakeTranscribe
+        from api.services import embeddings, rag_engine, summarizer, transcriber
+
+        bedrock = FakeBedrockRuntime(options["embed_latency_ms"] / 1000, options["chat_latency_ms"] / 1000)
+        rag_engine.bedrock_runtime._client = bedrock
+        summarizer.bedrock_runtime._client = bedrock
+        embeddings._embeddings = embeddings.CachedBedrockEmbeddings(client=bedrock)
+
+        def transcript_for(media_uri):
+            return corpus.transcript(int(media_uri.rsplit("meeting-", 1)[1].split(".")[0]))
+
+        transcriber._manager = transcriber.TranscriptionManager(
+            client=FakeTranscribe(s3, transcript_for, options["transcribe_latency_ms"] / 1000),
+            min_interval=0.05, max_interval=0.5,
+        )
+
+        if options["s3_latency_ms"]:
+            delay = options["s3_latency_ms"] / 1000
+            s3.meta.events.register("before-call.s3", lambda **kwargs: time.sleep(delay))
+        return bedrock
+
+    def make_client(self):
+        from django.test import Client
+
+        return LoopClient(self.loop) if self.loop else Client()
+
+    def run_requests(self, count: int, concurrency: int, request) -> dict:
+        """
+        Call request(client, i) count times from concurrency threads, each with its
+        own test client. request returns True on success.
+        """
+        from api.benchmarks import latency_summary
+
+        local = threading.local()
+        samples, errors, lock = [], [0], threading.Lock()
+
+        def call(i):
+            if not hasattr(local, "client"):
+                local.client = self.make_client()
+            started = time.perf_counter()
+            try:
+                ok = request(local.client, i)
+            except Exception as e:
+                self.stderr.write(f"Request failed: {e}")
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append(elapsed)
+                errors[0] += not ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(call, range(count)))
+        return latency_summary(samples, errors[0], time.perf_counter() - started)
+
+    def wait_for_jobs(self, job_ids: list, timeout: float = 600) -> dict:
+        from api.models import IngestJob
+        from api.benchmarks import latency_summary
+
+        deadline = time.monotonic() + timeout
+        while True:
+            jobs = list(IngestJob.objects.filter(pk__in=job_ids))
+            if all(job.status in (IngestJob.SUCCEEDED, IngestJob.FAILED) for job in jobs):
+                break
+            if time.monotonic() > deadline:
+                raise CommandError(f"Ingest jobs still running after {timeout:.0f}s")
+            time.sleep(0.1)
+        failed = [job for job in jobs if job.status == IngestJob.FAILED]
+        for job in failed:
+            self.stderr.write(f"Ingest of {job.filename} failed: {job.error}")
+        durations = [(job.updated_at - job.created_at).total_seconds() for job in jobs if job not in failed]
+        return latency_summary(durations, len(failed))
+
+    def upload(self, client, filename: str, data: bytes, kb_id: str = None):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        fields = {"file": SimpleUploadedFile(filename, data)}
+        if kb_id:
+            fields["kb_id"] = kb_id
+        response = client.post("/upload/", fields)
+        return response.json()["job_id"] if response.status_code == 202 else None
+
+    def run_benchmark(self, options) -> dict:
+        self.loop = None
+        if options["asgi"]:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name="asgi-loop", daemon=True).start()
+        try:
+            return self.run_steps(options)
+        finally:
+            if self.loop:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def run_steps(self, options) -> dict:
+        from api.benchmarks import MeetingCorpus
+        from api.services.embeddings import get_embeddings
+
+        kb_id = options["kb_id"]
+        s3 = self.create_aws_resources(kb_id)
+        corpus = MeetingCorpus(turns=options["turns"], seed=options["seed"])
+        bedrock = self.install_fakes(s3, corpus, options)
+        rng = random.Random(options["seed"])
+        video_rng = random.Random(options["seed"] + 1)
+
+        # One single-file upload for the /ask/ path
+        single_job = self.upload(self.make_client(), "meeting-0.txt", corpus.transcript(0).encode("utf-8"))
+        self.wait_for_jobs([single_job])
+        from api.models import IngestJob
+        single_summary = IngestJob.objects.get(pk=single_job).result["summary"]
+
+        files, steps = [], []
+        for size in sorted(options["kb_sizes"]):
+            numbers = list(range(len(files) + 1, size + 1))
+            job_ids = [None] * len(numbers)
+
+            def upload_request(client, i):
+                number = numbers[i]
+                if video_rng.random() < options["video_share"]:
+                    name, data = f"meeting-{number}.mp4", f"synthetic video {number}".encode("utf-8")
+                else:
+                    name, data = f"meeting-{number}.txt", corpus.transcript(number).encode("utf-8")
+                job_ids[i] = self.upload(client, name, data, kb_id)
+                return job_ids[i] is not None
+
+            step = {"kb_files": size, "endpoints": {}}
+            if numbers:
+                self.stdout.write(f"Ingesting {len(numbers)} files to reach {size}...")
+                step["endpoints"]["upload_file"] = self.run_requests(len(numbers), options["concurrency"], upload_request)
+                step["endpoints"]["ingest_job"] = self.wait_for_jobs([job_id for job_id in job_ids if job_id])
+                files.extend(f"meeting-{number}" for number in numbers)
+
+            def ask_request(client, i):
+                response = client.post("/ask/", {
+                    "question": corpus.question(rng), "summary": single_summary, "file_key": "single-uploads/meeting-0",
+                }, content_type="application/json")
+                return response.status_code == 200 and not any(m in response.json().get("answer", "") for m in ERROR_MARKERS)
+
+            def kb_ask_request(client, i):
+                selected = rng.sample(files, min(options["files_per_question"], len(files)))
+                response = client.post("/api/kb/ask/", {"kb_id": kb_id, "files": selected, "question": corpus.question(rng)})
+                return response.status_code == 200 and not any(m in response.content.decode("utf-8") for m in ERROR_MARKERS)
+
+            def summaries_request(client, i):
+                response = client.get(f"/api/kb/{kb_id}/summaries/")
+                return response.status_code == 200 and len(response.json()) == len(files)
+
+            for name, request in (("ask_question", ask_request), ("kb_ask_question", kb_ask_request),
+                                  ("list_kb_summaries", summaries_request)):
+                step["endpoints"][name] = self.run_requests(options["requests"], options["concurrency"], request)
+            steps.append(step)
+
+            self.stdout.write(f"KB with {size} files:")
+            for name, summary in step["endpoints"].items():
+                throughput = f"  {summary['throughput_rps']:7.2f} req/s" if "throughput_rps" in summary else ""
+                self.stdout.write(
+                    f"  {name:<18} p50 {summary['p50_ms']:9.1f} ms  p95 {summary['p95_ms']:9.1f} ms  "
+                    f"p99 {summary['p99_ms']:9.1f} ms{throughput}  errors {summary['errors']}"
+                )
+
+        return {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "config": {key: options[key] for key in (
+                "kb_id", "requests", "concurrency", "turns", "files_per_question", "video_share", "embed_latency_ms",
+                "chat_latency_ms", "transcribe_latency_ms", "s3_latency_ms", "ingest_workers", "seed", "asgi",
+            )},
+            "steps": steps,
+            "bedrock": bedrock.stats,
+            "embedding_cache": get_embeddings().stats(),
+        }
+
+    def compare(self, results: dict, baseline_path: str):
+        with open(baseline_path) as f:
+            baseline = {step["kb_files"]: step["endpoints"] for step in json.load(f)["steps"]}
+
+        self.stdout.write(f"Change against {baseline_path} (p50 / p95):")
+        for step in results["steps"]:
+            before = baseline.get(step["kb_files"])
+            if before is None:
+                continue
+            for name, summary in step["endpoints"].items():
+                if name not in before or not before[name]["p50_ms"]:
+                    continue
+                changes = [
+                    f"{(summary[key] - before[name][key]) / before[name][key] * 100:+6.1f}%"
+                    for key in ("p50_ms", "p95_ms")
+                ]
+                self.stdout.write(f"  {step['kb_files']:>5} files  {name:<18} {' / '.join(changes)}")
+
+
+class LoopClient:
+    """
+    Test client whose requests go through Django's async handler on one shared
+    event loop, so concurrent callers are served the way one ASGI worker serves them.
+    """
+
+    def __init__(self, loop):
+        from django.test import AsyncClient
+
+        self.loop = loop
+        self.client = AsyncClient()
+
+    def get(self, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(self.client.get(*args, **kwargs), self.loop).result()
+
+    def post(self, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(self.client.post(*args, **kwargs), self.loop).result()
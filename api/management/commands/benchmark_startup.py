@@ -0,0 +1,70 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Each target runs in a fresh interpreter and prints its own elapsed seconds, so
+# interpreter start-up itself is excluded and module caches never carry over.
+TARGETS = {
+    # WSGI app plus URLconf (which imports api.views), i.e. what the first request pays
+    "wsgi": (
+        "import os, time; t = time.perf_counter(); "
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_meeting_assistant.settings'); "
+        "from django.core.wsgi import get_wsgi_application; get_wsgi_application(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns; "
+        "print(time.perf_counter() - t)"
+    ),
+    # runserver's start-up work: django.setup() plus system checks (which also load the URLconf)
+    "runserver": (
+        "import os, time; t = time.perf_counter(); "
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_meeting_assistant.settings'); "
+        "import django; django.setup(); "
+        "from django.core import checks; checks.run_checks(); "
+        "print(time.perf_counter() - t)"
+    ),
+    # module-level work Streamlit repeats for ui.py
+    "ui": "import time; t = time.perf_counter(); import ui; print(time.perf_counter() - t)",
+}
+
+
+class Command(BaseCommand):
+    help = "Measure cold-start time of the Django app (WSGI/runserver) and the Streamlit ui.py module."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--targets", nargs="*", choices=sorted(TARGETS), default=sorted(TARGETS))
+        parser.add_argument("--output", help="Also write the results as JSON to this path")
+
+    def run_target(self, code: str) -> float:
+        result = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, env=dict(os.environ),
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "failed")
+        return float(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        results = {}
+        for name in options["targets"]:
+            try:
+                times = [self.run_target(TARGETS[name]) for _ in range(options["runs"])]
+            except Exception as e:
+                self.stderr.write(f"{name}: {e}")
+                results[name] = {"error": str(e)}
+                continue
+            results[name] = {
+                "runs": len(times),
+                "min_s": round(min(times), 3),
+                "median_s": round(statistics.median(times), 3),
+                "max_s": round(max(times), 3),
+            }
+            self.stdout.write(f"{name:<10} median {results[name]['median_s']:.3f}s  "
+                              f"min {results[name]['min_s']:.3f}s  max {results[name]['max_s']:.3f}s")
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
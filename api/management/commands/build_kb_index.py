@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Consolidate a KB's per-file FAISS indexes into its single KB index (no re-embedding)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kb_id")
+        parser.add_argument("--files", nargs="*", help="Only fold in these files (default: every indexed file)")
+
+    def handle(self, *args, **options):
+        from api.services.kb_config import KB_CONFIG
+        from api.services.kb_query import s3
+        from api.services.kb_index import rebuild_kb_index
+        from api.services.embeddings import get_embeddings
+
+        kb_id = options["kb_id"]
+        if kb_id not in KB_CONFIG:
+            raise CommandError(f"Unknown KB ID: {kb_id}")
+
+        filenames = options["files"]
+        if not filenames:
+            conf = KB_CONFIG[kb_id]
+            paginator = s3.get_paginator("list_objects_v2")
+            filenames = sorted(
+                obj["Key"].split("/")[-1][: -len(".index.faiss")]
+                for page in paginator.paginate(Bucket=conf["buckets"]["embeddings"], Prefix=f"{conf['prefix']}/")
+                for obj in page.get("Contents", [])
+                if obj["Key"].endswith(".index.faiss") and not obj["Key"].split("/")[-1].startswith("_")
+            )
+
+        total = rebuild_kb_index(kb_id, filenames, get_embeddings())
+        self.stdout.write(self.style.SUCCESS(f"KB index for {kb_id}: {len(filenames)} files, {total} vectors"))
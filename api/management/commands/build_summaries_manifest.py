@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Rebuild a KB's summaries manifest from the summary objects in S3 (e.g. after out-of-band edits)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kb_ids", nargs="*", help="KBs to rebuild (default: every configured KB)")
+        parser.add_argument(
+            "--sections", action="store_true",
+            help="Also embed the sections of summaries that are missing from (or stale in) the sections manifest",
+        )
+
+    def handle(self, *args, **options):
+        from api.services.summaries import KB_CONFIG, build_summaries_manifest
+
+        kb_ids = options["kb_ids"] or list(KB_CONFIG)
+        for kb_id in kb_ids:
+            if kb_id not in KB_CONFIG:
+                raise CommandError(f"Unknown KB ID: {kb_id}")
+            manifest = build_summaries_manifest(kb_id)
+            self.stdout.write(self.style.SUCCESS(f"{kb_id}: {len(manifest['summaries'])} summaries"))
+            if options["sections"]:
+                from api.services.embeddings import get_embeddings
+                from api.services.summary_index import sync_summary_sections
+
+                count = sync_summary_sections(kb_id, get_embeddings())
+                self.stdout.write(self.style.SUCCESS(f"{kb_id}: sectioned {count} summaries"))
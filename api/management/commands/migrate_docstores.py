@@ -0,0 +1,60 @@
+import os
+import pickle
+import tempfile
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Convert pickled .index.pkl docstores in the embeddings buckets to .index.chunks chunk stores."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bucket", action="append", help="Embeddings bucket (default: every bucket in kb_config.json)")
+        parser.add_argument("--prefix", default="", help="Only convert keys under this prefix")
+        parser.add_argument("--delete-pkl", action="store_true", help="Delete each .index.pkl once converted")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        from api.services.kb_config import KB_CONFIG
+        from api.services.kb_query import s3
+        from api.services.rag_engine import VECTOR_S3_BUCKET
+        from api.services.chunk_store import write_chunk_store
+
+        buckets = options["bucket"] or sorted(
+            {conf["buckets"]["embeddings"] for conf in KB_CONFIG.values()} | {VECTOR_S3_BUCKET}
+        )
+        converted = skipped = 0
+
+        for bucket in buckets:
+            keys = {
+                obj["Key"]
+                for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=options["prefix"])
+                for obj in page.get("Contents", [])
+            }
+            for pkl_key in sorted(k for k in keys if k.endswith(".index.pkl")):
+                key_prefix = pkl_key[: -len(".index.pkl")]
+                chunks_key = f"{key_prefix}.index.chunks"
+                if chunks_key in keys:
+                    skipped += 1
+                    continue
+
+                self.stdout.write(f"s3://{bucket}/{pkl_key} -> {chunks_key}")
+                if options["dry_run"]:
+                    continue
+
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    pkl_path = os.path.join(tmpdir, "index.pkl")
+                    chunks_path = os.path.join(tmpdir, "index.chunks")
+                    s3.download_file(bucket, pkl_key, pkl_path)
+                    # Trusted input: these pickles were written by our own ingest pipeline
+                    with open(pkl_path, "rb") as f:
+                        docstore, index_to_docstore_id = pickle.load(f)
+
+                    ids = [index_to_docstore_id[row] for row in range(len(index_to_docstore_id))]
+                    write_chunk_store(chunks_path, ids, [docstore.search(doc_id) for doc_id in ids])
+                    s3.upload_file(chunks_path, bucket, chunks_key)
+
+                if options["delete_pkl"]:
+                    s3.delete_object(Bucket=bucket, Key=pkl_key)
+                converted += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} docstores ({skipped} already migrated)"))
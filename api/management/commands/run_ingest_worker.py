@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Process queued upload jobs in the foreground (pair with JOB_WORKERS=0 on web processes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+
+    def handle(self, *args, **options):
+        from api.services.jobs import ensure_workers
+
+        ensure_workers(options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Ingest worker running with {options['workers']} threads"))
+        while True:
+            time.sleep(3600)
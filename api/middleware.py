@@ -0,0 +1,65 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from api.services.telemetry import TRACE_HEADER, trace, record_span, valid_trace_id
+
+
+def _traced(chunks, trace_id):
+    # Streamed bodies are generated after the view returns; keep their spans in the trace
+    with trace(trace_id):
+        yield from chunks
+
+
+async def _traced_async(chunks, trace_id):
+    with trace(trace_id):
+        async for chunk in chunks:
+            yield chunk
+
+
+class TraceMiddleware:
+    """
+    Time every request as an "http <method> <route>" span and, when the client
+    sends an X-Trace-Id header, tag every span the request records with it and
+    echo the id back.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI stay async so the async views aren't pushed onto a thread
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        trace_id = request.headers.get(TRACE_HEADER)
+        started = time.perf_counter()
+        with trace(trace_id):
+            response = self.get_response(request)
+            self._record(request, response, started)
+        return self._tag(response, trace_id)
+
+    async def __acall__(self, request):
+        trace_id = request.headers.get(TRACE_HEADER)
+        started = time.perf_counter()
+        with trace(trace_id):
+            response = await self.get_response(request)
+            self._record(request, response, started)
+        return self._tag(response, trace_id)
+
+    def _record(self, request, response, started):
+        match = getattr(request, "resolver_match", None)
+        route = f"/{match.route}" if match else "unmatched"
+        record_span(f"http {request.method} {route}", time.perf_counter() - started,
+                    "ok" if response.status_code < 500 else "error", status_code=response.status_code)
+
+    def _tag(self, response, trace_id):
+        if valid_trace_id(trace_id):
+            response[TRACE_HEADER] = trace_id
+            if response.streaming:
+                wrap = _traced_async if response.is_async else _traced
+                response.streaming_content = wrap(response.streaming_content, trace_id)
+        return response
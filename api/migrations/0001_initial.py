@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:19
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kb_id', models.CharField(blank=True, max_length=128, null=True)),
+                ('filename', models.CharField(max_length=512)),
+                ('file_key', models.CharField(max_length=512)),
+                ('file_type', models.CharField(max_length=32)),
+                ('content_type', models.CharField(blank=True, default='', max_length=128)),
+                ('source_path', models.CharField(blank=True, default='', max_length=1024)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('succeeded', 'succeeded'), ('failed', 'failed')], db_index=True, default='queued', max_length=16)),
+                ('stage', models.CharField(blank=True, default='', max_length=64)),
+                ('stages', models.JSONField(default=list)),
+                ('context', models.JSONField(default=dict)),
+                ('result', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
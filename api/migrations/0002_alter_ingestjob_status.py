@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('waiting', 'waiting'), ('succeeded', 'succeeded'), ('failed', 'failed')], db_index=True, default='queued', max_length=16),
+        ),
+    ]
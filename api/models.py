@@ -0,0 +1,55 @@
+import uuid
+from django.db import models
+
+
+class IngestJob(models.Model):
+    """
+    One upload moving through the ingest pipeline. Rows double as the work queue:
+    workers claim QUEUED jobs with a conditional UPDATE, so no broker is needed.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    WAITING = "waiting"  # parked on an external service (Transcribe); no worker is held
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, WAITING, SUCCEEDED, FAILED)]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kb_id = models.CharField(max_length=128, blank=True, null=True)
+    filename = models.CharField(max_length=512)
+    file_key = models.CharField(max_length=512)
+    file_type = models.CharField(max_length=32)
+    content_type = models.CharField(max_length=128, blank=True, default="")
+    source_path = models.CharField(max_length=1024, blank=True, default="")
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    stage = models.CharField(max_length=64, blank=True, default="")
+    stages = models.JSONField(default=list)   # [{name, status, started_at, duration_ms, error}]
+    context = models.JSONField(default=dict)  # values handed from one stage to the next
+    result = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": str(self.id),
+            "kb_id": self.kb_id,
+            "filename": self.filename,
+            "file_key": self.file_key,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
@@ -0,0 +1,170 @@
+import logging
+import os
+import re
+import time
+import sqlite3
+import tempfile
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Answers to KB questions, reused for near-identical questions over the same file set
+ANSWER_CACHE_PATH = os.getenv(
+    "ANSWER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "aima-answer-cache.sqlite3")
+)
+# Cosine similarity between normalized question embeddings needed for a hit
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# Most recent answers kept per (kb_id, file set)
+ANSWER_CACHE_MAX_PER_SET = int(os.getenv("ANSWER_CACHE_MAX_PER_SET", "200"))
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+def files_key(filenames) -> str:
+    return "\n".join(sorted(set(filenames)))
+
+
+class AnswerCache:
+    """
+    Semantic cache of KB answers keyed on (kb_id, sorted file set, question
+    embedding). SQLite in WAL mode so every process shares it, including ingest
+    workers that invalidate entries when a file is re-ingested.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL, max_per_set: int = ANSWER_CACHE_MAX_PER_SET, embeddings=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_per_set = max_per_set
+        self._embeddings = embeddings
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0,
+                       "saved_input_tokens": 0, "saved_output_tokens": 0}
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kb_id TEXT, files_key TEXT, question TEXT, vector BLOB, answer TEXT,
+                    input_tokens INTEGER, output_tokens INTEGER, created_at REAL, hits INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS answers_by_set ON answers (kb_id, files_key);
+                CREATE TABLE IF NOT EXISTS answer_files (
+                    answer_id INTEGER REFERENCES answers(id) ON DELETE CASCADE,
+                    kb_id TEXT, filename TEXT
+                );
+                CREATE INDEX IF NOT EXISTS answer_files_by_file ON answer_files (kb_id, filename);
+            """)
+            self._conn.commit()
+
+    def embed(self, question: str) -> np.ndarray:
+        if self._embeddings is None:
+            from api.services.embeddings import get_embeddings
+            self._embeddings = get_embeddings()
+        vector = np.asarray(self._embeddings.embed_query(normalize_question(question)), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, kb_id: str, filenames, question: str):
+        """
+        Return (answer or None, question vector). Pass the vector back to store()
+        on a miss so the question is only embedded once.
+        """
+        vector = self.embed(question)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, vector, answer, input_tokens, output_tokens FROM answers "
+                "WHERE kb_id = ? AND files_key = ? AND created_at > ?",
+                (kb_id, files_key(filenames), time.time() - self.ttl),
+            ).fetchall()
+
+            best, best_score = None, self.threshold
+            for row in rows:
+                score = float(np.dot(np.frombuffer(row[1], dtype=np.float32), vector))
+                if score >= best_score:
+                    best, best_score = row, score
+
+            if best is None:
+                self._stats["misses"] += 1
+                return None, vector
+            self._stats["hits"] += 1
+            self._stats["saved_input_tokens"] += best[3] or 0
+            self._stats["saved_output_tokens"] += best[4] or 0
+            self._conn.execute("UPDATE answers SET hits = hits + 1 WHERE id = ?", (best[0],))
+            self._conn.commit()
+        logger.debug("Answer cache hit for %s (similarity %.3f)", kb_id, best_score)
+        return best[2], vector
+
+    def store(self, kb_id: str, filenames, question: str, answer: str, usage: dict, vector=None):
+        if vector is None:
+            vector = self.embed(question)
+        key = files_key(filenames)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers (kb_id, files_key, question, vector, answer, input_tokens, output_tokens, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kb_id, key, question, np.asarray(vector, dtype=np.float32).tobytes(), answer,
+                 usage.get("input_tokens"), usage.get("output_tokens"), time.time()),
+            )
+            self._conn.executemany(
+                "INSERT INTO answer_files (answer_id, kb_id, filename) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, kb_id, filename) for filename in set(filenames)],
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE kb_id = ? AND files_key = ? AND id NOT IN "
+                "(SELECT id FROM answers WHERE kb_id = ? AND files_key = ? ORDER BY id DESC LIMIT ?)",
+                (kb_id, key, kb_id, key, self.max_per_set),
+            )
+            self._conn.commit()
+            self._stats["stores"] += 1
+
+    def invalidate(self, kb_id: str, filename: str) -> int:
+        """
+        Drop every cached answer whose file set includes filename.
+        """
+        with self._lock:
+            count = self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT answer_id FROM answer_files WHERE kb_id = ? AND filename = ?)",
+                (kb_id, filename),
+            ).rowcount
+            self._conn.commit()
+            self._stats["invalidations"] += count
+        if count:
+            logger.info("Invalidated %d cached answers for %s/%s", count, kb_id, filename)
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total_hits, saved_input, saved_output = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(hits * input_tokens), 0), "
+                "COALESCE(SUM(hits * output_tokens), 0) FROM answers"
+            ).fetchone()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                # across every process, for answers still in the cache
+                "total_hits": total_hits,
+                "total_saved_input_tokens": saved_input,
+                "total_saved_output_tokens": saved_output,
+            }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
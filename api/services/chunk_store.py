@@ -0,0 +1,99 @@
+import json
+import mmap
+import struct
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+# On-disk chunk store ({key_prefix}.index.chunks), replacing the pickled docstore.
+#
+#   magic (8) | count n (uint64) | id / text / metadata offsets (3 x (n+1) uint64)
+#   | ids blob | text blob | metadata blob (one JSON object per row)
+#
+# Everything is little-endian UTF-8; row i matches FAISS row i.
+MAGIC = b"AIMACHK1"
+HEADER = struct.Struct("<8sQ")
+
+
+def _column(values: list) -> tuple:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype="<u8")
+    return offsets, b"".join(encoded)
+
+
+def write_chunk_store(path: str, ids: list, documents: list):
+    """
+    Write documents (in FAISS row order) and their docstore ids to path.
+    """
+    columns = [
+        _column(ids),
+        _column([doc.page_content for doc in documents]),
+        _column([json.dumps(doc.metadata, separators=(",", ":")) for doc in documents]),
+    ]
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids)))
+        for offsets, _ in columns:
+            f.write(offsets.tobytes())
+        for _, blob in columns:
+            f.write(blob)
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a chunk store file. Rows are decoded on
+    demand, so only the chunks a search actually returns are materialized.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store file")
+
+        n = self.count + 1
+        offsets = np.frombuffer(self._mm, dtype="<u8", count=3 * n, offset=HEADER.size)
+        self._id_offsets, self._text_offsets, self._meta_offsets = offsets[:n], offsets[n:2 * n], offsets[2 * n:]
+        self._id_base = HEADER.size + 3 * n * 8
+        self._text_base = self._id_base + int(self._id_offsets[-1])
+        self._meta_base = self._text_base + int(self._text_offsets[-1])
+
+    def __len__(self):
+        return self.count
+
+    def _read(self, base: int, offsets, row: int) -> str:
+        return self._mm[base + int(offsets[row]): base + int(offsets[row + 1])].decode("utf-8")
+
+    def ids(self) -> list:
+        return [self._read(self._id_base, self._id_offsets, row) for row in range(self.count)]
+
+    def text(self, row: int) -> str:
+        return self._read(self._text_base, self._text_offsets, row)
+
+    def metadata(self, row: int) -> dict:
+        return json.loads(self._read(self._meta_base, self._meta_offsets, row))
+
+    def document(self, row: int) -> Document:
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+
+class ChunkDocstore(Docstore):
+    """
+    langchain Docstore backed by a ChunkStore. Read-only: stores are copied into
+    an InMemoryDocstore (index_store.private_store_copy) before being modified.
+    """
+
+    def __init__(self, chunks: ChunkStore):
+        self.chunks = chunks
+        self._rows = {doc_id: row for row, doc_id in enumerate(chunks.ids())}
+
+    def index_to_docstore_id(self) -> dict:
+        return {row: doc_id for doc_id, row in self._rows.items()}
+
+    def search(self, search: str):
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.chunks.document(row)
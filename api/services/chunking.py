@@ -0,0 +1,96 @@
+import re
+import hashlib
+
+# KB transcripts are chunked on content-defined boundaries: a chunk ends after a
+# line whose hash picks it as a boundary (once the chunk is big enough), so an
+# edit only changes the chunks around it and every other chunk keeps its text
+# and its id. Re-ingesting a corrected transcript then re-embeds a few chunks.
+# Lines too long for one chunk (a paragraph, or a transcript on a single line)
+# are cut into sentences, and sentences that are still too long into runs of
+# words ended by hashed word pairs, so boundaries follow content there too.
+CHUNK_MAX_CHARS = 500
+CHUNK_MIN_CHARS = 200
+# Roughly one line in BOUNDARY_MODULUS ends a chunk once CHUNK_MIN_CHARS is reached
+BOUNDARY_MODULUS = 3
+# Roughly one word in WORD_BOUNDARY_MODULUS ends a run of words within an over-long sentence
+WORD_BOUNDARY_MODULUS = 12
+
+_sentence_end = re.compile(r"(?<=[.!?])\s+")
+
+
+def _is_boundary(unit: str, modulus: int = BOUNDARY_MODULUS) -> bool:
+    digest = hashlib.blake2b(unit.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big") % modulus == 0
+
+
+def _word_runs(sentence: str):
+    run, size, previous = [], 0, ""
+    for word in sentence.split():
+        if len(word) > CHUNK_MAX_CHARS:
+            # No boundary to find inside a single huge token; cut it at fixed offsets
+            if run:
+                yield " ".join(run)
+                run, size = [], 0
+            yield from (word[i:i + CHUNK_MAX_CHARS] for i in range(0, len(word), CHUNK_MAX_CHARS))
+            continue
+        if run and size + len(word) + 1 > CHUNK_MAX_CHARS:
+            yield " ".join(run)
+            run, size = [], 0
+        run.append(word)
+        size += len(word) + 1
+        if _is_boundary(f"{previous} {word}", WORD_BOUNDARY_MODULUS):
+            yield " ".join(run)
+            run, size = [], 0
+        previous = word
+    if run:
+        yield " ".join(run)
+
+
+def _units(text: str):
+    """
+    (separator, unit) pairs, the separator being what joined the unit to the
+    one before it in the text: a line break, or a space within a long line.
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) <= CHUNK_MAX_CHARS:
+            yield "\n", line
+            continue
+        separator = "\n"
+        for sentence in _sentence_end.split(line):
+            pieces = [sentence] if len(sentence) <= CHUNK_MAX_CHARS else _word_runs(sentence)
+            for piece in pieces:
+                yield separator, piece
+                separator = " "
+
+
+def split_into_chunks(text: str) -> list:
+    chunks, current, size = [], "", 0
+    for separator, unit in _units(text):
+        if current and size + len(unit) + 1 > CHUNK_MAX_CHARS:
+            chunks.append(current)
+            current, size = "", 0
+        current = f"{current}{separator}{unit}" if current else unit
+        size += len(unit) + 1
+        if size >= CHUNK_MIN_CHARS and _is_boundary(unit):
+            chunks.append(current)
+            current, size = "", 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_ids(file_id: str, texts: list) -> list:
+    """
+    Stable docstore ids: a hash of the file and chunk text, suffixed when the
+    same text repeats within the file.
+    """
+    ids, seen = [], {}
+    for text in texts:
+        digest = hashlib.sha256(f"{file_id}\0{text}".encode("utf-8")).hexdigest()[:32]
+        count = seen.get(digest, 0)
+        seen[digest] = count + 1
+        ids.append(f"{digest}-{count}" if count else digest)
+    return ids
@@ -1,5 +1,15 @@
+import logging
 import os
+import threading
+from datetime import datetime, timedelta, timezone
 import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, RefreshableCredentials
+from api.services.telemetry import instrument_client
+from api.services.upstream import limit_client
+
+logger = logging.getLogger(__name__)
 
 # Static Bucket Config 
 UPLOAD_BUCKET = os.getenv("MEETING_UPLOADS_BUCKET", "aima-meeting-uploads")
@@ -10,32 +20,152 @@ AWS_REGION = "us-east-1"
 
 boto3.setup_default_session(region_name=AWS_REGION)
 
+# Credentials are fetched once per process and refreshed by botocore before they
+# expire. Permanent DynamoDB-stored keys are re-read every AWS_CREDENTIALS_TTL
+# seconds so rotations are picked up without a restart.
+AWS_CREDENTIALS_TTL = int(os.getenv("AWS_CREDENTIALS_TTL", str(60 * 60)))
+AWS_ASSUME_ROLE_SECONDS = int(os.getenv("AWS_ASSUME_ROLE_SECONDS", str(60 * 60)))
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+_session = None
+_default_chain_session = None
+_session_lock = threading.Lock()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class AimaCredentialProvider(CredentialProvider):
+    """
+    Credential provider serving the sandbox role (production) or the
+    DynamoDB-stored keys (dev/local) as self-refreshing credentials.
+    """
+
+    METHOD = "aima-credentials"
+    CANONICAL_NAME = "AimaCredentials"
+
+    def __init__(self, fetch):
+        super().__init__()
+        self._fetch = fetch
+
+    def load(self):
+        return RefreshableCredentials.create_from_metadata(
+            metadata=self._fetch(), refresh_using=self._fetch, method=self.METHOD
+        )
+
+
 def get_aws_session():
-    # PRODUCTION: On EC2, use STS to assume the sandbox role
-    if os.getenv("ENV") == "production":
-        return get_sandbox_session()
-    
-    # DEV/LOCAL: Use DynamoDB-stored credentials
-    return get_aws_session_from_dynamodb_user()
-
-def get_sandbox_session():
+    """
+    Process-wide boto3 session whose credentials refresh themselves.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # PRODUCTION: On EC2, use STS to assume the sandbox role
+            # DEV/LOCAL: Use DynamoDB-stored credentials
+            fetch = fetch_sandbox_credentials if os.getenv("ENV") == "production" else fetch_dynamodb_user_credentials
+            botocore_session = botocore.session.get_session()
+            # Ahead of the environment, so the fetched credentials win over any AWS_* variables
+            botocore_session.get_component("credential_provider").insert_before(
+                "env", AimaCredentialProvider(fetch)
+            )
+            botocore_session.set_config_variable("region", AWS_REGION)
+            _session = boto3.Session(botocore_session=botocore_session)
+        return _session
+
+
+def get_default_chain_session():
+    """
+    Process-wide boto3 session on botocore's default credential chain
+    (environment, shared config, instance role), as plain boto3.client() uses.
+    """
+    global _default_chain_session
+    with _session_lock:
+        if _default_chain_session is None:
+            _default_chain_session = boto3.Session(region_name=AWS_REGION)
+        return _default_chain_session
+
+
+def get_client(service_name: str, default_chain: bool = False, **kwargs):
+    """
+    Shared, thread-safe client for service_name built from get_aws_session(), or
+    from get_default_chain_session() with default_chain=True (Bedrock, Transcribe
+    and SQS, which have always used the default chain rather than the sandbox
+    credentials). Clients keep their connection pool (and TLS sessions) alive
+    between requests.
+    """
+    key = (service_name, default_chain, tuple(sorted(
+        (k, repr(sorted(v._user_provided_options.items())) if isinstance(v, Config) else repr(v))
+        for k, v in kwargs.items()
+    )))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            config = Config(
+                max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                retries={"mode": "standard", "max_attempts": 5},
+            )
+            if "config" in kwargs:
+                config = config.merge(kwargs.pop("config"))
+            # Session.client isn't thread-safe, hence the lock around construction
+            session = get_default_chain_session() if default_chain else get_aws_session()
+            client = instrument_client(limit_client(session.client(service_name, config=config, **kwargs)))
+            _clients[key] = client
+        return client
+
+
+class LazyClient:
+    """
+    Module-level stand-in for a boto3 client. The real client (and the credential
+    fetch behind it) is only created on first attribute access, so importing a
+    service module costs no AWS round trips.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+def lazy_client(service_name: str, default_chain: bool = False, **kwargs) -> LazyClient:
+    return LazyClient(lambda: get_client(service_name, default_chain, **kwargs))
+
+
+def _expiry(seconds: int) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+def fetch_sandbox_credentials() -> dict:
     sts = boto3.client("sts")
     response = sts.assume_role(
         RoleArn="arn:aws:iam::610495549807:role/CrossAccountSandboxAccess",
-        RoleSessionName="sandbox-access-session"
+        RoleSessionName="sandbox-access-session",
+        DurationSeconds=AWS_ASSUME_ROLE_SECONDS,
     )
+    logger.debug("Assumed sandbox role")
 
     creds = response["Credentials"]
-    return boto3.Session(
-        aws_access_key_id=creds["AccessKeyId"],
-        aws_secret_access_key=creds["SecretAccessKey"],
-        aws_session_token=creds["SessionToken"],
-        region_name="us-east-1"
-    )
+    return {
+        "access_key": creds["AccessKeyId"],
+        "secret_key": creds["SecretAccessKey"],
+        "token": creds["SessionToken"],
+        "expiry_time": creds["Expiration"].isoformat(),
+    }
 
-def get_aws_session_from_dynamodb_user():
+
+def fetch_dynamodb_user_credentials() -> dict:
     """
-    Fetch permanent AWS credentials for SyncScribe from DynamoDB and return a boto3 session.
+    Fetch permanent AWS credentials for SyncScribe from DynamoDB.
     """
     dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
     table = dynamodb.Table("aima-aws-credentials")
@@ -48,8 +178,9 @@ def get_aws_session_from_dynamodb_user():
     if not access_key or not secret_key:
         raise Exception("Missing access_key or secret_key in DynamoDB")
 
-    return boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name="us-east-1"
-    )
+    return {
+        "access_key": access_key,
+        "secret_key": secret_key,
+        "token": None,
+        "expiry_time": _expiry(AWS_CREDENTIALS_TTL),
+    }
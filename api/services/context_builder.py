@@ -0,0 +1,179 @@
+import logging
+import os
+import math
+from typing import List, Union
+from langchain.docstore.document import Document
+from api.services.tokens import count_tokens, split_by_tokens
+from api.services.lexical import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Prompt context (summaries + transcript chunks) is packed under this many tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Most of the budget summaries may take while chunks still need room
+CONTEXT_SUMMARY_SHARE = float(os.getenv("CONTEXT_SUMMARY_SHARE", "0.4"))
+# Chunks retrieved per question; the budget decides how many reach the prompt
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "12"))
+
+# Overlapping chunks (the splitters repeat up to 200 chars) are stitched together
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 300
+# Beyond this a passage stops growing and later chunks just lose the repeated text
+MAX_PASSAGE_CHARS = 2500
+# Stands in for a file without a summary, and is budgeted like one
+NO_SUMMARY = "(No summary available)"
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can did do does for from had has have how i if in is it its "
+    "me my of on or our so that the their them then there these they this to was we were what "
+    "when where which who why will with would you your about any all into just more not also".split()
+)
+
+
+def _overlap(a: str, b: str) -> int:
+    """
+    Length of the longest suffix of a that is a prefix of b (0 below MIN_OVERLAP_CHARS).
+    """
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = a.find(probe, max(0, len(a) - MAX_OVERLAP_CHARS))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def dedupe_chunks(docs: List[Document]) -> tuple:
+    """
+    Drop repeated and contained chunks, and merge chunks from the same file whose
+    ends overlap into one passage (up to MAX_PASSAGE_CHARS; past that the repeated
+    text is cut from the later chunk). Keeps the order of each passage's best chunk.
+    Returns (documents, number of chunks removed or merged away).
+    """
+    passages = []
+    for doc in docs:
+        text = doc.page_content.strip()
+        file_id = doc.metadata.get("file_id")
+        for passage in passages:
+            if text in passage["text"]:
+                break
+            if passage["file_id"] != file_id:
+                continue
+            if passage["text"] in text:
+                passage["text"] = text
+                break
+            n = _overlap(passage["text"], text)
+            if n and len(passage["text"]) + len(text) - n <= MAX_PASSAGE_CHARS:
+                passage["text"] += text[n:]
+                break
+            m = _overlap(text, passage["text"])
+            if m and len(passage["text"]) + len(text) - m <= MAX_PASSAGE_CHARS:
+                passage["text"] = text + passage["text"][m:]
+                break
+            if n:
+                text = text[n:].strip()
+            elif m:
+                text = text[:-m].strip()
+        else:
+            passages.append({"text": text, "file_id": file_id, "metadata": doc.metadata})
+    deduped = [Document(page_content=p["text"], metadata=p["metadata"]) for p in passages]
+    return deduped, len(docs) - len(deduped)
+
+
+def _query_terms(question: str) -> set:
+    return {term for term in tokenize(question) if term not in STOPWORDS}
+
+
+def rerank(question: str, docs: List[Document]) -> List[Document]:
+    """
+    Lightweight local rerank: blend each chunk's retrieval rank with how much of
+    the question (IDF-weighted over the candidates) it covers. No model calls.
+    """
+    terms = _query_terms(question)
+    if not terms or len(docs) < 2:
+        return list(docs)
+
+    doc_terms = [set(tokenize(doc.page_content)) for doc in docs]
+    idf = {term: math.log(1 + len(docs) / (1 + sum(term in dt for dt in doc_terms))) for term in terms}
+    total = sum(idf.values())
+
+    def score(i):
+        coverage = sum(idf[term] for term in terms if term in doc_terms[i]) / total
+        return 0.5 * (1 - i / len(docs)) + 0.5 * coverage
+
+    return [docs[i] for i in sorted(range(len(docs)), key=lambda i: -score(i))]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 2:
+        return ""  # no room for any text besides the marker
+    return split_by_tokens(text, max_tokens - 2)[0].rstrip() + "\n[...]"  # marker is ~2 tokens
+
+
+def _pack_summaries(question: str, summaries: dict, docs: List[Document], budget: int) -> tuple:
+    """
+    Fit per-file summaries into budget. Files with retrieved chunks come first,
+    then by overlap with the question. The budget is shared out evenly, with
+    room that short summaries leave over going to the longer ones.
+    """
+    chunk_rank = {}
+    for i, doc in enumerate(docs):
+        chunk_rank.setdefault(doc.metadata.get("file_id"), i)
+    terms = _query_terms(question)
+    texts = {name: summaries[name] or NO_SUMMARY for name in summaries}
+    order = sorted(summaries, key=lambda name: (
+        chunk_rank.get(name, len(docs)),
+        -len(terms & set(tokenize(summaries[name] or ""))),
+    ))
+
+    sizes = {name: count_tokens(texts[name]) for name in order}
+    allowed, remaining = {}, budget
+    for position, name in enumerate(sorted(order, key=sizes.get)):
+        allowed[name] = min(sizes[name], remaining // (len(order) - position))
+        remaining -= allowed[name]
+
+    sections = []
+    for name in order:
+        if allowed[name] >= 50 or allowed[name] == sizes[name]:
+            sections.append((name, _truncate(texts[name], allowed[name])))
+    return sections, sum(count_tokens(text) for _, text in sections)
+
+
+def build_context(question: str, summary: Union[str, dict], docs: List[Document],
+                  budget: int = CONTEXT_TOKEN_BUDGET) -> tuple:
+    """
+    Return (summary text, context text) for the answer prompt: retrieved chunks
+    deduplicated and reranked, and both chunks and summaries packed under budget
+    tokens. summary is one file's summary or {filename: summary} for a KB.
+    """
+    docs, merged = dedupe_chunks(docs)
+    docs = rerank(question, docs)
+
+    summaries = summary if isinstance(summary, dict) else {"": summary or ""}
+    summary_need = sum(count_tokens(text or "") for text in summaries.values())
+    chunk_need = sum(count_tokens(doc.page_content) for doc in docs)
+    # Summaries give way to chunks beyond their share; either side's leftovers go to the other
+    summary_budget = max(min(summary_need, budget - chunk_need), int(budget * CONTEXT_SUMMARY_SHARE))
+    sections, summary_tokens = _pack_summaries(question, summaries, docs, min(summary_budget, budget))
+
+    chunks, chunk_tokens = [], 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if summary_tokens + chunk_tokens + tokens > budget:
+            continue
+        chunks.append(doc.page_content)
+        chunk_tokens += tokens
+
+    if isinstance(summary, dict):
+        summary_text = "".join(f"\n\n--- Summary for {name} ---\n{text}" for name, text in sections)
+    else:
+        summary_text = sections[0][1] if sections else ""
+
+    logger.info("Context: %d/%d chunks (%d merged or duplicate), %d/%d summaries; %d chunk + %d summary tokens "
+                "of %d (needed %d + %d)", len(chunks), len(docs), merged, len(sections), len(summaries),
+                chunk_tokens, summary_tokens, budget, chunk_need, summary_need)
+    return summary_text, "\n\n".join(chunks)
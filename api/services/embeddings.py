@@ -0,0 +1,146 @@
+import logging
+import os
+import json
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import numpy as np
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from api.services.tokens import count_tokens
+from api.services.telemetry import span
+from api.services.config import get_client
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "8"))
+EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "10"))
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "aima-embedding-cache.sqlite3")
+)
+
+
+def embedding_cache_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by sha256(model_id, chunk_text). SQLite in
+    WAL mode, so every worker process on the host shares it.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model_id TEXT, vector BLOB)"
+            )
+            self._conn.commit()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model_id: str, items: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model_id, vector) VALUES (?, ?, ?)",
+                [(key, model_id, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+
+class CachedBedrockEmbeddings(Embeddings):
+    """
+    Drop-in replacement for langchain's BedrockEmbeddings. Titan embeds one text
+    per request, so cache misses are fanned out over a bounded thread pool; the
+    client runs botocore's adaptive retry mode, which backs off and rate-limits
+    itself when Bedrock answers with ThrottlingException.
+    """
+
+    def __init__(self, model_id: str = EMBEDDING_MODEL_ID, region_name: str = "us-east-1",
+                 max_workers: int = EMBEDDING_MAX_WORKERS, cache: EmbeddingCache = None, client=None):
+        self.model_id = model_id
+        self.max_workers = max_workers
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.client = client or get_client(
+            "bedrock-runtime",
+            default_chain=True,
+            region_name=region_name,
+            config=Config(
+                retries={"mode": "adaptive", "max_attempts": EMBEDDING_MAX_ATTEMPTS},
+                max_pool_connections=max_workers,
+            ),
+        )
+        self._stats_lock = threading.Lock()
+        self._stats = {"cache_hits": 0, "cache_misses": 0, "api_calls": 0, "retries": 0}
+
+    def _invoke(self, text: str) -> list:
+        response = self.client.invoke_model(
+            body=json.dumps({"inputText": text}),
+            modelId=self.model_id,
+            contentType="application/json",
+            accept="application/json",
+        )
+        with self._stats_lock:
+            self._stats["api_calls"] += 1
+            self._stats["retries"] += response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        return json.loads(response["body"].read())["embedding"]
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [embedding_cache_key(self.model_id, text) for text in texts]
+        vectors = self.cache.get_many(list(set(keys)))
+
+        # Each distinct uncached text is embedded exactly once, however often it repeats
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        with self._stats_lock:
+            self._stats["cache_hits"] += len(texts) - len(missing)
+            self._stats["cache_misses"] += len(missing)
+
+        if missing:
+            logger.debug("Embedding %d new chunks (%d cached) with %s", len(missing), len(texts) - len(missing), self.model_id)
+            tokens = sum(count_tokens(text) for text in missing.values())
+            with span("embed", texts=len(missing), cached=len(texts) - len(missing), tokens=tokens):
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                    fresh = dict(zip(missing, pool.map(self._invoke, missing.values())))
+            self.cache.put_many(self.model_id, fresh)
+            vectors.update(fresh)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedBedrockEmbeddings:
+    """
+    Process-wide embeddings instance (one thread pool config, one cache connection).
+    """
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = CachedBedrockEmbeddings()
+        return _embeddings
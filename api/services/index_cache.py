@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Memory budget for loaded FAISS stores held by this process
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# How long an S3 ETag lookup is trusted before we HEAD the object again
+INDEX_CACHE_ETAG_TTL = float(os.getenv("INDEX_CACHE_ETAG_TTL", "60"))
+
+
+def estimate_store_bytes(store, include_vectors: bool = True) -> int:
+    """
+    Rough in-memory footprint of a langchain FAISS store (vectors, id map and any
+    in-memory chunk text). Pass include_vectors=False for memory-mapped indexes,
+    whose vectors live in the shared page cache rather than this process.
+    """
+    index = store.index
+    size = index.ntotal * index.d * 4 if include_vectors else 0
+    size += len(store.index_to_docstore_id) * 128
+    for doc in getattr(store.docstore, "_dict", {}).values():
+        size += len(doc.page_content.encode("utf-8")) + 256
+    return size
+
+
+class IndexCache:
+    """
+    Process-wide LRU cache of loaded FAISS stores.
+
+    Entries are keyed by the caller (bucket, key prefix, ETag, ...) and tagged with
+    the (bucket, key_prefix) pairs they were built from, so an overwrite of one
+    index evicts every per-file and merged entry that depends on it.
+    """
+
+    def __init__(self, max_bytes: int = INDEX_CACHE_MAX_BYTES, etag_ttl: float = INDEX_CACHE_ETAG_TTL):
+        self.max_bytes = max_bytes
+        self.etag_ttl = etag_ttl
+        self._entries = OrderedDict()  # key -> (value, size, tags)
+        self._etags = {}               # (bucket, key) -> (etag, fetched_at)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+                       "etag_lookups": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, size: int, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                logger.warning("Not caching %s: %d bytes exceeds budget of %d", key, size, self.max_bytes)
+                return value
+            self._entries[key] = (value, size, frozenset(tags))
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+            return value
+
+    def get_etag(self, s3, bucket: str, key: str, max_age: float = None) -> str:
+        """
+        Return the ETag of s3://bucket/key, reusing a lookup younger than max_age
+        seconds (default etag_ttl) when possible.
+        """
+        now = time.monotonic()
+        max_age = self.etag_ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._etags.get((bucket, key))
+            if cached and now - cached[1] < max_age:
+                return cached[0]
+
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+        with self._lock:
+            self._stats["etag_lookups"] += 1
+            self._etags[(bucket, key)] = (etag, now)
+        return etag
+
+    def invalidate(self, bucket: str, key_prefix: str):
+        """
+        Drop every entry built from the index at key_prefix (called after an overwrite).
+        """
+        tag = (bucket, key_prefix)
+        with self._lock:
+            for key in [k for k, (_, _, tags) in self._entries.items() if tag in tags]:
+                self._remove(key)
+                self._stats["invalidations"] += 1
+            for etag_key in [k for k in self._etags if k[0] == bucket and k[1].startswith(f"{key_prefix}.")]:
+                del self._etags[etag_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._etags.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+index_cache = IndexCache()
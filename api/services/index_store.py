@@ -0,0 +1,273 @@
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import faiss
+from botocore.exceptions import ClientError
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from api.services.index_cache import index_cache
+from api.services.chunk_store import ChunkStore, ChunkDocstore, write_chunk_store
+from api.services.lexical import LexicalIndex
+
+logger = logging.getLogger(__name__)
+
+# Local on-disk copy of S3 index artifacts, shared by every worker process on the host
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", os.path.join(tempfile.gettempdir(), "aima-index-store"))
+INDEX_STORE_MAX_BYTES = int(os.getenv("INDEX_STORE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+# Memory-map .faiss files so workers share the page cache instead of private copies
+INDEX_STORE_MMAP = os.getenv("INDEX_STORE_MMAP", "1") == "1"
+# Fall back to unpickling legacy .index.pkl docstores until migrate_docstores has run
+INDEX_ALLOW_PICKLE = os.getenv("INDEX_ALLOW_PICKLE", "1") == "1"
+
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes_downloaded": 0}
+_lock = threading.Lock()
+
+
+def local_path(key: str, etag: str) -> str:
+    """
+    Content-addressed location: the S3 ETag names the file, so identical bytes
+    stored under different keys share one local copy.
+    """
+    ext = os.path.splitext(key)[1]
+    return os.path.join(INDEX_STORE_DIR, etag[:2], f"{etag}{ext}")
+
+
+def fetch(s3, bucket: str, key: str, etag: str) -> str:
+    """
+    Return a local path holding s3://bucket/key at version etag, downloading it on a miss.
+    """
+    path = local_path(key, etag)
+    if os.path.exists(path):
+        os.utime(path)  # bump for LRU eviction
+        with _lock:
+            _stats["hits"] += 1
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    os.close(fd)
+    try:
+        # IfMatch makes S3 refuse the download if the object changed since the ETag lookup
+        obj = s3.get_object(Bucket=bucket, Key=key, IfMatch=f'"{etag}"')
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(obj["Body"], f, length=1024 * 1024)
+        os.replace(tmp_path, path)  # atomic, so concurrent workers never see partial files
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.debug("Cached s3://%s/%s at %s", bucket, key, path)
+    with _lock:
+        _stats["misses"] += 1
+        _stats["bytes_downloaded"] += os.path.getsize(path)
+    evict()
+    return path
+
+
+def evict(max_bytes: int = None):
+    """
+    Delete least recently used files until the store fits in max_bytes.
+    Files still mapped by another process stay readable until it closes them.
+    """
+    max_bytes = INDEX_STORE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for root, _, files in os.walk(INDEX_STORE_DIR):
+        for name in files:
+            if name.endswith(".part"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        with _lock:
+            _stats["evictions"] += 1
+
+
+def _etag_or_none(s3, bucket: str, key: str, max_age: float = None):
+    try:
+        return index_cache.get_etag(s3, bucket, key, max_age=max_age)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+def load_faiss_store(s3, bucket: str, key_prefix: str, embeddings, etag: str = None, mmap: bool = INDEX_STORE_MMAP) -> FAISS:
+    """
+    Load {key_prefix}.index.faiss and its chunk store through the local store.
+    With mmap the returned index is read-only; use private_store_copy() before
+    mutating it. Indexes not yet migrated off .index.pkl are still readable
+    while INDEX_ALLOW_PICKLE is on.
+    """
+    faiss_key = f"{key_prefix}.index.faiss"
+    chunks_key = f"{key_prefix}.index.chunks"
+    pkl_key = f"{key_prefix}.index.pkl"
+
+    for attempt in range(2):
+        try:
+            faiss_etag = etag or index_cache.get_etag(s3, bucket, faiss_key)
+            faiss_path = fetch(s3, bucket, faiss_key, faiss_etag)
+            chunks_etag = _etag_or_none(s3, bucket, chunks_key)
+            if chunks_etag:
+                docstore_path = fetch(s3, bucket, chunks_key, chunks_etag)
+            elif INDEX_ALLOW_PICKLE:
+                logger.warning("s3://%s/%s has no chunk store; loading legacy .index.pkl", bucket, key_prefix)
+                docstore_path = fetch(s3, bucket, pkl_key, index_cache.get_etag(s3, bucket, pkl_key))
+            else:
+                raise FileNotFoundError(f"s3://{bucket}/{chunks_key} missing; run manage.py migrate_docstores")
+        except ClientError as e:
+            # Overwritten since our cached ETag lookup: forget it and look again once
+            if attempt or e.response["Error"]["Code"] not in ("412", "PreconditionFailed"):
+                raise
+            index_cache.invalidate(bucket, key_prefix)
+            etag = None
+            continue
+
+        index = faiss.read_index(faiss_path, MMAP_FLAGS if mmap else 0)
+        if chunks_etag:
+            docstore = ChunkDocstore(ChunkStore(docstore_path))
+            index_to_docstore_id = docstore.index_to_docstore_id()
+        else:
+            with open(docstore_path, "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+
+        if len(index_to_docstore_id) == index.ntotal:
+            return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+        # Caught between the chunk store and index uploads of a writer; look again once
+        if attempt:
+            raise ValueError(f"s3://{bucket}/{key_prefix}: index and chunk store row counts differ")
+        index_cache.invalidate(bucket, key_prefix)
+        etag = None
+
+
+def load_lexical_index(s3, store: FAISS, bucket: str, key_prefix: str, etag: str) -> LexicalIndex:
+    """
+    The BM25 index stored next to the FAISS index at key_prefix (whose ETag is
+    etag), cached with it. Indexes written before BM25 existed get one built
+    from the store's chunks on first use.
+    """
+    cache_key = ("bm25", bucket, key_prefix, etag)
+    lexical = index_cache.get(cache_key)
+    if lexical is not None:
+        return lexical
+
+    bm25_etag = _etag_or_none(s3, bucket, f"{key_prefix}.bm25")
+    if bm25_etag:
+        lexical = LexicalIndex.load(fetch(s3, bucket, f"{key_prefix}.bm25", bm25_etag))
+    else:
+        logger.debug("No BM25 index at s3://%s/%s.bm25; building it in memory", bucket, key_prefix)
+        lexical = LexicalIndex.from_store(store)
+    return index_cache.put(cache_key, lexical, lexical.nbytes, tags=[(bucket, key_prefix)])
+
+
+def find_faiss_store(s3, bucket: str, key_prefix: str, embeddings, mmap: bool = INDEX_STORE_MMAP):
+    """
+    load_faiss_store() at the index's current ETag, or None if nothing is stored at key_prefix.
+    """
+    etag = _etag_or_none(s3, bucket, f"{key_prefix}.index.faiss", max_age=0)
+    if etag is None:
+        return None
+    return load_faiss_store(s3, bucket, key_prefix, embeddings, etag=etag, mmap=mmap)
+
+
+def upload_faiss_store(s3, store: FAISS, bucket: str, key_prefix: str, lexical: bool = False) -> dict:
+    """
+    Write store as {key_prefix}.index.faiss + .index.chunks and evict cached copies.
+    With lexical, also write its BM25 index as {key_prefix}.bm25. The .index.faiss
+    object goes last, so its ETag versions the other two.
+    Returns {"index": {...}, "chunks": {...}} with each object's key, ETag and size.
+    """
+    ids = [store.index_to_docstore_id[row] for row in range(store.index.ntotal)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        faiss_path = os.path.join(tmpdir, "index.faiss")
+        chunks_path = os.path.join(tmpdir, "index.chunks")
+        faiss.write_index(store.index, faiss_path)
+        write_chunk_store(chunks_path, ids, [store.docstore.search(doc_id) for doc_id in ids])
+
+        s3.upload_file(chunks_path, bucket, f"{key_prefix}.index.chunks")
+        if lexical:
+            bm25_path = os.path.join(tmpdir, "index.bm25")
+            LexicalIndex.from_store(store).save(bm25_path)
+            s3.upload_file(bm25_path, bucket, f"{key_prefix}.bm25")
+        s3.upload_file(faiss_path, bucket, f"{key_prefix}.index.faiss")
+        sizes = {"index": os.path.getsize(faiss_path), "chunks": os.path.getsize(chunks_path)}
+    index_cache.invalidate(bucket, key_prefix)
+
+    artifacts = {}
+    for name, suffix in (("index", ".index.faiss"), ("chunks", ".index.chunks")):
+        key = f"{key_prefix}{suffix}"
+        # upload_file doesn't return the ETag (and multipart ETags aren't MD5s)
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+        artifacts[name] = {"key": key, "etag": etag, "size": sizes[name]}
+    return artifacts
+
+
+def copy_faiss_store(s3, source_bucket: str, source_prefix: str, bucket: str, key_prefix: str) -> dict:
+    """
+    Server-side copy of a stored index (chunk store first, like upload_faiss_store).
+    Returns the same artifacts dict as upload_faiss_store.
+    """
+    try:
+        s3.copy({"Bucket": source_bucket, "Key": f"{source_prefix}.bm25"}, bucket, f"{key_prefix}.bm25")
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+            raise
+        # Don't leave a BM25 index of whatever was stored here before
+        s3.delete_object(Bucket=bucket, Key=f"{key_prefix}.bm25")
+    for suffix in (".index.chunks", ".index.faiss"):
+        s3.copy({"Bucket": source_bucket, "Key": f"{source_prefix}{suffix}"}, bucket, f"{key_prefix}{suffix}")
+    index_cache.invalidate(bucket, key_prefix)
+    return stored_artifacts(s3, bucket, key_prefix)
+
+
+def stored_artifacts(s3, bucket: str, key_prefix: str) -> dict:
+    """
+    The artifacts dict upload_faiss_store returns, for an index already in S3.
+    """
+    artifacts = {}
+    for name, suffix in (("index", ".index.faiss"), ("chunks", ".index.chunks")):
+        key = f"{key_prefix}{suffix}"
+        head = s3.head_object(Bucket=bucket, Key=key)
+        artifacts[name] = {"key": key, "etag": head["ETag"].strip('"'), "size": head["ContentLength"]}
+    return artifacts
+
+
+def private_index_copy(index):
+    """
+    Owned in-memory copy of a FAISS index. clone_index() of a memory-mapped index
+    still points at the mapping, and mutating it aborts the process.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def private_store_copy(store: FAISS) -> FAISS:
+    """
+    Mutable copy of a (possibly mmapped, chunk-store backed) FAISS store.
+    """
+    ids = [store.index_to_docstore_id[row] for row in range(store.index.ntotal)]
+    docstore = InMemoryDocstore({doc_id: store.docstore.search(doc_id) for doc_id in ids})
+    return FAISS(store.embedding_function, private_index_copy(store.index), docstore, dict(enumerate(ids)))
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "dir": INDEX_STORE_DIR, "max_bytes": INDEX_STORE_MAX_BYTES, "mmap": INDEX_STORE_MMAP}
@@ -0,0 +1,196 @@
+import logging
+import os
+import time
+from botocore.exceptions import ClientError
+from api.services.config import get_client
+from api.services.uploader import upload_file_to_s3, upload_docx_transcript_and_return_text
+from api.services.transcriber import transcription_manager, fetch_transcript_text
+from api.services.jobs import WAIT, DONE, SkipTo, resume_job, watch_job, unwatch_job, stage_s3_object, upload_key
+from api.services.summarizer import summarize_with_claude
+from api.services.rag_engine import chunk_transcript, embed_transcript_and_upload, VECTOR_S3_BUCKET
+from api.services.docx_parser import convert_docx_to_clean_text
+from api.services.kb_builder import add_file_to_kb
+from api.services.kb_config import KB_CONFIG
+from api.services.index_store import copy_faiss_store
+from api.services.ingest_registry import ingest_registry, hash_file, hash_s3_object
+from api.services.telemetry import record_span
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_OUTPUT_BUCKET = "aima-meeting-transcripts"
+
+# Ingest pipeline stages. Each takes the job and its context dict, and stores
+# whatever later stages need back into the context. A stage may return WAIT to
+# park the job until an external service calls back.
+
+
+def _transcription_callback(job_id):
+    def on_done(job_name, status, reason):
+        unwatch_job(job_id)
+        resume_job(job_id, transcription_status=status, transcription_error=reason)
+    return on_done
+
+
+def watch_transcription(job):
+    """
+    Re-register a parked job's Transcribe job with this process's poller.
+    """
+    job_name = job.context.get("transcription_job")
+    if job_name and "transcription_status" not in job.context:
+        watch_job(job.id)
+        transcription_manager().track(job_name, _transcription_callback(job.id))
+
+
+def transcript_location(job):
+    return TRANSCRIPT_OUTPUT_BUCKET, f"{job.kb_id or 'single-uploads'}/{job.file_key}.txt"
+
+
+def reuse_known_content(job, context):
+    """
+    Finish the job from a previous ingest of the same bytes, if there is one:
+    copy its artifacts into place instead of calling Transcribe, Claude and Titan,
+    leaving only the index stage to run.
+    """
+    if not context.get("content_hash"):
+        # Always hashed server-side: a client-supplied hash could name any file
+        if job.source_path and os.path.exists(job.source_path):
+            context["content_hash"] = hash_file(job.source_path)
+        else:
+            context["content_hash"] = hash_s3_object(context["s3_uri"])
+        if not context["content_hash"]:
+            logger.info("[JOB %s] Too large to hash server-side; not deduplicated", job.id)
+            return
+
+    entry = ingest_registry().lookup(context["content_hash"], job.kb_id, job.file_key)
+    if entry is None:
+        # New content; whatever this slot held is about to be overwritten
+        ingest_registry().forget(job.kb_id, job.file_key)
+        return
+
+    s3 = get_client("s3")
+    try:
+        transcript_text = s3.get_object(
+            Bucket=entry["transcript_bucket"], Key=entry["transcript_key"]
+        )["Body"].read().decode("utf-8")
+        if not context.get("s3_uri"):
+            bucket, key = entry["source_uri"][len("s3://"):].split("/", 1)
+            target_key = upload_key(job.kb_id, job.filename)
+            if target_key != key:
+                s3.copy({"Bucket": bucket, "Key": key}, bucket, target_key)
+            context["s3_uri"] = f"s3://{bucket}/{target_key}"
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        logger.warning("Artifacts of earlier ingest %s/%s are gone; ingesting afresh", entry["kb_id"], entry["file_key"])
+        ingest_registry().forget(entry["kb_id"], entry["file_key"])
+        return
+
+    source = f"{entry['kb_id'] or 'single-uploads'}/{entry['file_key']}"
+    logger.info("[JOB %s] Content already ingested as %s; reusing its artifacts", job.id, source)
+    context["transcript_text"] = transcript_text
+    context["summary"] = entry["summary"]
+    context["reused_from"] = source
+
+    if entry["kb_id"] == (job.kb_id or "") and entry["file_key"] == job.file_key:
+        return DONE  # identical re-upload; everything is already in place
+
+    bucket, key = transcript_location(job)
+    s3.put_object(Bucket=bucket, Key=key, Body=transcript_text.encode("utf-8"), ContentType="text/plain")
+    if bool(entry["kb_id"]) == bool(job.kb_id):
+        # Same kind of index (KB vs single upload), so it can be copied as is
+        context["source_index"] = [entry["index_bucket"], entry["index_prefix"]]
+    return SkipTo("index")
+
+
+def upload_original(job, context):
+    if context.get("s3_uri"):
+        # Uploaded straight to S3 by the client; only local parsers need a copy
+        if job.file_type != "video" and not (job.source_path and os.path.exists(job.source_path)):
+            job.source_path = stage_s3_object(context["s3_uri"], job.filename)
+            job.save(update_fields=["source_path"])
+        return
+
+    with open(job.source_path, "rb") as f:
+        s3_uri = upload_file_to_s3(f, upload_key(job.kb_id, job.filename), job.content_type)
+    if not s3_uri:
+        raise RuntimeError("Failed to upload to S3")
+    context["s3_uri"] = s3_uri
+
+
+def extract_transcript(job, context):
+    if job.file_type == "video":
+        job_name = context.get("transcription_job")
+        if job_name is None:
+            # Hand the job to the shared poller and free this worker until it finishes
+            watch_job(job.id)
+            context["transcription_job"] = transcription_manager().start_job(
+                context["s3_uri"],
+                output_bucket=TRANSCRIPT_OUTPUT_BUCKET,
+                callback=_transcription_callback(job.id),
+            )
+            context["transcription_started_at"] = time.time()
+            return WAIT
+        if context.get("transcription_started_at"):
+            record_span("transcribe.wait", time.time() - context.pop("transcription_started_at"),
+                        "ok" if context.get("transcription_status") == "COMPLETED" else "error", job_id=str(job.id))
+        if context.get("transcription_status") != "COMPLETED":
+            raise RuntimeError(f"Transcription job failed: {context.get('transcription_error')}")
+        transcript_text = fetch_transcript_text(TRANSCRIPT_OUTPUT_BUCKET, job_name)
+    elif job.file_type == "docx":
+        # python-docx reads the zip straight from the staged file
+        with open(job.source_path, "rb") as f:
+            if job.kb_id:
+                transcript_text = upload_docx_transcript_and_return_text(f, job.kb_id, job.file_key)
+            else:
+                transcript_text = convert_docx_to_clean_text(f)
+    elif job.file_type == "text":
+        with open(job.source_path, "rb") as f:
+            transcript_text = f.read().decode("utf-8")
+    else:
+        raise ValueError(f"Unsupported file type: {job.file_type}")
+
+    if not transcript_text:
+        raise RuntimeError("Transcript extraction failed.")
+
+    # Plain-text copy for every file type; later uploads of the same content reuse it
+    bucket, key = transcript_location(job)
+    get_client("s3").put_object(Bucket=bucket, Key=key, Body=transcript_text.encode("utf-8"), ContentType="text/plain")
+    context["transcript_text"] = transcript_text
+
+
+def summarize(job, context):
+    context["summary"] = summarize_with_claude(context["transcript_text"])
+
+
+def index(job, context):
+    source_index = context.get("source_index")  # set when reusing an earlier ingest
+    if job.kb_id:
+        add_file_to_kb(job.kb_id, job.file_key, context["transcript_text"], context["summary"], source_index)
+        conf = KB_CONFIG[job.kb_id]
+        index_location = (conf["buckets"]["embeddings"], f"{conf['prefix']}/{job.file_key}")
+    else:
+        index_location = (VECTOR_S3_BUCKET, f"single-uploads/{job.file_key}")
+        if source_index:
+            copy_faiss_store(get_client("s3"), *source_index, *index_location)
+        else:
+            docs = chunk_transcript(context["transcript_text"])
+            embed_transcript_and_upload(docs, key_prefix=index_location[1])
+
+    if context.get("content_hash"):
+        ingest_registry().record(
+            context["content_hash"], job.kb_id, job.file_key, job.file_type, context.get("s3_uri"),
+            transcript_location(job), context["summary"], index_location,
+        )
+
+
+PIPELINE = [
+    ("dedup", reuse_known_content),
+    ("upload", upload_original),
+    ("transcript", extract_transcript),
+    ("summarize", summarize),
+    ("index", index),
+]
+
+
+def job_result(context) -> dict:
+    return {"summary": context.get("summary", ""), "reused_from": context.get("reused_from")}
@@ -0,0 +1,124 @@
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from api.services.config import lazy_client
+
+# Content-addressed record of finished ingests, so re-uploading the same bytes
+# (into any KB) reuses the transcript, summary and index instead of paying for
+# Transcribe, Claude and Titan again.
+INGEST_REGISTRY_PATH = os.getenv(
+    "INGEST_REGISTRY_PATH", os.path.join(tempfile.gettempdir(), "aima-ingest-registry.sqlite3")
+)
+HASH_CHUNK_BYTES = 1024 * 1024
+# Hashing a direct upload server-side means downloading all of it again, so
+# objects larger than this skip dedup
+INGEST_HASH_MAX_BYTES = int(os.getenv("INGEST_HASH_MAX_BYTES", str(256 * 1024 * 1024)))
+
+s3 = lazy_client("s3")
+
+
+def hash_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_s3_object(s3_uri: str, max_bytes: int = INGEST_HASH_MAX_BYTES):
+    """
+    SHA-256 of an S3 object, streamed so large recordings never sit in memory.
+    This reads the whole object back from S3, so returns None without reading
+    it when it is over max_bytes.
+    """
+    bucket, key = s3_uri[len("s3://"):].split("/", 1)
+    response = s3.get_object(Bucket=bucket, Key=key)
+    if response["ContentLength"] > max_bytes:
+        response["Body"].close()
+        return None
+    sha = hashlib.sha256()
+    for chunk in response["Body"].iter_chunks(HASH_CHUNK_BYTES):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+class IngestRegistry:
+    """
+    SQLite (WAL) table of (content hash, kb_id, file_key) -> artifact locations.
+    kb_id is "" for single uploads. A (kb_id, file_key) slot holds at most one
+    hash: re-ingesting different content under the same name replaces it.
+    """
+
+    COLUMNS = ("content_hash", "kb_id", "file_key", "file_type", "source_uri", "transcript_bucket",
+               "transcript_key", "summary", "index_bucket", "index_prefix", "created_at")
+
+    def __init__(self, path: str = INGEST_REGISTRY_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS ingested (
+                    content_hash TEXT, kb_id TEXT, file_key TEXT, file_type TEXT, source_uri TEXT,
+                    transcript_bucket TEXT, transcript_key TEXT, summary TEXT,
+                    index_bucket TEXT, index_prefix TEXT, created_at REAL,
+                    PRIMARY KEY (kb_id, file_key)
+                );
+                CREATE INDEX IF NOT EXISTS ingested_by_hash ON ingested (content_hash);
+            """)
+            self._conn.commit()
+
+    def lookup(self, content_hash: str, kb_id: str = None, file_key: str = None):
+        """
+        Best known ingest of this content: the same (kb_id, file_key) slot first,
+        then anything in the same KB, then any KB (or any single upload) since
+        its index can be copied as is, then the newest.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM ingested WHERE content_hash = ?", (content_hash,)
+            ).fetchall()
+        entries = [dict(zip(self.COLUMNS, row)) for row in rows]
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: (
+            entry["kb_id"] == (kb_id or "") and entry["file_key"] == file_key,
+            entry["kb_id"] == (kb_id or ""),
+            bool(entry["kb_id"]) == bool(kb_id),
+            entry["created_at"],
+        ))
+
+    def record(self, content_hash: str, kb_id: str, file_key: str, file_type: str, source_uri: str,
+               transcript: tuple, summary: str, index: tuple):
+        """
+        transcript and index are (bucket, key) / (bucket, key prefix) of the stored artifacts.
+        """
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO ingested ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                (content_hash, kb_id or "", file_key, file_type, source_uri,
+                 transcript[0], transcript[1], summary, index[0], index[1], time.time()),
+            )
+            self._conn.commit()
+
+    def forget(self, kb_id: str, file_key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM ingested WHERE kb_id = ? AND file_key = ?", (kb_id or "", file_key))
+            self._conn.commit()
+
+
+_ingest_registry = None
+_ingest_registry_lock = threading.Lock()
+
+
+def ingest_registry() -> IngestRegistry:
+    global _ingest_registry
+    with _ingest_registry_lock:
+        if _ingest_registry is None:
+            _ingest_registry = IngestRegistry()
+        return _ingest_registry
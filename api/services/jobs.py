@@ -0,0 +1,346 @@
+import logging
+import os
+import re
+import time
+import shutil
+import uuid
+import tempfile
+import threading
+from datetime import timedelta
+from django.db import close_old_connections
+from django.utils import timezone
+from api.models import IngestJob
+from api.services.utils import get_file_type
+from api.services.telemetry import span, trace, current_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Background ingest workers. The IngestJob table is the queue, so any process
+# (web worker or `manage.py run_ingest_worker`) can pick up queued jobs.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# The process running a RUNNING job touches it every JOB_WATCH_HEARTBEAT seconds, however
+# long its stage takes; one untouched for this long belonged to a dead process and is requeued
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", str(30 * 60)))
+# The process watching a WAITING job touches it every JOB_WATCH_HEARTBEAT seconds;
+# a job left untouched for three heartbeats lost its watcher and one other process adopts it
+JOB_WATCH_HEARTBEAT = float(os.getenv("JOB_WATCH_HEARTBEAT", "60"))
+INGEST_STAGING_DIR = os.getenv("INGEST_STAGING_DIR", os.path.join(tempfile.gettempdir(), "aima-ingest"))
+
+# Returned by a stage that has handed work to an external service. The job is
+# parked as WAITING and resume_job() requeues it to re-run that stage.
+WAIT = "wait"
+# Returned by a stage that finished the job early (e.g. reused known content);
+# the remaining stages are recorded as skipped.
+DONE = "done"
+
+
+class SkipTo:
+    """
+    Returned by a stage that made the stages up to `stage` unnecessary (e.g. the
+    transcript and summary were reused but the file still needs indexing). Those
+    are recorded as skipped and the job carries on from `stage`.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+_watched = set()  # ids of the WAITING jobs this process watches
+_running = set()  # ids of the jobs this process's workers are running
+_watched_lock = threading.Lock()
+
+
+def stage_upload(uploaded_file, safe_filename: str) -> str:
+    """
+    Move an uploaded file into the staging dir so a worker can process it after
+    the request has returned. Files Django already spooled to disk are moved (a
+    rename when FILE_UPLOAD_TEMP_DIR is the staging dir); anything else is
+    streamed chunk by chunk.
+    """
+    os.makedirs(INGEST_STAGING_DIR, exist_ok=True)
+    path = os.path.join(INGEST_STAGING_DIR, f"{uuid.uuid4().hex}-{safe_filename}")
+    if hasattr(uploaded_file, "temporary_file_path"):
+        uploaded_file.file.flush()
+        # Django tolerates the spooled file vanishing before it cleans up
+        shutil.move(uploaded_file.temporary_file_path(), path)
+        return path
+    with open(path, "wb") as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return path
+
+
+def safe_upload_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9._-]", "-", name)
+
+
+def upload_key(kb_id: str, safe_filename: str) -> str:
+    """
+    Where an upload's original file lives in the uploads bucket.
+    """
+    return f"{kb_id or 'single-uploads'}/{safe_filename}"
+
+
+def submit_upload(uploaded_file, kb_id: str = None) -> IngestJob:
+    safe_filename = safe_upload_name(uploaded_file.name)
+    job = IngestJob.objects.create(
+        kb_id=kb_id or None,
+        filename=safe_filename,
+        file_key=safe_filename.rsplit(".", 1)[0],
+        file_type=get_file_type(uploaded_file.name),
+        content_type=uploaded_file.content_type or "",
+        source_path=stage_upload(uploaded_file, safe_filename),
+        # Set by HashingTemporaryFileUploadHandler; the dedup stage hashes the file otherwise
+        context={"content_hash": getattr(uploaded_file, "content_hash", None), "trace_id": current_trace_id()},
+    )
+    logger.info("[JOB %s] Queued %s (kb_id=%s)", job.id, safe_filename, kb_id)
+    ensure_workers()
+    _wakeup.set()
+    return job
+
+
+def submit_s3_upload(s3_uri: str, filename: str, content_type: str = "", kb_id: str = None) -> IngestJob:
+    """
+    Queue a job for a file the client already put in S3 (presigned upload).
+    """
+    safe_filename = safe_upload_name(filename)
+    job = IngestJob.objects.create(
+        kb_id=kb_id or None,
+        filename=safe_filename,
+        file_key=safe_filename.rsplit(".", 1)[0],
+        file_type=get_file_type(filename),
+        content_type=content_type or "",
+        context={"s3_uri": s3_uri, "trace_id": current_trace_id()},
+    )
+    logger.info("[JOB %s] Queued %s from %s (kb_id=%s)", job.id, safe_filename, s3_uri, kb_id)
+    ensure_workers()
+    _wakeup.set()
+    return job
+
+
+def stage_s3_object(s3_uri: str, safe_filename: str) -> str:
+    """
+    Download an uploaded object into the staging dir for stages that parse it locally.
+    """
+    from api.services.uploader import download_from_s3
+
+    os.makedirs(INGEST_STAGING_DIR, exist_ok=True)
+    path = os.path.join(INGEST_STAGING_DIR, f"{uuid.uuid4().hex}-{safe_filename}")
+    download_from_s3(s3_uri, path)
+    return path
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest QUEUED job to RUNNING. The conditional UPDATE means
+    two workers (threads or processes) can never claim the same job.
+    """
+    candidates = IngestJob.objects.filter(status=IngestJob.QUEUED).values_list("id", flat=True)[:5]
+    for job_id in candidates:
+        if IngestJob.objects.filter(pk=job_id, status=IngestJob.QUEUED).update(status=IngestJob.RUNNING):
+            return IngestJob.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs() -> int:
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_AFTER)
+    count = IngestJob.objects.filter(status=IngestJob.RUNNING, updated_at__lt=cutoff).update(
+        status=IngestJob.QUEUED, updated_at=timezone.now()
+    )
+    if count:
+        logger.warning("Requeued %d stale running jobs", count)
+    return count
+
+
+def _record_stage(job, name: str, **fields):
+    for entry in job.stages:
+        if entry["name"] == name:
+            entry.update(fields)
+            return
+    job.stages.append({"name": name, **fields})
+
+
+def run_job(job: IngestJob):
+    from api.services.ingest import PIPELINE, job_result
+
+    done = {entry["name"] for entry in job.stages if entry.get("status") in ("succeeded", "skipped")}
+    try:
+        for position, (name, stage) in enumerate(PIPELINE):
+            if name in done:  # resumed after a restart
+                continue
+            job.stage = name
+            _record_stage(job, name, status="running", started_at=timezone.now().isoformat())
+            job.save(update_fields=["stage", "stages", "updated_at"])
+
+            started = time.perf_counter()
+            with span(f"ingest.{name}", job_id=str(job.id), file_type=job.file_type):
+                outcome = stage(job, job.context)
+            duration_ms = round((time.perf_counter() - started) * 1000)
+
+            if outcome == WAIT:
+                _record_stage(job, name, status="waiting")
+                job.status = IngestJob.WAITING
+                job.save(update_fields=["status", "stages", "context", "updated_at"])
+                logger.info("[JOB %s] %s waiting on external service", job.id, name)
+                return
+
+            _record_stage(job, name, status="succeeded", duration_ms=duration_ms)
+            if outcome == DONE:
+                for skipped, _ in PIPELINE[position + 1:]:
+                    _record_stage(job, skipped, status="skipped")
+            elif isinstance(outcome, SkipTo):
+                for skipped, _ in PIPELINE[position + 1:]:
+                    if skipped == outcome.stage:
+                        break
+                    _record_stage(job, skipped, status="skipped")
+                    done.add(skipped)
+            job.save(update_fields=["stages", "context", "updated_at"])
+            logger.info("[JOB %s] %s finished in %d ms", job.id, name, duration_ms)
+            if outcome == DONE:
+                break
+
+        job.status = IngestJob.SUCCEEDED
+        job.stage = ""
+        job.result = job_result(job.context)
+        job.context = {}
+    except Exception as e:
+        logger.exception("[JOB %s] %s failed", job.id, job.stage)
+        _record_stage(job, job.stage, status="failed", error=str(e))
+        job.status = IngestJob.FAILED
+        job.error = f"{job.stage}: {e}"
+
+    job.save()
+    if job.source_path and os.path.exists(job.source_path):
+        os.remove(job.source_path)
+
+
+def resume_job(job_id, **context_updates):
+    """
+    Requeue a WAITING job, merging context_updates (e.g. the Transcribe outcome)
+    into its context. Retries briefly in case the callback beat the WAITING save.
+    """
+    for _ in range(20):
+        close_old_connections()
+        job = IngestJob.objects.get(pk=job_id)
+        if job.status == IngestJob.WAITING:
+            job.context.update(context_updates)
+            if IngestJob.objects.filter(pk=job_id, status=IngestJob.WAITING).update(
+                status=IngestJob.QUEUED, context=job.context, updated_at=timezone.now()
+            ):
+                logger.info("[JOB %s] Resumed", job_id)
+                _wakeup.set()
+                return True
+        elif job.status != IngestJob.RUNNING:
+            return False
+        time.sleep(0.5)
+    return False
+
+
+def _worker_loop():
+    while True:
+        close_old_connections()
+        try:
+            job = claim_next_job()
+        except Exception as e:
+            logger.warning("Could not claim job: %s", e)
+            job = None
+
+        if job is None:
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        with _watched_lock:
+            _running.add(job.pk)
+        try:
+            # Spans of the job carry the trace id of the request that queued it
+            with trace(job.context.get("trace_id")):
+                run_job(job)
+        finally:
+            with _watched_lock:
+                _running.discard(job.pk)
+
+
+def watch_job(job_id):
+    """
+    Mark a WAITING job as watched by this process (its heartbeat keeps others off it).
+    """
+    with _watched_lock:
+        _watched.add(job_id)
+
+
+def unwatch_job(job_id):
+    with _watched_lock:
+        _watched.discard(job_id)
+
+
+def heartbeat_watched_jobs() -> int:
+    with _watched_lock:
+        job_ids = list(_watched)
+    if not job_ids:
+        return 0
+    return IngestJob.objects.filter(pk__in=job_ids, status=IngestJob.WAITING).update(updated_at=timezone.now())
+
+
+def heartbeat_running_jobs() -> int:
+    """
+    Touch the jobs this process is running, so a long stage (e.g. summarizing a
+    long meeting) never looks stale to requeue_stale_jobs().
+    """
+    with _watched_lock:
+        job_ids = list(_running)
+    if not job_ids:
+        return 0
+    return IngestJob.objects.filter(pk__in=job_ids, status=IngestJob.RUNNING).update(updated_at=timezone.now())
+
+
+def adopt_orphaned_jobs() -> int:
+    """
+    Watch the WAITING jobs whose process stopped heartbeating (e.g. it restarted).
+    The conditional update means exactly one process adopts each of them.
+    """
+    from api.services.ingest import watch_transcription
+
+    cutoff = timezone.now() - timedelta(seconds=3 * JOB_WATCH_HEARTBEAT)
+    adopted = 0
+    for job in IngestJob.objects.filter(status=IngestJob.WAITING, updated_at__lt=cutoff):
+        if IngestJob.objects.filter(pk=job.pk, status=IngestJob.WAITING, updated_at=job.updated_at).update(
+            updated_at=timezone.now()
+        ):
+            watch_transcription(job)
+            adopted += 1
+    if adopted:
+        logger.info("Adopted %d waiting jobs", adopted)
+    return adopted
+
+
+def _housekeeping_loop():
+    while True:
+        close_old_connections()
+        try:
+            heartbeat_watched_jobs()
+            heartbeat_running_jobs()
+            requeue_stale_jobs()
+            adopt_orphaned_jobs()
+        except Exception:
+            logger.exception("Job housekeeping failed")
+        time.sleep(JOB_WATCH_HEARTBEAT)
+
+
+def ensure_workers(count: int = None):
+    """
+    Start this process's worker threads once. JOB_WORKERS=0 leaves processing to
+    a separate `manage.py run_ingest_worker` process.
+    """
+    count = JOB_WORKERS if count is None else count
+    with _workers_lock:
+        if _workers or count <= 0:
+            return
+        # Heartbeats, stale RUNNING jobs and orphaned WAITING jobs, for the life of the process
+        threading.Thread(target=_housekeeping_loop, name="ingest-housekeeping", daemon=True).start()
+        for i in range(count):
+            thread = threading.Thread(target=_worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
@@ -1,24 +1,27 @@
-import boto3
-import os
-import json
-from typing import List
-from langchain.embeddings import BedrockEmbeddings
+import logging
 from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from api.services.config import get_aws_session 
+from api.services.config import lazy_client
+from api.services.kb_config import KB_CONFIG
+from api.services.chunking import split_into_chunks, chunk_ids
+from api.services.index_store import (
+    upload_faiss_store, load_faiss_store, find_faiss_store, private_store_copy, stored_artifacts,
+)
+from api.services.embeddings import get_embeddings
+from api.services.kb_index import append_file_to_kb_index, store_text_embeddings
+from api.services.answer_cache import get_answer_cache
+from api.services.summaries import record_summary
+from api.services.summary_index import record_summary_sections
+from api.services.kb_manifest import record_kb_file
+from api.services.telemetry import span
 
-s3 = get_aws_session().client("s3")
+logger = logging.getLogger(__name__)
 
-# Load KB config
-kb_config_path = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "kb_config.json")
-)
+s3 = lazy_client("s3")
 
-with open(kb_config_path) as f:
-    KB_CONFIG = json.load(f)
 
-def upload_text_to_s3(text: str, bucket: str, key: str):
-    s3.put_object(Bucket=bucket, Key=key, Body=text.encode("utf-8"))
+def upload_text_to_s3(text: str, bucket: str, key: str) -> str:
+    response = s3.put_object(Bucket=bucket, Key=key, Body=text.encode("utf-8"))
+    return response["ETag"].strip('"')
 
 def get_kb_paths(kb_id: str, filename: str):
     conf = KB_CONFIG[kb_id]
@@ -29,47 +32,111 @@ def get_kb_paths(kb_id: str, filename: str):
         "embedding_key": f"{prefix}/{filename}.index"
     }
 
-def build_and_store_embedding(text: str, kb_id: str, filename: str):
+def build_and_store_embedding(text: str, kb_id: str, filename: str) -> tuple:
+    """
+    Embed, index and upload one file. Returns (uploaded index artifacts, chunk count).
+    Re-ingesting a file diffs its chunks against the stored index by chunk id:
+    only new chunks are embedded and removed ones are deleted in place.
+    """
     conf = KB_CONFIG[kb_id]
-    embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1")
-    
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    docs = splitter.create_documents([text])
-
-    vectorstore = FAISS.from_documents(docs, embedding=embeddings)
-
-    # Save index locally
-    local_dir = f"/tmp/{filename}"
-    os.makedirs(local_dir, exist_ok=True)
-    vectorstore.save_local(local_dir)
-
-
-    # Upload to S3
-    embedding_bucket = conf["buckets"]["embeddings"]
-    embedding_key = f"{conf['prefix']}/{filename}.index"
-    for suffix in ["index.faiss", "index.pkl"]:
-        s3.upload_file(
-            f"{local_dir}/{suffix}",
-            embedding_bucket,
-            f"{embedding_key}.{suffix.split('.')[-1]}"
-        )
-
-
-
-def add_file_to_kb(kb_id: str, filename: str, transcript_text: str, summary_text: str):
+    embeddings = get_embeddings()
+    bucket, key_prefix = conf["buckets"]["embeddings"], f"{conf['prefix']}/{filename}"
+
+    with span("chunk", bytes=len(text.encode("utf-8"))) as attrs:
+        texts = split_into_chunks(text)
+        ids = chunk_ids(filename, texts)
+        attrs["chunks"] = len(texts)
+
+    existing = find_faiss_store(s3, bucket, key_prefix, embeddings)
+    removed = set()
+    if existing is None:
+        vectorstore, known = None, set()
+    else:
+        # The loaded store may be mmapped and shared with readers
+        vectorstore = private_store_copy(existing)
+        known = set(vectorstore.index_to_docstore_id.values())
+        removed = known - set(ids)
+        if removed:
+            vectorstore.delete(list(removed))
+
+    added = [(chunk_id, text) for chunk_id, text in zip(ids, texts) if chunk_id not in known]
+    logger.info("%s/%s: %d chunks, %d new, %d removed", kb_id, filename, len(texts), len(added), len(removed))
+    if added:
+        new_texts = [text for _, text in added]
+        new_embeddings = list(zip(new_texts, embeddings.embed_documents(new_texts)))
+        new_ids = [chunk_id for chunk_id, _ in added]
+        metadatas = [{"file_id": filename} for _ in added]
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(new_embeddings, embeddings, metadatas=metadatas, ids=new_ids)
+        else:
+            vectorstore.add_embeddings(new_embeddings, metadatas=metadatas, ids=new_ids)
+
+    # Upload index + chunk store to S3 (also evicts cached copies of the previous index)
+    if added or removed or existing is None:
+        artifacts = upload_faiss_store(s3, vectorstore, bucket, key_prefix)
+    else:
+        artifacts = stored_artifacts(s3, bucket, key_prefix)
+
+    # Bring the consolidated KB index in line; chunks it already holds are left alone
+    text_embeddings, metadatas = store_text_embeddings(vectorstore, filename)
+    store_ids = [vectorstore.index_to_docstore_id[row] for row in range(vectorstore.index.ntotal)]
+    append_file_to_kb_index(kb_id, filename, text_embeddings, embeddings, metadatas, ids=store_ids)
+    return artifacts, len(texts)
+
+
+def copy_embedding_into_kb(kb_id: str, filename: str, source_bucket: str, source_prefix: str) -> tuple:
+    """
+    Copy an existing per-file index (another KB's ingest of the same content) into
+    kb_id and fold its vectors into the KB index. Nothing is re-embedded.
+    Returns (uploaded index artifacts, chunk count) like build_and_store_embedding.
+    """
+    conf = KB_CONFIG[kb_id]
+    embeddings = get_embeddings()
+    bucket, key_prefix = conf["buckets"]["embeddings"], f"{conf['prefix']}/{filename}"
+
+    source = load_faiss_store(s3, source_bucket, source_prefix, embeddings)
+    text_embeddings, metadatas = store_text_embeddings(source, filename)
+    # Chunk ids hash the file name, so the copy is re-keyed rather than copied
+    # byte for byte: a later re-ingest of filename diffs against these ids
+    ids = chunk_ids(filename, [text for text, _ in text_embeddings])
+    vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+    artifacts = upload_faiss_store(s3, vectorstore, bucket, key_prefix)
+    append_file_to_kb_index(kb_id, filename, text_embeddings, embeddings, metadatas, ids=ids)
+    return artifacts, len(text_embeddings)
+
+
+def add_file_to_kb(kb_id: str, filename: str, transcript_text: str, summary_text: str, source_index: tuple = None):
+    """
+    Store a file's transcript, summary and embeddings in the KB. source_index
+    (bucket, key prefix) reuses an existing per-file index of the same content.
+    """
     conf = KB_CONFIG[kb_id]
 
     paths = get_kb_paths(kb_id, filename)
 
     # Upload transcript and summary
-    upload_text_to_s3(transcript_text, conf["buckets"]["transcripts"], paths["transcript_key"])
-    upload_text_to_s3(summary_text, conf["buckets"]["summaries"], paths["summary_key"])
+    transcript_etag = upload_text_to_s3(transcript_text, conf["buckets"]["transcripts"], paths["transcript_key"])
+    summary_etag = upload_text_to_s3(summary_text, conf["buckets"]["summaries"], paths["summary_key"])
+    record_summary(kb_id, paths["summary_key"], summary_text, summary_etag)
+    record_summary_sections(kb_id, filename, summary_text, get_embeddings(), etag=summary_etag)
 
     # Build and upload embeddings
-    build_and_store_embedding(transcript_text + "\n" + summary_text, kb_id, filename)
-
-    # Debug statements
-    print(f"[DEBUG] Uploading transcript to {conf['buckets']['transcripts']}, key: {paths['transcript_key']}")
-    print(f"[DEBUG] Uploading summary to {conf['buckets']['summaries']}, key: {paths['summary_key']}")
-    print(f"[DEBUG] Uploading embeddings to {conf['buckets']['embeddings']}, key: {paths['embedding_key']}")
+    if source_index:
+        artifacts, chunk_count = copy_embedding_into_kb(kb_id, filename, *source_index)
+    else:
+        artifacts, chunk_count = build_and_store_embedding(transcript_text + "\n" + summary_text, kb_id, filename)
+
+    # Publish the file in the KB manifest only once every artifact exists
+    artifacts["transcript"] = {"key": paths["transcript_key"], "etag": transcript_etag,
+                               "size": len(transcript_text.encode("utf-8"))}
+    artifacts["summary"] = {"key": paths["summary_key"], "etag": summary_etag,
+                            "size": len(summary_text.encode("utf-8"))}
+    record_kb_file(kb_id, filename, artifacts, chunk_count)
+
+    # Cached answers that drew on the previous version of this file are stale
+    get_answer_cache().invalidate(kb_id, filename)
+
+    logger.info("Added %s to %s: s3://%s/%s, s3://%s/%s, s3://%s/%s", filename, kb_id,
+                conf["buckets"]["transcripts"], paths["transcript_key"], conf["buckets"]["summaries"],
+                paths["summary_key"], conf["buckets"]["embeddings"], paths["embedding_key"])
 
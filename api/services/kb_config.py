@@ -0,0 +1,11 @@
+import os
+import json
+
+# Knowledge base definitions (prefix + buckets per KB). Kept free of AWS and
+# langchain imports so lightweight callers like ui.py can read it cheaply.
+kb_config_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "kb_config.json")
+)
+
+with open(kb_config_path) as f:
+    KB_CONFIG = json.load(f)
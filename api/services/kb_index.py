@@ -0,0 +1,272 @@
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+import faiss
+from botocore.exceptions import ClientError
+from langchain_community.vectorstores import FAISS
+from api.services.config import lazy_client
+from api.services.index_cache import index_cache, estimate_store_bytes
+from api.services.index_store import (
+    load_faiss_store, upload_faiss_store, private_store_copy, load_lexical_index, INDEX_STORE_MMAP,
+)
+from api.services.lexical import HYBRID_SEARCH, HYBRID_CANDIDATES, dense_ids, fused_documents
+from api.services.locks import s3_lease
+from api.services.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+s3 = lazy_client("s3")
+
+# Consolidated index lives next to the per-file indexes as {prefix}/_kb.index.faiss, with its
+# chunk store {prefix}/_kb.index.chunks and BM25 index {prefix}/_kb.bm25.
+# Names starting with "_" are reserved and never listed as KB files.
+KB_INDEX_NAME = "_kb"
+
+_kb_locks = {}
+_kb_locks_guard = threading.Lock()
+
+
+def _kb_lock(kb_id: str) -> threading.Lock:
+    with _kb_locks_guard:
+        return _kb_locks.setdefault(kb_id, threading.Lock())
+
+
+@contextmanager
+def kb_write_lock(kb_id: str):
+    """
+    Serialize writers of a KB's consolidated index: a thread lock within this
+    process plus an S3 lease shared with ingest workers in other processes.
+    Yields the lease, to be renewed right before the index is uploaded.
+    """
+    bucket, key_prefix = kb_index_location(kb_id)
+    with _kb_lock(kb_id), s3_lease(s3, bucket, f"{key_prefix}.lock") as lease:
+        yield lease
+
+
+def kb_index_location(kb_id: str):
+    from api.services.kb_config import KB_CONFIG
+    conf = KB_CONFIG[kb_id]
+    return conf["buckets"]["embeddings"], f"{conf['prefix']}/{KB_INDEX_NAME}"
+
+
+class KBIndex:
+    """
+    One FAISS store for a whole KB. Every chunk carries a ``file_id`` metadata
+    attribute; searches are restricted to the selected files with an IDSelector
+    so FAISS only scores rows belonging to those files.
+    """
+
+    def __init__(self, store: FAISS, bucket: str, key_prefix: str, etag: str = None):
+        self.store = store
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.etag = etag
+        self.rows_by_file = self._build_row_map()
+
+    def _build_row_map(self) -> dict:
+        # Chunk-store docstores can decode metadata alone, without touching chunk text
+        chunks = getattr(self.store.docstore, "chunks", None)
+        rows = {}
+        for row, doc_id in self.store.index_to_docstore_id.items():
+            if chunks is not None:
+                metadata = chunks.metadata(row)
+            else:
+                metadata = self.store.docstore.search(doc_id).metadata
+            rows.setdefault(metadata.get("file_id"), []).append(row)
+        return {file_id: np.array(ids, dtype="int64") for file_id, ids in rows.items()}
+
+    @property
+    def file_ids(self) -> set:
+        return set(self.rows_by_file)
+
+    def contains(self, filenames) -> bool:
+        return all(filename in self.rows_by_file for filename in filenames)
+
+    def select(self, filenames) -> "KBIndexSelection":
+        return KBIndexSelection(self, list(filenames))
+
+    def _selector(self, filenames):
+        """
+        (FAISS search params restricting a search to filenames' rows, row count).
+        """
+        selected = [self.rows_by_file[f] for f in filenames if f in self.rows_by_file]
+        if not selected:
+            return None, 0
+        rows = np.concatenate(selected)
+        if len(rows) < self.store.index.ntotal:
+            return faiss.SearchParameters(sel=faiss.IDSelectorBatch(rows)), len(rows)
+        return None, len(rows)
+
+    @property
+    def lexical(self):
+        return load_lexical_index(s3, self.store, self.bucket, self.key_prefix, self.etag)
+
+    def similarity_search_with_score_by_vector(self, embedding, filenames, k: int = 4):
+        params, count = self._selector(filenames)
+        if not count:
+            return []
+
+        vector = np.array([embedding], dtype=np.float32)
+        if self.store._normalize_L2:
+            faiss.normalize_L2(vector)
+        scores, indices = self.store.index.search(vector, min(k, count), params=params)
+
+        results = []
+        for score, row in zip(scores[0], indices[0]):
+            if row == -1:
+                continue
+            doc = self.store.docstore.search(self.store.index_to_docstore_id[int(row)])
+            results.append((doc, float(score)))
+        return results
+
+    def similarity_search(self, query: str, filenames, k: int = 4):
+        embedding = self.store.embedding_function.embed_query(query)
+        if not HYBRID_SEARCH:
+            return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, filenames, k)]
+
+        # Fuse vector and BM25 rankings so exact names and ticket numbers aren't missed
+        params, count = self._selector(filenames)
+        if not count:
+            return []
+        candidates = min(k * HYBRID_CANDIDATES, count)
+        rankings = [
+            dense_ids(self.store, embedding, candidates, params=params),
+            self.lexical.search(query, candidates, file_ids=filenames),
+        ]
+        return fused_documents(self.store, rankings, k)
+
+
+class KBIndexSelection:
+    """
+    A KBIndex narrowed to the files the user selected. Exposes the same
+    similarity_search() call the views use on a plain FAISS store.
+    """
+
+    def __init__(self, kb_index: KBIndex, filenames: list):
+        self.kb_index = kb_index
+        self.filenames = filenames
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        # Hybrid (vector + BM25) unless HYBRID_SEARCH=0
+        with span("faiss.search", k=k, files=len(self.filenames), hybrid=HYBRID_SEARCH):
+            return self.kb_index.similarity_search(query, self.filenames, k=k)
+
+
+def _current_etag(bucket: str, key_prefix: str, max_age: float = None):
+    try:
+        return index_cache.get_etag(s3, bucket, f"{key_prefix}.index.faiss", max_age=max_age)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+def load_kb_index(kb_id: str, embeddings, max_age: float = None):
+    """
+    Return the cached consolidated KBIndex for kb_id, or None if it has not been built yet.
+    max_age bounds how stale the ETag check may be (writers pass 0).
+    """
+    bucket, key_prefix = kb_index_location(kb_id)
+    etag = _current_etag(bucket, key_prefix, max_age=max_age)
+    if etag is None:
+        return None
+
+    cache_key = ("kb-index", bucket, key_prefix, etag)
+    kb_index = index_cache.get(cache_key)
+    if kb_index is not None:
+        return kb_index
+
+    logger.debug("Loading consolidated KB index from s3://%s/%s.index.faiss", bucket, key_prefix)
+    with span("faiss.load", key_prefix=key_prefix) as attrs:
+        kb_index = KBIndex(load_faiss_store(s3, bucket, key_prefix, embeddings, etag=etag), bucket, key_prefix, etag)
+        size = estimate_store_bytes(kb_index.store, include_vectors=not INDEX_STORE_MMAP)
+        attrs.update(rows=kb_index.store.index.ntotal, bytes=size)
+    return index_cache.put(cache_key, kb_index, size, tags=[(bucket, key_prefix)])
+
+
+def append_file_to_kb_index(kb_id: str, filename: str, text_embeddings: list, embeddings,
+                            metadatas: list = None, ids: list = None):
+    """
+    Append one file's (text, vector) pairs to the KB index, replacing any vectors
+    previously stored for the same file. Nothing else in the KB is re-embedded.
+    With stable chunk ids, rows whose id is already present are kept in place
+    and only the file's removed and new chunks change.
+    """
+    bucket, key_prefix = kb_index_location(kb_id)
+    metadatas = metadatas or [{} for _ in text_embeddings]
+    metadatas = [{**metadata, "file_id": filename} for metadata in metadatas]
+
+    with kb_write_lock(kb_id) as lease:
+        # Another process may have appended since our last look
+        current = load_kb_index(kb_id, embeddings, max_age=0)
+
+        if current is None:
+            store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            # The cached store is shared with readers (and may be mmapped), so mutate a private copy
+            store = private_store_copy(current.store)
+            held_ids = {
+                store.index_to_docstore_id[int(row)]
+                for row in current.rows_by_file.get(filename, [])
+            }
+            wanted = set(ids or ())
+            stale_ids = [doc_id for doc_id in held_ids if doc_id not in wanted]
+            if stale_ids:
+                store.delete(stale_ids)
+            new_rows = [i for i, doc_id in enumerate(ids or [None] * len(text_embeddings)) if doc_id not in held_ids]
+            if new_rows:
+                store.add_embeddings(
+                    [text_embeddings[i] for i in new_rows],
+                    metadatas=[metadatas[i] for i in new_rows],
+                    ids=[ids[i] for i in new_rows] if ids else None,
+                )
+            if not stale_ids and not new_rows:
+                logger.debug("KB index for %s already up to date for %s", kb_id, filename)
+                return
+
+        # Fence: raises LeaseLost rather than overwrite the index of a writer that took over
+        lease.renew()
+        upload_faiss_store(s3, store, bucket, key_prefix, lexical=True)
+        logger.info("KB index s3://%s/%s.index.faiss now holds %d vectors", bucket, key_prefix, store.index.ntotal)
+
+
+def store_text_embeddings(vs: FAISS, filename: str):
+    """
+    (text_embeddings, metadatas) of every vector in a per-file store, read back
+    from the index so the file can be folded into a KB index without re-embedding.
+    """
+    vectors = vs.index.reconstruct_n(0, vs.index.ntotal)
+    texts, metadatas = [], []
+    for row in range(vs.index.ntotal):
+        doc = vs.docstore.search(vs.index_to_docstore_id[row])
+        texts.append(doc.page_content)
+        metadatas.append({**doc.metadata, "file_id": filename})
+    return list(zip(texts, vectors.tolist())), metadatas
+
+
+def rebuild_kb_index(kb_id: str, filenames: list, embeddings) -> int:
+    """
+    Consolidate existing per-file indexes into the KB index without re-embedding.
+    Used to migrate KBs that were ingested before the consolidated index existed.
+    """
+    from api.services.kb_config import KB_CONFIG
+    conf = KB_CONFIG[kb_id]
+    bucket, key_prefix = kb_index_location(kb_id)
+
+    with kb_write_lock(kb_id) as lease:
+        store = None
+        for filename in filenames:
+            vs = load_faiss_store(s3, bucket, f"{conf['prefix']}/{filename}", embeddings)
+            text_embeddings, metadatas = store_text_embeddings(vs, filename)
+            if store is None:
+                store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+            else:
+                store.add_embeddings(text_embeddings, metadatas=metadatas)
+            logger.info("Folded %s (%d vectors) into KB index for %s", filename, vs.index.ntotal, kb_id)
+
+        if store is None:
+            return 0
+        lease.renew()
+        upload_faiss_store(s3, store, bucket, key_prefix, lexical=True)
+        return store.index.ntotal
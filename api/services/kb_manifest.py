@@ -0,0 +1,86 @@
+import logging
+import os
+from datetime import datetime, timezone
+from api.services.config import lazy_client
+from api.services.kb_config import KB_CONFIG
+from api.services.manifests import read_manifest, update_manifest
+
+logger = logging.getLogger(__name__)
+
+# Per-KB record of ingested files and their artifacts, kept next to the indexes
+KB_MANIFEST_NAME = "_manifest.json"
+# How long a process serves its in-memory copy before revalidating with S3
+KB_MANIFEST_MAX_AGE = float(os.getenv("KB_MANIFEST_MAX_AGE", "5"))
+
+s3 = lazy_client("s3")
+
+
+def kb_manifest_location(kb_id: str):
+    conf = KB_CONFIG[kb_id]
+    return conf["buckets"]["embeddings"], f"{conf['prefix']}/{KB_MANIFEST_NAME}"
+
+
+def _listed_artifact(obj) -> dict:
+    return {"key": obj["Key"], "etag": obj["ETag"].strip('"'), "size": obj["Size"]}
+
+
+def build_kb_manifest(kb_id: str) -> dict:
+    """
+    Rebuild a KB's manifest from its indexes and transcripts in S3. Chunk counts
+    aren't recoverable from a listing and are left as None.
+    """
+    conf = KB_CONFIG[kb_id]
+    prefix = f"{conf['prefix']}/"
+    paginator = s3.get_paginator("list_objects_v2")
+    files = {}
+
+    sources = [
+        (conf["buckets"]["embeddings"], {".index.faiss": "index", ".index.chunks": "chunks"}),
+        (conf["buckets"]["transcripts"], {".txt": "transcript"}),
+    ]
+    for bucket, suffixes in sources:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                name = obj["Key"].split("/")[-1]
+                for suffix, artifact in suffixes.items():
+                    if name.endswith(suffix) and not name.startswith("_"):  # reserved, e.g. the KB index
+                        entry = files.setdefault(name[: -len(suffix)], {"artifacts": {}, "chunks": None, "ingested_at": None})
+                        entry["artifacts"][artifact] = _listed_artifact(obj)
+                        modified = obj["LastModified"].isoformat()
+                        entry["ingested_at"] = max(entry["ingested_at"] or modified, modified)
+
+    logger.info("Rebuilt KB manifest for %s: %d files", kb_id, len(files))
+    bucket, key = kb_manifest_location(kb_id)
+    return update_manifest(s3, bucket, key, lambda _: {"version": 1, "files": files})
+
+
+def record_kb_file(kb_id: str, filename: str, artifacts: dict, chunks: int = None) -> dict:
+    """
+    Add or replace one file's entry once all of its artifacts are written. The
+    conditional put makes this atomic with respect to concurrent ingests.
+    """
+    bucket, key = kb_manifest_location(kb_id)
+    if read_manifest(s3, bucket, key)[0] is None:
+        build_kb_manifest(kb_id)  # backfill existing files first
+
+    entry = {"artifacts": artifacts, "chunks": chunks, "ingested_at": datetime.now(timezone.utc).isoformat()}
+
+    def add(manifest):
+        manifest = manifest or {"version": 1, "files": {}}
+        manifest["files"][filename] = entry
+        return manifest
+
+    return update_manifest(s3, bucket, key, add)
+
+
+def load_kb_manifest(kb_id: str, max_age: float = KB_MANIFEST_MAX_AGE):
+    """
+    Return (manifest, etag) from this process's copy, revalidated with a
+    conditional GET at most every max_age seconds. Built on first use.
+    """
+    bucket, key = kb_manifest_location(kb_id)
+    manifest, etag = read_manifest(s3, bucket, key, max_age=max_age)
+    if manifest is None:
+        build_kb_manifest(kb_id)
+        manifest, etag = read_manifest(s3, bucket, key, max_age=max_age)
+    return manifest, etag
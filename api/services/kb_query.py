@@ -1,71 +1,164 @@
-import boto3
-import os
-import json
-import tempfile
-import shutil
-from .rag_engine import answer_question_rag
+import logging
+from typing import Iterator
+from .rag_engine import answer_question_rag, stream_answer_rag
 from langchain.vectorstores import FAISS
-from langchain.embeddings import BedrockEmbeddings
-from langchain_community.chat_models import BedrockChat
-from langchain.chains import RetrievalQA
-from api.services.config import get_aws_session
+from api.services.config import lazy_client
+from api.services.kb_config import KB_CONFIG
+from api.services.index_cache import index_cache, estimate_store_bytes
+from api.services.kb_index import load_kb_index
+from api.services.embeddings import get_embeddings
+from api.services.answer_cache import get_answer_cache
+from api.services.context_builder import RETRIEVAL_K
+from api.services.kb_manifest import KB_MANIFEST_MAX_AGE
+from api.services.summaries import load_summary_texts
+from api.services.summary_index import load_summary_sections, SUMMARY_TOP_SECTIONS
+from api.services.index_store import load_faiss_store, private_index_copy, private_store_copy, INDEX_STORE_MMAP
+from api.services.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+s3 = lazy_client("s3")
+
+
+def load_file_vectorstore(bucket: str, key_prefix: str, etag: str, embeddings) -> FAISS:
+    """
+    Load one per-file FAISS index, served from the process cache when the ETag matches.
+    """
+    cache_key = ("file", bucket, key_prefix, etag)
+    vs = index_cache.get(cache_key)
+    if vs is not None:
+        return vs
+
+    logger.debug("Loading FAISS index s3://%s/%s.index.faiss", bucket, key_prefix)
+    with span("faiss.load", key_prefix=key_prefix) as attrs:
+        vs = load_faiss_store(s3, bucket, key_prefix, embeddings, etag=etag)
+        size = estimate_store_bytes(vs, include_vectors=not INDEX_STORE_MMAP)
+        attrs.update(rows=vs.index.ntotal, bytes=size)
+
+    return index_cache.put(cache_key, vs, size, tags=[(bucket, key_prefix)])
+
+
+def merge_vectorstores(stores: list) -> FAISS:
+    """
+    Merge stores into a new FAISS store. Inputs are left untouched because they are
+    shared through the cache (and may be memory-mapped): FAISS merge_from mutates
+    its target and also empties the source index, so both sides get private copies.
+    """
+    if len(stores) == 1:
+        return stores[0]
+
+    with span("faiss.merge", stores=len(stores)) as attrs:
+        merged = private_store_copy(stores[0])
+        for vs in stores[1:]:
+            merged.merge_from(FAISS(vs.embedding_function, private_index_copy(vs.index), vs.docstore, vs.index_to_docstore_id))
+        attrs["rows"] = merged.index.ntotal
+    return merged
+
+
+def load_kb_summaries(kb_id: str, filenames: list[str], question_vector=None) -> dict:
+    """
+    {filename: summary text} for the prompt: the SUMMARY_TOP_SECTIONS summary
+    sections of the selected files that best match the question, plus the full
+    summary of any file whose summary hasn't been sectioned yet. Everything comes
+    from this process's copies of the KB's manifests; nothing is fetched per file.
+    """
+    sections = load_summary_sections(kb_id) if question_vector is not None and SUMMARY_TOP_SECTIONS else None
+    if sections is None:
+        return load_summary_texts(kb_id, filenames, max_age=KB_MANIFEST_MAX_AGE)
+
+    summaries = sections.top_sections(question_vector, filenames, SUMMARY_TOP_SECTIONS)
+    unsectioned = [filename for filename in filenames if filename not in sections.file_ids]
+    if unsectioned:
+        logger.warning("Summaries of %s are not sectioned yet; using them whole", unsectioned)
+        summaries.update(load_summary_texts(kb_id, unsectioned, max_age=KB_MANIFEST_MAX_AGE))
+    logger.debug("Summary sections: %d/%d files for this question", len(summaries), len(filenames))
+    return summaries
 
 
-s3 = get_aws_session().client("s3")
-
-
-# Load KB config
-kb_config_path = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "kb_config.json")
-)
-
-with open(kb_config_path) as f:
-    KB_CONFIG = json.load(f)
-
-def download_faiss_index(bucket: str, key_prefix: str, local_dir: str):
-    for suffix in ["faiss", "pkl"]:
-        # FIXED: match actual uploaded key naming convention with `.index` in filename
-        s3_key = f"{key_prefix}.index.{suffix}"
-        original_filename = f"{os.path.basename(key_prefix)}.index.{suffix}"
-        original_path = os.path.join(local_dir, original_filename)
-        target_path = os.path.join(local_dir, f"index.{suffix}")
-
-        print(f"[DEBUG] Downloading from s3://{bucket}/{s3_key} to {original_path}")
-        s3.download_file(bucket, s3_key, original_path)
-
-        # Rename to index.faiss / index.pkl as FAISS expects
-        shutil.move(original_path, target_path)
+def load_kb_vectorstore(kb_id: str, filenames: list[str]):
+    embeddings = get_embeddings()
 
+    kb_index = load_kb_index(kb_id, embeddings)
+    if kb_index is not None and kb_index.contains(filenames):
+        return kb_index.select(filenames)
 
+    missing = sorted(set(filenames) - (kb_index.file_ids if kb_index else set()))
+    logger.warning("%s not in consolidated index for %s; merging per-file indexes", missing, kb_id)
+    return load_merged_vectorstore(kb_id, filenames, embeddings)
 
 
-def load_kb_vectorstore(kb_id: str, filenames: list[str]):
+def load_merged_vectorstore(kb_id: str, filenames: list[str], embeddings):
     conf = KB_CONFIG[kb_id]
-    embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1")
-    summary_bucket = conf["buckets"]["summaries"]
-
-    merged_store = None
-    combined_summary = ""
-
-    for filename in filenames:
-        key_prefix = f"{conf['prefix']}/{filename}"
-
-        # Download FAISS index
-        with tempfile.TemporaryDirectory() as tmpdir:
-            download_faiss_index(conf["buckets"]["embeddings"], key_prefix, tmpdir)
-            vs = FAISS.load_local(tmpdir, embeddings, allow_dangerous_deserialization=True)
-            merged_store = merged_store.merge_from(vs) if merged_store else vs
-
-        # Download corresponding summary
-        summary_key = f"{conf['prefix']}/{filename}.md"
-        print(f"[DEBUG] Trying to fetch summary from: s3://{summary_bucket}/{summary_key}")
-
-        try:
-            s3_object = s3.get_object(Bucket=summary_bucket, Key=summary_key)
-            summary_text = s3_object["Body"].read().decode("utf-8")
-            combined_summary += f"\n\n--- Summary for {filename} ---\n{summary_text}"
-        except Exception as e:
-            print(f"[WARNING] Could not load summary for {filename}: {e}")
-            combined_summary += f"\n\n--- Summary for {filename} ---\n(No summary available)"
-
-    return merged_store, combined_summary
+    embedding_bucket = conf["buckets"]["embeddings"]
+
+    key_prefixes = {filename: f"{conf['prefix']}/{filename}" for filename in filenames}
+    etags = {
+        filename: index_cache.get_etag(s3, embedding_bucket, f"{key_prefix}.index.faiss")
+        for filename, key_prefix in key_prefixes.items()
+    }
+
+    merged_key = ("merged", embedding_bucket, tuple(sorted(etags.items())))
+    cached = index_cache.get(merged_key)
+    if cached is not None:
+        return cached
+
+    stores = [
+        load_file_vectorstore(embedding_bucket, key_prefixes[filename], etags[filename], embeddings)
+        for filename in filenames
+    ]
+    if len(stores) == 1:
+        return stores[0]
+
+    merged_store = merge_vectorstores(stores)
+    return index_cache.put(
+        merged_key,
+        merged_store,
+        estimate_store_bytes(merged_store),
+        tags=[(embedding_bucket, key_prefix) for key_prefix in key_prefixes.values()],
+    )
+
+
+def answer_kb_question(kb_id: str, filenames: list[str], question: str) -> str:
+    """
+    Answer a question over the selected KB files, reusing a cached answer to a
+    near-identical question about the same file set when there is one.
+    """
+    cache = get_answer_cache()
+    answer, vector = cache.lookup(kb_id, filenames, question)
+    if answer is not None:
+        return answer
+
+    vectorstore = load_kb_vectorstore(kb_id, filenames)
+    summary = load_kb_summaries(kb_id, filenames, question_vector=vector)
+    context_docs = vectorstore.similarity_search(question, k=RETRIEVAL_K)
+    usage = {}
+    answer = answer_question_rag(summary, context_docs, question, usage=usage)
+    if usage:  # not an error message
+        cache.store(kb_id, filenames, question, answer, usage, vector=vector)
+    return answer
+
+
+def stream_kb_answer(kb_id: str, filenames: list[str], question: str) -> Iterator[str]:
+    """
+    Streaming counterpart of answer_kb_question. Retrieval happens before this
+    returns, so failures surface as errors rather than a broken stream.
+    """
+    cache = get_answer_cache()
+    answer, vector = cache.lookup(kb_id, filenames, question)
+    if answer is not None:
+        return iter([answer])
+
+    vectorstore = load_kb_vectorstore(kb_id, filenames)
+    summary = load_kb_summaries(kb_id, filenames, question_vector=vector)
+    context_docs = vectorstore.similarity_search(question, k=RETRIEVAL_K)
+    usage = {}
+
+    def generate():
+        parts = []
+        for text in stream_answer_rag(summary, context_docs, question, usage=usage):
+            parts.append(text)
+            yield text
+        if usage:
+            cache.store(kb_id, filenames, question, "".join(parts), usage, vector=vector)
+
+    return generate()
@@ -0,0 +1,188 @@
+import os
+import re
+from collections import Counter
+import numpy as np
+import faiss
+
+# BM25 over the same chunks as a FAISS store, keyed by the same docstore ids so
+# lexical and vector hits can be fused. Dense retrieval misses exact names,
+# ticket numbers and acronyms; BM25 catches them.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal rank fusion constant (score = sum of 1 / (RRF_K + rank))
+RRF_K = 60
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# Each retriever returns k * HYBRID_CANDIDATES candidates before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+MAX_TOKEN_CHARS = 40
+# Query terms in more than this share of chunks ("the", "we", "meeting") add
+# almost nothing to BM25 scores but dominate its cost; they are skipped unless
+# the query has nothing rarer
+MAX_DF_RATIO = 0.5
+
+# Keeps "ABC-123", "v2.1" and "q3_report" whole; their parts are indexed too
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) > MAX_TOKEN_CHARS:
+            continue
+        tokens.append(token)
+        parts = PART_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Inverted index as flat numpy arrays: postings for term t are
+    post_docs/post_tf[offsets[t]:offsets[t + 1]]. Saved with np.savez, so it
+    loads without pickle and a query touches only its own terms' postings.
+    """
+
+    def __init__(self, terms, offsets, post_docs, post_tf, doc_len, ids, file_codes, files):
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.post_docs = post_docs
+        self.post_tf = post_tf
+        self.doc_len = doc_len
+        self.ids = ids
+        self.file_codes = file_codes
+        self.files = {name: code for code, name in enumerate(files)}
+        self._masks = {}
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((len(doc_len) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # Each posting's BM25 contribution doesn't depend on the query, so a query
+        # is one gather-add per term
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[post_docs] / (self.avgdl or 1.0))
+        term_of_posting = np.repeat(np.arange(len(df)), np.diff(offsets))
+        self.post_weight = (self.idf[term_of_posting] * post_tf * (BM25_K1 + 1) / (post_tf + norm)).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids: list, texts: list, file_ids: list) -> "LexicalIndex":
+        postings = {}
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        pairs = [pair for term in terms for pair in postings[term]]
+        post_docs = np.array([row for row, _ in pairs], dtype=np.int32)
+        post_tf = np.array([tf for _, tf in pairs], dtype=np.float32)
+
+        files = sorted({file_id or "" for file_id in file_ids})
+        codes = {name: code for code, name in enumerate(files)}
+        file_codes = np.array([codes[file_id or ""] for file_id in file_ids], dtype=np.int32)
+        return cls(terms, offsets, post_docs, post_tf, doc_len, list(ids), file_codes, files)
+
+    @classmethod
+    def from_store(cls, store) -> "LexicalIndex":
+        ids = [store.index_to_docstore_id[row] for row in range(store.index.ntotal)]
+        docs = [store.docstore.search(doc_id) for doc_id in ids]
+        return cls.build(ids, [doc.page_content for doc in docs], [doc.metadata.get("file_id") for doc in docs])
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.array(list(self.vocab), dtype=str),
+                offsets=self.offsets, post_docs=self.post_docs, post_tf=self.post_tf, doc_len=self.doc_len,
+                ids=np.array(self.ids, dtype=str), file_codes=self.file_codes,
+                files=np.array(list(self.files), dtype=str),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["terms"].tolist(), data["offsets"], data["post_docs"], data["post_tf"], data["doc_len"],
+                data["ids"].tolist(), data["file_codes"], data["files"].tolist(),
+            )
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.offsets, self.post_docs, self.post_tf, self.post_weight, self.doc_len, self.file_codes, self.idf)
+        return sum(a.nbytes for a in arrays) + 64 * (len(self.vocab) + len(self.ids))
+
+    def _file_mask(self, file_ids) -> np.ndarray:
+        key = frozenset(file_ids)
+        mask = self._masks.get(key)
+        if mask is None:
+            codes = [self.files[f] for f in key if f in self.files]
+            mask = np.isin(self.file_codes, codes)
+            if len(self._masks) >= 32:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def search(self, query: str, k: int, file_ids=None) -> list:
+        """
+        Docstore ids of the k best BM25 matches, optionally only among file_ids.
+        """
+        terms = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+        if not terms or not self.ids:
+            return []
+        max_df = MAX_DF_RATIO * len(self.ids)
+        terms = [t for t in terms if self.offsets[t + 1] - self.offsets[t] <= max_df] or terms
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in terms:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            scores[self.post_docs[start:end]] += self.post_weight[start:end]
+
+        if file_ids is not None:
+            scores[~self._file_mask(file_ids)] = 0
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [self.ids[row] for row in hits]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """
+    Merge ranked id lists; ids ranked well by several retrievers come first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+def dense_ids(store, embedding, k: int, params=None) -> list:
+    """
+    Docstore ids of the k nearest chunks in a langchain FAISS store.
+    """
+    vector = np.array([embedding], dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(vector)
+    _, rows = store.index.search(vector, min(k, store.index.ntotal), params=params)
+    return [store.index_to_docstore_id[int(row)] for row in rows[0] if row != -1]
+
+
+def fused_documents(store, rankings: list, k: int) -> list:
+    """
+    The top k documents of the fused rankings. Ids the store doesn't hold (a
+    lexical index a write ahead of a cached store) are skipped.
+    """
+    docs = []
+    for doc_id in reciprocal_rank_fusion(rankings):
+        doc = store.docstore.search(doc_id)
+        if isinstance(doc, str):  # langchain docstores return a message for unknown ids
+            continue
+        docs.append(doc)
+        if len(docs) == k:
+            break
+    return docs
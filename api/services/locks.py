@@ -0,0 +1,151 @@
+import logging
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import threading
+from contextlib import contextmanager
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# Cross-process mutual exclusion through S3 conditional writes: the lock is an
+# object created with If-None-Match: * and removed with If-Match on its ETag,
+# so every ingest worker on every host sees the same holder. Holders renew the
+# lease while they work, so S3_LOCK_TTL only bounds how long a crashed holder
+# blocks the others.
+S3_LOCK_TTL = float(os.getenv("S3_LOCK_TTL", "900"))
+S3_LOCK_WAIT = float(os.getenv("S3_LOCK_WAIT", "1800"))
+
+_CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+
+def _error_code(e: ClientError) -> str:
+    return e.response["Error"]["Code"]
+
+
+def _break_if_expired(s3, bucket: str, key: str) -> bool:
+    """
+    Delete the lock if its holder's lease has run out (it crashed). Returns True
+    if the lock is gone, False if it is still validly held.
+    """
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if _error_code(e) in ("NoSuchKey", "404"):
+            return True
+        raise
+    lease = json.loads(obj["Body"].read())
+    if lease.get("expires_at", 0) > time.time():
+        return False
+
+    logger.warning("Breaking expired lock s3://%s/%s held by %s", bucket, key, lease.get("owner"))
+    try:
+        s3.delete_object(Bucket=bucket, Key=key, IfMatch=obj["ETag"])
+    except ClientError as e:
+        if _error_code(e) not in _CONFLICT_CODES + ("NoSuchKey", "404"):
+            raise
+    return True
+
+
+class LeaseLost(Exception):
+    """
+    The lease ran out (or was broken by another worker) while it was held.
+    """
+
+
+class S3Lease:
+    """
+    A held s3_lease. A heartbeat thread renews it every ttl / 3 seconds with a
+    conditional put on its ETag, so a holder that outlives ttl keeps the lock.
+    """
+
+    def __init__(self, s3, bucket: str, key: str, owner: str, ttl: float, etag: str):
+        self.s3, self.bucket, self.key = s3, bucket, key
+        self.owner, self.ttl, self.etag = owner, ttl, etag
+        self.lost = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, name="s3-lease-heartbeat", daemon=True)
+
+    def renew(self):
+        """
+        Extend the lease by ttl. Raises LeaseLost if it is no longer ours, so
+        callers can fence a write on still holding the lock.
+        """
+        with self._lock:
+            if self.lost:
+                raise LeaseLost(f"Lost lock s3://{self.bucket}/{self.key}")
+            try:
+                self.etag = self.s3.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=_lease_body(self.owner, self.ttl), IfMatch=self.etag,
+                )["ETag"]
+            except ClientError as e:
+                if _error_code(e) not in _CONFLICT_CODES + ("NoSuchKey", "404"):
+                    raise
+                self.lost = True
+                raise LeaseLost(f"Lost lock s3://{self.bucket}/{self.key}: {_error_code(e)}")
+
+    def _beat(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.renew()
+            except LeaseLost as e:
+                logger.warning("%s", e)
+                return
+            except Exception as e:
+                # Transient; the next beat tries again well before the lease runs out
+                logger.warning("Could not renew lock s3://%s/%s: %s", self.bucket, self.key, e)
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat.is_alive():
+            self._heartbeat.join()
+        with self._lock:
+            if self.lost:
+                return
+            try:
+                self.s3.delete_object(Bucket=self.bucket, Key=self.key, IfMatch=self.etag)
+            except ClientError as e:
+                # Our lease expired and someone else took the lock; nothing to release
+                logger.warning("Could not release lock s3://%s/%s: %s", self.bucket, self.key, _error_code(e))
+
+
+def _lease_body(owner: str, ttl: float) -> bytes:
+    return json.dumps({"owner": owner, "expires_at": time.time() + ttl}).encode("utf-8")
+
+
+@contextmanager
+def s3_lease(s3, bucket: str, key: str, ttl: float = S3_LOCK_TTL, wait: float = S3_LOCK_WAIT):
+    """
+    Hold s3://bucket/key as an exclusive lease for the duration of the block,
+    renewed in the background while held. Yields the S3Lease; call its renew()
+    right before a write that must not happen if the lock was lost.
+    A lease not renewed for ttl seconds is treated as abandoned and taken over.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + wait
+    delay = 0.1
+
+    while True:
+        try:
+            etag = s3.put_object(Bucket=bucket, Key=key, Body=_lease_body(owner, ttl), IfNoneMatch="*")["ETag"]
+            break
+        except ClientError as e:
+            if _error_code(e) not in _CONFLICT_CODES:
+                raise
+        if _break_if_expired(s3, bucket, key):
+            continue
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for lock s3://{bucket}/{key}")
+        time.sleep(random.uniform(delay / 2, delay))
+        delay = min(delay * 2, 5)
+
+    lease = S3Lease(s3, bucket, key, owner, ttl, etag)
+    lease._heartbeat.start()
+    try:
+        yield lease
+    finally:
+        lease.release()
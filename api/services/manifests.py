@@ -0,0 +1,73 @@
+import copy
+import json
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+
+# Per-KB JSON manifests kept in S3. Reads are conditional GETs against a local
+# copy keyed by ETag; writes are optimistic read-modify-write cycles guarded by
+# S3 conditional puts, so concurrent writers in any process never lose updates.
+MANIFEST_MAX_ATTEMPTS = 10
+
+_cache = {}  # (bucket, key) -> (etag, data, fetched_at)
+_cache_lock = threading.Lock()
+
+
+def read_manifest(s3, bucket: str, key: str, max_age: float = 0):
+    """
+    Return (data, etag), or (None, None) if the manifest does not exist yet.
+    A local copy younger than max_age seconds is returned without asking S3.
+    The returned data is shared with the cache and must not be mutated.
+    """
+    with _cache_lock:
+        cached = _cache.get((bucket, key))
+    if cached and time.monotonic() - cached[2] < max_age:
+        return cached[1], cached[0]
+
+    kwargs = {"IfNoneMatch": f'"{cached[0]}"'} if cached else {}
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key, **kwargs)
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if cached and code in ("304", "NotModified"):
+            with _cache_lock:
+                _cache[(bucket, key)] = (cached[0], cached[1], time.monotonic())
+            return cached[1], cached[0]
+        if code in ("NoSuchKey", "404"):
+            with _cache_lock:
+                _cache.pop((bucket, key), None)
+            return None, None
+        raise
+
+    data = json.loads(obj["Body"].read())
+    etag = obj["ETag"].strip('"')
+    with _cache_lock:
+        _cache[(bucket, key)] = (etag, data, time.monotonic())
+    return data, etag
+
+
+def update_manifest(s3, bucket: str, key: str, mutate) -> dict:
+    """
+    Apply mutate(data) -> new data to the manifest and write it back only if
+    nobody else has written it in between; otherwise re-read and retry. mutate
+    receives a private copy (or None when the manifest doesn't exist yet).
+    """
+    for attempt in range(MANIFEST_MAX_ATTEMPTS):
+        data, etag = read_manifest(s3, bucket, key)
+        data = mutate(copy.deepcopy(data))
+        condition = {"IfMatch": f'"{etag}"'} if etag else {"IfNoneMatch": "*"}
+        try:
+            response = s3.put_object(
+                Bucket=bucket, Key=key, Body=json.dumps(data).encode("utf-8"),
+                ContentType="application/json", **condition,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+                continue
+            raise
+        with _cache_lock:
+            _cache[(bucket, key)] = (response["ETag"].strip('"'), data, time.monotonic())
+        return data
+    raise RuntimeError(f"Could not update s3://{bucket}/{key}: too many concurrent writers")
@@ -1,22 +1,25 @@
-import os
+import logging
 import io
 import json
-import boto3
-import tempfile
-from typing import List
+import time
+from typing import Iterator, List
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 from langchain_community.vectorstores import FAISS
-from langchain_aws import BedrockEmbeddings
-from api.services.config import get_aws_session
+from api.services.config import lazy_client
+from api.services.index_cache import index_cache, estimate_store_bytes
+from api.services.index_store import load_faiss_store, upload_faiss_store, load_lexical_index, INDEX_STORE_MMAP
+from api.services.lexical import HYBRID_SEARCH, HYBRID_CANDIDATES, dense_ids, fused_documents
+from api.services.context_builder import build_context, RETRIEVAL_K
+from api.services.embeddings import get_embeddings
+from api.services.telemetry import span, record_span
 
-# AWS Clients
-s3 = get_aws_session().client("s3")
+logger = logging.getLogger(__name__)
 
-bedrock_runtime = boto3.client("bedrock-runtime", region_name="us-east-1")
+# AWS Clients
+s3 = lazy_client("s3")
 
-# Embeddings
-bedrock_embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", region_name="us-east-1")
+bedrock_runtime = lazy_client("bedrock-runtime", default_chain=True)
 
 # Constants 
 VECTOR_S3_BUCKET = "aima-meeting-embeddings"
@@ -52,46 +55,63 @@ def chunk_transcript(text: str) -> List[Document]:
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
     )
-    return splitter.create_documents([text])
+    with span("chunk", bytes=len(text.encode("utf-8"))) as attrs:
+        docs = splitter.create_documents([text])
+        attrs["chunks"] = len(docs)
+    return docs
 
 def save_faiss_to_s3(faiss_index: FAISS, key_prefix: str):
-    with tempfile.TemporaryDirectory() as tmpdir:
-        faiss_index.save_local(tmpdir)
-        for file_name in os.listdir(tmpdir):
-            local_path = os.path.join(tmpdir, file_name)
-            s3_key = f"{key_prefix}.index.{file_name.split('.')[-1]}"  # Match download naming
-            s3.upload_file(local_path, VECTOR_S3_BUCKET, s3_key)
+    upload_faiss_store(s3, faiss_index, VECTOR_S3_BUCKET, key_prefix, lexical=True)
 
 
 def load_faiss_from_s3(key_prefix: str) -> FAISS:
-    with tempfile.TemporaryDirectory() as tmpdir:
-        for suffix in ["faiss", "pkl"]:
-            s3_key = f"{key_prefix}.index.{suffix}"  # ✅ Use .index
-            print(f"[DEBUG] Downloading FAISS file from: s3://{VECTOR_S3_BUCKET}/{s3_key}")
-            s3.download_file(
-                VECTOR_S3_BUCKET,
-                s3_key,
-                os.path.join(tmpdir, f"index.{suffix}")
-            )
-        return FAISS.load_local(tmpdir, bedrock_embeddings, allow_dangerous_deserialization=True)
+    etag = index_cache.get_etag(s3, VECTOR_S3_BUCKET, f"{key_prefix}.index.faiss")
+    cache_key = ("file", VECTOR_S3_BUCKET, key_prefix, etag)
+    vectorstore = index_cache.get(cache_key)
+    if vectorstore is not None:
+        return vectorstore
+
+    logger.debug("Loading FAISS index from s3://%s/%s.index.faiss", VECTOR_S3_BUCKET, key_prefix)
+    with span("faiss.load", key_prefix=key_prefix) as attrs:
+        vectorstore = load_faiss_store(s3, VECTOR_S3_BUCKET, key_prefix, get_embeddings(), etag=etag)
+        size = estimate_store_bytes(vectorstore, include_vectors=not INDEX_STORE_MMAP)
+        attrs.update(rows=vectorstore.index.ntotal, bytes=size)
+
+    return index_cache.put(cache_key, vectorstore, size, tags=[(VECTOR_S3_BUCKET, key_prefix)])
 
 
 # Embedding 
 def embed_transcript_and_upload(docs: List[Document], key_prefix: str):
-    vectorstore = FAISS.from_documents(docs, bedrock_embeddings)
+    vectorstore = FAISS.from_documents(docs, get_embeddings())
     save_faiss_to_s3(vectorstore, key_prefix)
 
 # RAG Answering 
-def retrieve_context(key_prefix: str, question: str, k=5):
+def retrieve_context(key_prefix: str, question: str, k=RETRIEVAL_K):
     vectorstore = load_faiss_from_s3(key_prefix)
-    return vectorstore.similarity_search(question, k=k)
+    with span("faiss.search", k=k, hybrid=HYBRID_SEARCH):
+        return _search(vectorstore, key_prefix, question, k)
+
 
-def answer_question_rag(summary: str, docs: List[Document], question: str) -> str:
-    context_text = "\n\n".join([doc.page_content for doc in docs])
+def _search(vectorstore: FAISS, key_prefix: str, question: str, k: int):
+    if not HYBRID_SEARCH:
+        return vectorstore.similarity_search(question, k=k)
+
+    etag = index_cache.get_etag(s3, VECTOR_S3_BUCKET, f"{key_prefix}.index.faiss")
+    lexical = load_lexical_index(s3, vectorstore, VECTOR_S3_BUCKET, key_prefix, etag)
+    candidates = k * HYBRID_CANDIDATES
+    rankings = [
+        dense_ids(vectorstore, get_embeddings().embed_query(question), candidates),
+        lexical.search(question, candidates),
+    ]
+    return fused_documents(vectorstore, rankings, k)
+
+def _answer_body(summary, docs: List[Document], question: str) -> str:
+    # Deduplicated, reranked and packed under CONTEXT_TOKEN_BUDGET
+    summary_text, context_text = build_context(question, summary, docs)
     messages = [
         {
             "role": "user",
-            "content": PROMPT_TEMPLATE.format(summary=summary, context=context_text, question=question)
+            "content": PROMPT_TEMPLATE.format(summary=summary_text, context=context_text, question=question)
         }
     ]
 
@@ -102,18 +122,73 @@ def answer_question_rag(summary: str, docs: List[Document], question: str) -> st
         "top_p": 1,
         "anthropic_version": "bedrock-2023-05-31"
     }
+    return json.dumps(body)
 
+
+def answer_question_rag(summary, docs: List[Document], question: str, usage: dict = None) -> str:
+    """
+    summary is one file's summary, or {filename: summary} for KB questions.
+    """
+    started = time.perf_counter()
     try:
-        response = bedrock_runtime.invoke_model(
-            body=json.dumps(body),
+        with span("llm.answer", model=CLAUDE_MODEL_ID) as attrs:
+            response = bedrock_runtime.invoke_model(
+                body=_answer_body(summary, docs, question),
+                modelId=CLAUDE_MODEL_ID,
+                contentType="application/json",
+                accept="application/json"
+            )
+            response_body = json.loads(response["body"].read())
+            tokens = response_body.get("usage", {})
+            attrs.update(input_tokens=tokens.get("input_tokens"), output_tokens=tokens.get("output_tokens"))
+        logger.info("Claude answer: %d ms, %s in / %s out tokens", round((time.perf_counter() - started) * 1000),
+                    tokens.get("input_tokens"), tokens.get("output_tokens"))
+        if usage is not None:  # only filled in on success
+            usage.update(tokens)
+        return response_body.get("content", [{}])[0].get("text", "").strip()
+
+    except bedrock_runtime.exceptions.ThrottlingException as e:
+        return " Claude API is currently rate-limited. Please wait a few seconds and try again."
+    except Exception as e:
+        return f" An unexpected error occurred: {e}"
+
+
+def stream_answer_rag(summary, docs: List[Document], question: str, usage: dict = None) -> Iterator[str]:
+    """
+    Same answer as answer_question_rag, yielded as text deltas while Claude
+    generates it. Logs time-to-first-token and token usage per call; usage is
+    filled in once the stream has completed successfully.
+    """
+    started = time.perf_counter()
+    first_token_ms = None
+    try:
+        response = bedrock_runtime.invoke_model_with_response_stream(
+            body=_answer_body(summary, docs, question),
             modelId=CLAUDE_MODEL_ID,
             contentType="application/json",
             accept="application/json"
         )
-        response_body = json.loads(response["body"].read())
-        return response_body.get("content", [{}])[0].get("text", "").strip()
+        for event in response["body"]:
+            chunk = json.loads(event["chunk"]["bytes"]) if "chunk" in event else {}
+            if chunk.get("type") == "content_block_delta":
+                text = chunk.get("delta", {}).get("text", "")
+                if text:
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000)
+                        record_span("llm.first_token", first_token_ms / 1000, model=CLAUDE_MODEL_ID)
+                    yield text
+            elif chunk.get("type") == "message_stop":
+                metrics = chunk.get("amazon-bedrock-invocationMetrics", {})
+                record_span("llm.answer_stream", time.perf_counter() - started, model=CLAUDE_MODEL_ID,
+                            first_token_ms=first_token_ms, input_tokens=metrics.get("inputTokenCount"),
+                            output_tokens=metrics.get("outputTokenCount"))
+                if usage is not None:
+                    usage.update(input_tokens=metrics.get("inputTokenCount"), output_tokens=metrics.get("outputTokenCount"))
+                logger.info("Claude stream: first token %s ms, total %d ms, %s in / %s out tokens", first_token_ms,
+                            round((time.perf_counter() - started) * 1000),
+                            metrics.get("inputTokenCount"), metrics.get("outputTokenCount"))
 
     except bedrock_runtime.exceptions.ThrottlingException as e:
-        return " Claude API is currently rate-limited. Please wait a few seconds and try again."
+        yield " Claude API is currently rate-limited. Please wait a few seconds and try again."
     except Exception as e:
-        return f" An unexpected error occurred: {e}"
+        yield f" An unexpected error occurred: {e}"
@@ -0,0 +1,141 @@
+import logging
+import os
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from api.services.config import lazy_client
+from api.services.kb_config import KB_CONFIG
+from api.services.manifests import read_manifest, update_manifest
+
+logger = logging.getLogger(__name__)
+
+# Concurrent get_object calls when (re)building a summaries manifest
+SUMMARY_FETCH_WORKERS = int(os.getenv("SUMMARY_FETCH_WORKERS", "16"))
+SUMMARIES_MANIFEST_NAME = "_summaries.json"
+
+s3 = lazy_client("s3")
+
+
+def summaries_manifest_location(kb_id: str):
+    conf = KB_CONFIG[kb_id]
+    return conf["buckets"]["summaries"], f"{conf['prefix']}/{SUMMARIES_MANIFEST_NAME}"
+
+
+def is_summary_key(key: str) -> bool:
+    return key.endswith(".txt") or key.endswith(".md")
+
+
+def summary_record(kb_id: str, key: str, summary_text: str) -> dict:
+    """
+    The shape list_kb_summaries returns for one summary object.
+    """
+    prefix = KB_CONFIG[kb_id]["prefix"]
+
+    # Extract file_id by removing extension
+    file_id = key.split("/")[-1]
+    if file_id.endswith(".txt"):
+        file_id = file_id[:-4]
+    elif file_id.endswith(".md"):
+        file_id = file_id[:-3]
+
+    # Extract recording_id and title
+    if "_" in file_id:
+        recording_id = file_id.split("_")[0]
+        title = " ".join(file_id.split("_")[1:])
+    else:
+        recording_id = file_id
+        title = file_id
+
+    return {
+        "recording_id": recording_id,
+        "title": title,
+        "summary_markdown": summary_text,
+        "transcript_url": f"https://{KB_CONFIG[kb_id]['buckets']['transcripts']}.s3.amazonaws.com/{prefix}/{file_id}.txt",
+        "video_url": f"https://{KB_CONFIG[kb_id]['buckets']['uploads']}.s3.amazonaws.com/{prefix}/{file_id}.mp4"
+    }
+
+
+def list_summary_objects(bucket: str, prefix: str) -> list:
+    """
+    Every summary object under prefix, following list pagination past 1000 keys.
+    """
+    objects = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        objects.extend(obj for obj in page.get("Contents", []) if is_summary_key(obj["Key"]))
+    return objects
+
+
+def fetch_texts(bucket: str, keys: list, max_workers: int = SUMMARY_FETCH_WORKERS) -> list:
+    def fetch(key):
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+
+    if not keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        return list(pool.map(fetch, keys))
+
+
+def build_summaries_manifest(kb_id: str) -> dict:
+    """
+    Rebuild the KB's summaries manifest from the summary objects in S3.
+    """
+    bucket, manifest_key = summaries_manifest_location(kb_id)
+    objects = list_summary_objects(bucket, f"{KB_CONFIG[kb_id]['prefix']}/")
+    texts = fetch_texts(bucket, [obj["Key"] for obj in objects])
+    now = datetime.now(timezone.utc).isoformat()
+    entries = {
+        obj["Key"]: {"etag": obj["ETag"].strip('"'), "summary_markdown": text, "updated_at": now}
+        for obj, text in zip(objects, texts)
+    }
+    logger.info("Rebuilt summaries manifest for %s: %d summaries", kb_id, len(entries))
+    return update_manifest(s3, bucket, manifest_key, lambda _: {"version": 1, "summaries": entries})
+
+
+def record_summary(kb_id: str, key: str, summary_text: str, etag: str = None) -> dict:
+    """
+    Add or replace one summary in the KB's manifest (called on ingest).
+    """
+    bucket, manifest_key = summaries_manifest_location(kb_id)
+    if read_manifest(s3, bucket, manifest_key)[0] is None:
+        return build_summaries_manifest(kb_id)  # backfill; picks up this summary too
+
+    entry = {"etag": etag, "summary_markdown": summary_text, "updated_at": datetime.now(timezone.utc).isoformat()}
+
+    def add(manifest):
+        manifest = manifest or {"version": 1, "summaries": {}}
+        manifest["summaries"][key] = entry
+        return manifest
+
+    return update_manifest(s3, bucket, manifest_key, add)
+
+
+def list_kb_summaries(kb_id: str) -> list:
+    """
+    All summaries in a KB, served from the manifest (one conditional GET, or none
+    of the body when the local copy is current). Built on first use.
+    """
+    bucket, manifest_key = summaries_manifest_location(kb_id)
+    manifest, _ = read_manifest(s3, bucket, manifest_key)
+    if manifest is None:
+        manifest = build_summaries_manifest(kb_id)
+    return [
+        summary_record(kb_id, key, entry["summary_markdown"])
+        for key, entry in sorted(manifest["summaries"].items())
+    ]
+
+
+def load_summary_texts(kb_id: str, filenames: list, max_age: float = 0) -> dict:
+    """
+    {filename: summary} from this process's copy of the summaries manifest
+    ("" where a file has no summary). No per-file S3 requests.
+    """
+    bucket, manifest_key = summaries_manifest_location(kb_id)
+    manifest, _ = read_manifest(s3, bucket, manifest_key, max_age=max_age)
+    if manifest is None:
+        manifest = build_summaries_manifest(kb_id)
+    prefix = KB_CONFIG[kb_id]["prefix"]
+    entries = manifest["summaries"]
+    return {
+        filename: (entries.get(f"{prefix}/{filename}.md") or entries.get(f"{prefix}/{filename}.txt") or {})
+        .get("summary_markdown", "")
+        for filename in filenames
+    }
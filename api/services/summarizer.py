@@ -1,52 +1,109 @@
-import boto3
+import logging
 import json
 import os
+import time
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from .config import SUMMARY_BUCKET
-from api.services.config import get_aws_session
+from api.services.config import get_client, lazy_client
+from api.services.tokens import count_tokens, split_by_tokens
+from api.services.telemetry import span
 
-bedrock_runtime = boto3.client("bedrock-runtime", region_name="us-east-1")
+logger = logging.getLogger(__name__)
 
-def summarize_with_claude(transcript_text: str) -> str:
-    messages = [
-        {
-            "role": "user",
-            "content": (
-                "You are an AI assistant that formats meeting summaries into structured technical documentation.\n"
-                "Based on the meeting transcript below, extract:\n"
-                "- **Title** of the meeting (e.g., PWC PO Readout)\n"
-                "- **Date** of the meeting\n"
-                "- **Purpose** of the meeting\n"
-                "- **Key Areas** discussed (as bullet points)\n"
-                "- **Pain Points**, **Desired Functionality**, **Data Inputs/Outputs**, **Open Questions** (if mentioned)\n"
-                "- **Process Flow** steps if any were discussed\n\n"
-                "Format the entire response using markdown headings and indentation.\n\n"
-                f"{transcript_text}"
-            )
-        }
-    ]
+SUMMARY_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+# Transcripts above SUMMARY_SINGLE_PASS_TOKENS are summarized map-reduce style:
+# sections of SUMMARY_SECTION_TOKENS are condensed in parallel, then merged.
+SUMMARY_SINGLE_PASS_TOKENS = int(os.getenv("SUMMARY_SINGLE_PASS_TOKENS", "60000"))
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "12000"))
+SUMMARY_SECTION_OVERLAP_TOKENS = int(os.getenv("SUMMARY_SECTION_OVERLAP_TOKENS", "200"))
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
+
+bedrock_runtime = lazy_client(
+    "bedrock-runtime",
+    default_chain=True,
+    config=Config(retries={"max_attempts": 8, "mode": "adaptive"}, max_pool_connections=max(10, SUMMARY_MAX_WORKERS)),
+)
+
+SUMMARY_INSTRUCTIONS = (
+    "You are an AI assistant that formats meeting summaries into structured technical documentation.\n"
+    "Based on the meeting {source} below, extract:\n"
+    "- **Title** of the meeting (e.g., PWC PO Readout)\n"
+    "- **Date** of the meeting\n"
+    "- **Purpose** of the meeting\n"
+    "- **Key Areas** discussed (as bullet points)\n"
+    "- **Pain Points**, **Desired Functionality**, **Data Inputs/Outputs**, **Open Questions** (if mentioned)\n"
+    "- **Process Flow** steps if any were discussed\n\n"
+    "Format the entire response using markdown headings and indentation.\n\n"
+)
+
+SECTION_INSTRUCTIONS = (
+    "You are condensing part {part} of {total} of a long meeting transcript so the parts can be "
+    "combined into one summary later.\n"
+    "Write concise markdown notes covering everything this part mentions about: the meeting title and date, "
+    "its purpose, key areas discussed, pain points, desired functionality, data inputs/outputs, open questions "
+    "and process flow steps. Keep names, numbers and decisions; skip small talk. "
+    "Do not invent a heading for anything this part does not mention.\n\n"
+)
 
+
+def _invoke_claude(prompt: str, max_tokens: int = 2048) -> str:
     body = {
-        "messages": messages,
-        "max_tokens": 2048,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
         "temperature": 0.4,
         "top_p": 1,
         "anthropic_version": "bedrock-2023-05-31"
     }
 
-    response = bedrock_runtime.invoke_model(
-        body=json.dumps(body),
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        contentType="application/json",
-        accept="application/json"
-    )
-
-    response_body = json.loads(response["body"].read())
+    with span("llm.summarize", model=SUMMARY_MODEL_ID) as attrs:
+        response = bedrock_runtime.invoke_model(
+            body=json.dumps(body),
+            modelId=SUMMARY_MODEL_ID,
+            contentType="application/json",
+            accept="application/json"
+        )
+        response_body = json.loads(response["body"].read())
+        usage = response_body.get("usage", {})
+        attrs.update(input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"))
     return response_body.get("content", [{}])[0].get("text", "").strip()
 
-    
+
+def _summarize_sections(sections: list) -> list:
+    """
+    Map step: condense every section concurrently. Latency is bounded by the
+    slowest section rather than the transcript length.
+    """
+    total = len(sections)
+    prompts = [SECTION_INSTRUCTIONS.format(part=i + 1, total=total) + section for i, section in enumerate(sections)]
+    with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAX_WORKERS, total))) as pool:
+        return list(pool.map(_invoke_claude, prompts))
+
+
+def summarize_with_claude(transcript_text: str) -> str:
+    if count_tokens(transcript_text) <= SUMMARY_SINGLE_PASS_TOKENS:
+        return _invoke_claude(SUMMARY_INSTRUCTIONS.format(source="transcript") + transcript_text)
+
+    # Map: section notes; repeat on the notes themselves if they are still too long
+    notes = transcript_text
+    rounds = 0
+    while count_tokens(notes) > SUMMARY_SINGLE_PASS_TOKENS:
+        sections = split_by_tokens(notes, SUMMARY_SECTION_TOKENS, SUMMARY_SECTION_OVERLAP_TOKENS)
+        started = time.perf_counter()
+        section_notes = _summarize_sections(sections)
+        rounds += 1
+        logger.debug("Summarized %d sections in %.1fs (round %d)", len(sections), time.perf_counter() - started, rounds)
+        condensed = "\n\n".join(f"## Part {i + 1}\n{text}" for i, text in enumerate(section_notes))
+        if count_tokens(condensed) >= count_tokens(notes):
+            break  # not shrinking (tiny SUMMARY_SECTION_TOKENS); reduce what we have
+        notes = condensed
+
+    # Reduce: the usual summary prompt over the ordered section notes
+    return _invoke_claude(SUMMARY_INSTRUCTIONS.format(source="notes (taken from consecutive parts of the transcript)") + notes)
+
 
 def upload_summary_to_s3(summary: str, filename: str, key_prefix: str = "") -> str:
-    s3 = get_aws_session().client("s3")
+    s3 = get_client("s3")
     filename = os.path.basename(filename)  # removes any subfolder path
     full_key = f"{key_prefix}/{filename}" if key_prefix else filename
     s3.put_object(Bucket=SUMMARY_BUCKET, Key=full_key, Body=summary.encode("utf-8"))
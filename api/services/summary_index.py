@@ -0,0 +1,145 @@
+import os
+import re
+import base64
+import numpy as np
+from api.services.config import lazy_client
+from api.services.kb_config import KB_CONFIG
+from api.services.manifests import read_manifest, update_manifest
+from api.services.index_cache import index_cache
+from api.services.kb_manifest import KB_MANIFEST_MAX_AGE
+from api.services.tokens import split_by_tokens
+from api.services.summaries import summaries_manifest_location, build_summaries_manifest
+
+# Summaries are split into sections (markdown headings, capped in size) that are
+# embedded at ingest and kept in a per-KB manifest next to the summaries. A
+# question then pulls in only its best-matching sections, scored locally
+# against the question vector, instead of every selected file's full summary.
+SUMMARY_SECTIONS_MANIFEST_NAME = "_summary_sections.json"
+# Sections put in the prompt per question (0 = every selected file's full summary)
+SUMMARY_TOP_SECTIONS = int(os.getenv("SUMMARY_TOP_SECTIONS", "8"))
+SUMMARY_SECTION_MAX_TOKENS = 300
+
+HEADING_RE = re.compile(r"^#{1,6}\s", re.MULTILINE)
+
+s3 = lazy_client("s3")
+
+
+def summary_sections_location(kb_id: str):
+    conf = KB_CONFIG[kb_id]
+    return conf["buckets"]["summaries"], f"{conf['prefix']}/{SUMMARY_SECTIONS_MANIFEST_NAME}"
+
+
+def split_summary_sections(summary_text: str) -> list:
+    """
+    Split a markdown summary at its headings; long sections are cut on line boundaries.
+    """
+    starts = [m.start() for m in HEADING_RE.finditer(summary_text)]
+    bounds = [0] + [start for start in starts if start > 0] + [len(summary_text)]
+    sections = []
+    for start, end in zip(bounds, bounds[1:]):
+        for piece in split_by_tokens(summary_text[start:end], SUMMARY_SECTION_MAX_TOKENS):
+            if piece.strip():
+                sections.append(piece.strip())
+    return sections
+
+
+def _encode(vectors: np.ndarray) -> str:
+    return base64.b64encode(vectors.astype(np.float16).tobytes()).decode("ascii")
+
+
+def record_summary_sections(kb_id: str, filename: str, summary_text: str, embeddings, etag: str = None) -> int:
+    """
+    Embed a file's summary sections and add them to the KB's sections manifest
+    (called on ingest). Returns the number of sections.
+    """
+    sections = split_summary_sections(summary_text)
+    vectors = np.asarray(embeddings.embed_documents(sections), dtype=np.float32) if sections else np.zeros((0, 0))
+    if len(vectors):
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    entry = {"etag": etag, "sections": sections, "dim": int(vectors.shape[1]) if len(vectors) else 0,
+             "vectors": _encode(vectors)}
+
+    def add(manifest):
+        manifest = manifest or {"version": 1, "files": {}}
+        manifest["files"][filename] = entry
+        return manifest
+
+    bucket, key = summary_sections_location(kb_id)
+    update_manifest(s3, bucket, key, add)
+    return len(sections)
+
+
+def sync_summary_sections(kb_id: str, embeddings) -> int:
+    """
+    Section and embed every summary the sections manifest lacks or holds an
+    older version of (summaries ingested before sections were indexed, or
+    edited out of band). Returns the number of summaries (re)indexed.
+    """
+    summaries = (read_manifest(s3, *summaries_manifest_location(kb_id))[0] or build_summaries_manifest(kb_id))["summaries"]
+    bucket, key = summary_sections_location(kb_id)
+    indexed = (read_manifest(s3, bucket, key)[0] or {"files": {}})["files"]
+    prefix = KB_CONFIG[kb_id]["prefix"]
+
+    count = 0
+    for summary_key, entry in sorted(summaries.items()):
+        filename = summary_key[len(prefix) + 1:].rsplit(".", 1)[0]
+        if indexed.get(filename, {}).get("etag") != entry["etag"]:
+            record_summary_sections(kb_id, filename, entry["summary_markdown"], embeddings, etag=entry["etag"])
+            count += 1
+    return count
+
+
+class SummarySections:
+    """
+    A KB's summary sections as one normalized float32 matrix, rows grouped by file.
+    """
+
+    def __init__(self, manifest: dict):
+        self.texts, self.files, blocks = [], [], []
+        for filename, entry in sorted(manifest["files"].items()):
+            if not entry["sections"]:
+                continue
+            vectors = np.frombuffer(base64.b64decode(entry["vectors"]), dtype=np.float16)
+            blocks.append(vectors.reshape(len(entry["sections"]), entry["dim"]).astype(np.float32))
+            self.texts.extend(entry["sections"])
+            self.files.extend([filename] * len(entry["sections"]))
+        self.vectors = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        self.file_ids = set(self.files)
+        self._files = np.array(self.files, dtype=object)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + sum(len(text) for text in self.texts) + 64 * len(self.texts)
+
+    def top_sections(self, question_vector, filenames, k: int) -> dict:
+        """
+        {filename: its best-matching sections, in summary order} for the k sections
+        of the selected files most similar to the (normalized) question vector.
+        """
+        rows = np.flatnonzero(np.isin(self._files, list(filenames))) if len(self.texts) else np.zeros(0, int)
+        if not len(rows):
+            return {}
+        scores = self.vectors[rows] @ np.asarray(question_vector, dtype=np.float32)
+        best = rows[np.argsort(-scores, kind="stable")[:k]]
+        selected = {}
+        for row in sorted(best):
+            selected.setdefault(self.files[row], []).append(self.texts[row])
+        ranked = [self.files[row] for row in best]
+        return {name: "\n\n".join(selected[name]) for name in sorted(selected, key=ranked.index)}
+
+
+def load_summary_sections(kb_id: str, max_age: float = KB_MANIFEST_MAX_AGE):
+    """
+    The KB's SummarySections from this process's copy of the manifest (None if
+    no summary has been sectioned yet), rebuilt only when the manifest changes.
+    """
+    bucket, key = summary_sections_location(kb_id)
+    manifest, etag = read_manifest(s3, bucket, key, max_age=max_age)
+    if manifest is None:
+        return None
+    cache_key = ("summary_sections", bucket, etag)
+    sections = index_cache.get(cache_key)
+    if sections is None:
+        sections = SummarySections(manifest)
+        index_cache.put(cache_key, sections, sections.nbytes, tags=[(bucket, key)])
+    return sections
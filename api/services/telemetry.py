@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Timing spans around each stage of a request or ingest job (S3 calls, the
+# Transcribe wait, summarize, chunk, embed, FAISS load/merge/search, LLM calls).
+# Every span feeds a per-process Prometheus registry served at /metrics; spans
+# are also written as one JSON line each, by default only for requests that
+# opted in with an X-Trace-Id header ("traced"), or always ("all") or never ("off").
+# Span lines and the services' log records share one JSON-lines stream
+# (JsonLogFormatter, configured in settings.LOGGING).
+SPAN_LOGS = os.getenv("SPAN_LOGS", "traced")
+TRACE_HEADER = "X-Trace-Id"
+TRACE_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Histogram buckets (seconds): S3 calls at the bottom, Transcribe waits at the top
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+TOKEN_ATTRS = {"tokens": "total", "input_tokens": "input", "output_tokens": "output"}
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+span_logger = logging.getLogger("api.spans")
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def valid_trace_id(value) -> bool:
+    return bool(value) and bool(TRACE_ID_RE.match(value))
+
+
+@contextmanager
+def trace(trace_id):
+    """
+    Attach trace_id to every span recorded in this context (a request, or an
+    ingest job on a worker thread).
+    """
+    token = _trace_id.set(trace_id if valid_trace_id(trace_id) else None)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+
+class SpanMetrics:
+    """
+    Per-span duration histograms plus byte and token counters, rendered in the
+    Prometheus text format. Counts are per process.
+    """
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._durations = {}  # (span, status) -> [bucket counts..., sum, count]
+        self._bytes = {}  # span -> bytes
+        self._tokens = {}  # (span, kind) -> tokens
+
+    def observe(self, name: str, seconds: float, status: str, attrs: dict):
+        with self._lock:
+            series = self._durations.setdefault((name, status), [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+            if attrs.get("bytes"):
+                self._bytes[name] = self._bytes.get(name, 0) + int(attrs["bytes"])
+            for attr, kind in TOKEN_ATTRS.items():
+                if attrs.get(attr):
+                    self._tokens[(name, kind)] = self._tokens.get((name, kind), 0) + int(attrs[attr])
+
+    def render(self) -> str:
+        with self._lock:
+            durations = {key: list(series) for key, series in self._durations.items()}
+            byte_counts, token_counts = dict(self._bytes), dict(self._tokens)
+
+        lines = [
+            "# HELP aima_span_seconds Time spent in each instrumented stage.",
+            "# TYPE aima_span_seconds histogram",
+        ]
+        for (name, status), series in sorted(durations.items()):
+            labels = f'span="{_escape(name)}",status="{status}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'aima_span_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'aima_span_seconds_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f"aima_span_seconds_sum{{{labels}}} {series[-2]:.6f}")
+            lines.append(f"aima_span_seconds_count{{{labels}}} {series[-1]}")
+
+        lines += ["# HELP aima_span_bytes_total Bytes read or written by each stage.",
+                  "# TYPE aima_span_bytes_total counter"]
+        lines += [f'aima_span_bytes_total{{span="{_escape(name)}"}} {count}' for name, count in sorted(byte_counts.items())]
+        lines += ["# HELP aima_span_tokens_total Model tokens consumed by each stage.",
+                  "# TYPE aima_span_tokens_total counter"]
+        lines += [
+            f'aima_span_tokens_total{{span="{_escape(name)}",kind="{kind}"}} {count}'
+            for (name, kind), count in sorted(token_counts.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._bytes.clear()
+            self._tokens.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+span_metrics = SpanMetrics()
+
+
+def record_span(name: str, seconds: float, status: str = "ok", **attrs):
+    """
+    Record a finished span: metrics always, a JSON log line per SPAN_LOGS.
+    """
+    span_metrics.observe(name, seconds, status, attrs)
+    trace_id = current_trace_id()
+    if SPAN_LOGS == "all" or (SPAN_LOGS == "traced" and trace_id):
+        span_logger.info(name, extra={"json_fields": {
+            "type": "span",
+            "span": name,
+            "status": status,
+            "duration_ms": round(seconds * 1000, 2),
+            "trace_id": trace_id,
+            **attrs,
+        }})
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    One JSON object per record: ts, level, logger, message, trace_id and thread,
+    plus the record's json_fields (span lines carry their timing that way).
+    """
+
+    def format(self, record) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "type": "log",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": current_trace_id(),
+            "thread": record.threadName,
+        }
+        entry.update(getattr(record, "json_fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time the block as span name. Yields the attrs dict so the block can add
+    counts it only knows at the end (bytes, tokens, hits).
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_span(name, time.perf_counter() - started, status, **attrs)
+
+
+def _before_call(model, params, context, **kwargs):
+    context["span_name"] = f"{model.service_model.service_name}.{model.name}"
+    context["span_started"] = time.perf_counter()
+    body = params.get("Body")
+    if isinstance(body, (bytes, bytearray)):
+        context["span_bytes"] = len(body)
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    started = context.pop("span_started", None)
+    if started is None:
+        return
+    attrs = {}
+    size = context.get("span_bytes") or (parsed.get("ContentLength") if context["span_name"] == "s3.GetObject" else None)
+    if size:
+        attrs["bytes"] = size
+    status = "ok" if http_response.status_code < 400 else "error"
+    record_span(context["span_name"], time.perf_counter() - started, status, **attrs)
+
+
+def _after_call_error(context, **kwargs):
+    started = context.pop("span_started", None)
+    if started is not None:
+        record_span(context["span_name"], time.perf_counter() - started, "error")
+
+
+def instrument_client(client):
+    """
+    Record a span for every API call the boto3 client makes (e.g. s3.GetObject).
+    """
+    events = client.meta.events
+    events.register("before-call", _before_call)
+    events.register("after-call", _after_call)
+    events.register("after-call-error", _after_call_error)
+    return client
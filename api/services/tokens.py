@@ -0,0 +1,57 @@
+import os
+import re
+
+# Claude's tokenizer isn't published; ~4 characters per token is close enough
+# for English transcripts to size prompts against the context window.
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+
+
+def count_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN + 0.999)
+
+
+def _split_long_piece(piece: str, max_chars: int) -> list:
+    parts = []
+    while len(piece) > max_chars:
+        cut = piece.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(piece[:cut])
+        piece = piece[cut:]
+    parts.append(piece)
+    return parts
+
+
+def split_by_tokens(text: str, max_tokens: int, overlap_tokens: int = 0) -> list:
+    """
+    Split text into pieces of at most max_tokens, breaking on line boundaries
+    (speaker turns in a transcript) where possible. Each piece repeats roughly
+    overlap_tokens from the end of the previous one.
+    """
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    overlap_chars = int(overlap_tokens * CHARS_PER_TOKEN)
+
+    pieces = []
+    for line in re.split(r"(?<=\n)", text):
+        pieces.extend(_split_long_piece(line, max_chars) if len(line) > max_chars else [line])
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        if current and size + len(piece) > max_chars:
+            chunks.append("".join(current))
+            # carry the tail of this chunk into the next for continuity
+            carried, carried_size = [], 0
+            for prev in reversed(current):
+                if carried_size + len(prev) > overlap_chars:
+                    break
+                carried.insert(0, prev)
+                carried_size += len(prev)
+            if carried_size + len(piece) > max_chars:
+                carried, carried_size = [], 0
+            current, size = carried, carried_size
+        current.append(piece)
+        size += len(piece)
+
+    if current and "".join(current).strip():
+        chunks.append("".join(current))
+    return chunks
@@ -1,85 +1,351 @@
 import boto3
+import os
 import time
 import uuid
 import json
 import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from .summarizer import summarize_with_claude, upload_summary_to_s3
-from api.services.config import get_aws_session
+from api.services.config import get_client
 
 from .config import SUMMARY_BUCKET
- 
+
+logger = logging.getLogger(__name__)
+
 boto3.set_stream_logger('boto3.resources', logging.INFO)
 
+# Poll backoff for outstanding Transcribe jobs (seconds)
+TRANSCRIBE_POLL_MIN = float(os.getenv("TRANSCRIBE_POLL_MIN", "5"))
+TRANSCRIBE_POLL_MAX = float(os.getenv("TRANSCRIBE_POLL_MAX", "60"))
+TRANSCRIBE_MAX_WAIT = float(os.getenv("TRANSCRIBE_MAX_WAIT", str(2 * 60 * 60)))
+# Point at a local stub Transcribe service (e.g. `moto_server`) for testing
+TRANSCRIBE_ENDPOINT_URL = os.getenv("TRANSCRIBE_ENDPOINT_URL")
+# Optional SQS queue receiving s3:ObjectCreated events for the transcript output bucket
+TRANSCRIBE_EVENTS_QUEUE_URL = os.getenv("TRANSCRIBE_EVENTS_QUEUE_URL")
+# Events for jobs another process is watching go back on the queue after this
+# many seconds; after TRANSCRIBE_EVENTS_MAX_RECEIVES receives nobody is (the
+# poller completed the job first, or its process died) and the event is dropped.
+TRANSCRIBE_EVENTS_RETRY_DELAY = 5
+TRANSCRIBE_EVENTS_MAX_RECEIVES = int(os.getenv("TRANSCRIBE_EVENTS_MAX_RECEIVES", "10"))
+# Threads running job callbacks, so a slow callback never holds up the poller
+TRANSCRIBE_CALLBACK_WORKERS = 4
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+
 def sanitize_job_name(name: str) -> str:
     return re.sub(r"[^a-zA-Z0-9._-]", "-", name)
- 
-def transcribe_amazon(audio_s3_uri, output_bucket, output_key=None, key_prefix="", media_format="mp4", language_code="en-US"):
-    transcribe = boto3.client("transcribe")
-    s3 = get_aws_session().client("s3")
 
+
+def make_job_name(output_key=None) -> str:
     if output_key is None:
-        job_name = f"transcription-job-{uuid.uuid4()}"
-    else:
-        base_name = sanitize_job_name(output_key.rsplit(".", 1)[0])
-        job_name = f"{base_name}-{uuid.uuid4().hex[:8]}"
+        return f"transcription-job-{uuid.uuid4()}"
+    base_name = sanitize_job_name(output_key.rsplit(".", 1)[0])
+    return f"{base_name}-{uuid.uuid4().hex[:8]}"
 
-    result_key = f"{job_name}.json"
 
-    print(f"Starting transcription job: {job_name}")
+class TranscriptionManager:
+    """
+    Tracks every outstanding Transcribe job in the process from one poller thread.
 
-    try:
-        transcribe.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={"MediaFileUri": audio_s3_uri},
-            MediaFormat=media_format,
-            LanguageCode=language_code,
-            OutputBucketName=output_bucket
+    Due jobs are checked together with list_transcription_jobs (one call per page
+    instead of one get per job), each job backs off exponentially while it is still
+    running, and S3 output-object notifications can complete a job before its next
+    poll. Callbacks run as callback(job_name, status, reason) on a small pool of
+    callback threads, off the poller and events threads.
+    """
+
+    def __init__(self, client=None, min_interval=TRANSCRIBE_POLL_MIN, max_interval=TRANSCRIBE_POLL_MAX,
+                 max_wait=TRANSCRIBE_MAX_WAIT, backoff=1.5):
+        self.client = client or get_client("transcribe", default_chain=True, endpoint_url=TRANSCRIBE_ENDPOINT_URL)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self._jobs = {}  # job_name -> state dict
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._events_thread = None
+        self._callbacks = ThreadPoolExecutor(max_workers=TRANSCRIBE_CALLBACK_WORKERS, thread_name_prefix="transcribe-callback")
+        self.stats = {"list_calls": 0, "get_calls": 0, "completed": 0, "failed": 0, "notified": 0}
+
+    def start_job(self, audio_s3_uri, output_bucket, callback, output_key=None, media_format="mp4",
+                  language_code="en-US") -> str:
+        job_name = make_job_name(output_key)
+        logger.info("Starting transcription job: %s", job_name)
+        try:
+            self.client.start_transcription_job(
+                TranscriptionJobName=job_name,
+                Media={"MediaFileUri": audio_s3_uri},
+                MediaFormat=media_format,
+                LanguageCode=language_code,
+                OutputBucketName=output_bucket
+            )
+        except Exception:
+            logger.exception("Failed to start transcription job %s", job_name)
+            raise
+        self.track(job_name, callback)
+        return job_name
+
+    def track(self, job_name: str, callback):
+        now = time.time()
+        with self._lock:
+            state = self._jobs.setdefault(job_name, {
+                "callbacks": [], "started": now, "interval": self.min_interval,
+                "next_check": now + self.min_interval, "missed_lists": 0,
+            })
+            state["callbacks"].append(callback)
+        self._ensure_threads()
+        self._wakeup.set()
+
+    def pending(self) -> list:
+        with self._lock:
+            return list(self._jobs)
+
+    def notify_output_object(self, bucket: str, key: str) -> bool:
+        """
+        Complete a job from an S3 ObjectCreated event on its <job_name>.json output.
+        """
+        job_name = os.path.basename(key)
+        if not job_name.endswith(".json"):
+            return False
+        job_name = job_name[:-len(".json")]
+        with self._lock:
+            if job_name not in self._jobs:
+                return False
+            self.stats["notified"] += 1
+        self._complete(job_name, "COMPLETED", None)
+        return True
+
+    def _complete(self, job_name: str, status: str, reason):
+        with self._lock:
+            state = self._jobs.pop(job_name, None)
+            if state is None:
+                return
+            self.stats["completed" if status == "COMPLETED" else "failed"] += 1
+        logger.info("Transcription job %s finished: %s after %.0fs", job_name, status, time.time() - state["started"])
+        for callback in state["callbacks"]:
+            self._callbacks.submit(self._run_callback, callback, job_name, status, reason)
+
+    @staticmethod
+    def _run_callback(callback, job_name: str, status: str, reason):
+        try:
+            callback(job_name, status, reason)
+        except Exception:
+            logger.exception("Transcription callback for %s failed", job_name)
+
+    def _statuses(self, due: list) -> dict:
+        """
+        Look up terminal statuses for the due jobs. A single job is one get; several
+        are coalesced into list calls, walking newest-first until every due job is
+        found or the listing is older than the oldest of them. Jobs that list rounds
+        keep missing are confirmed with a direct get.
+        """
+        if len(due) == 1:
+            self.stats["get_calls"] += 1
+            job = self.client.get_transcription_job(TranscriptionJobName=due[0])["TranscriptionJob"]
+            return {due[0]: (job["TranscriptionJobStatus"], job.get("FailureReason"))}
+
+        with self._lock:
+            oldest = min(self._jobs[name]["started"] for name in due if name in self._jobs) - 60
+        wanted, found = set(due), {}
+        for status in TERMINAL_STATUSES:
+            kwargs = {"Status": status, "MaxResults": 100}
+            while wanted - set(found):
+                self.stats["list_calls"] += 1
+                page = self.client.list_transcription_jobs(**kwargs)
+                summaries = page.get("TranscriptionJobSummaries", [])
+                for summary in summaries:
+                    if summary["TranscriptionJobName"] in wanted:
+                        found[summary["TranscriptionJobName"]] = (status, summary.get("FailureReason"))
+                if not page.get("NextToken") or any(
+                    s["CreationTime"].timestamp() < oldest for s in summaries if "CreationTime" in s
+                ):
+                    break
+                kwargs["NextToken"] = page["NextToken"]
+
+        for name in wanted - set(found):
+            with self._lock:
+                state = self._jobs.get(name)
+                if state is None:
+                    continue
+                state["missed_lists"] += 1
+                confirm = state["missed_lists"] >= 5
+            if confirm:
+                self.stats["get_calls"] += 1
+                job = self.client.get_transcription_job(TranscriptionJobName=name)["TranscriptionJob"]
+                found[name] = (job["TranscriptionJobStatus"], job.get("FailureReason"))
+                with self._lock:
+                    if name in self._jobs:
+                        self._jobs[name]["missed_lists"] = 0
+        return found
+
+    def poll_once(self) -> float:
+        """
+        Check every job that is due; returns seconds until the next one is.
+        """
+        now = time.time()
+        with self._lock:
+            due = [name for name, state in self._jobs.items() if state["next_check"] <= now]
+
+        if due:
+            try:
+                statuses = self._statuses(due)
+            except Exception as e:
+                logger.warning("Transcription status lookup failed: %s", e)
+                statuses = {}
+
+            for name in due:
+                status, reason = statuses.get(name, ("IN_PROGRESS", None))
+                if status in TERMINAL_STATUSES:
+                    self._complete(name, status, reason)
+                    continue
+                with self._lock:
+                    state = self._jobs.get(name)
+                    if state is None:
+                        continue
+                    if now - state["started"] > self.max_wait:
+                        timed_out = True
+                    else:
+                        timed_out = False
+                        state["interval"] = min(state["interval"] * self.backoff, self.max_interval)
+                        state["next_check"] = now + state["interval"]
+                if timed_out:
+                    self._complete(name, "FAILED", f"Timed out after {self.max_wait:.0f} seconds")
+
+        with self._lock:
+            if not self._jobs:
+                return self.max_interval
+            return max(0.0, min(state["next_check"] for state in self._jobs.values()) - time.time())
+
+    def _run(self):
+        while True:
+            delay = self.poll_once()
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def _run_events(self):
+        sqs = get_client("sqs", default_chain=True)
+        while True:
+            try:
+                self.poll_events_once(sqs)
+            except Exception as e:
+                logger.warning("Could not read transcription events: %s", e)
+                time.sleep(self.max_interval)
+
+    def poll_events_once(self, sqs, queue_url: str = None, wait_seconds: int = 20) -> int:
+        """
+        Receive one batch of S3 events and complete the jobs they name. Returns
+        the number of messages handled (deleted).
+        """
+        queue_url = queue_url or TRANSCRIBE_EVENTS_QUEUE_URL
+        response = sqs.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=wait_seconds,
+            AttributeNames=["ApproximateReceiveCount"],
         )
-    except Exception as e:
-        print(f"Failed to start transcription job: {e}")
-        raise
+        handled = 0
+        for message in response.get("Messages", []):
+            receives = int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1))
+            if self._handle_event(message["Body"]) or receives >= TRANSCRIBE_EVENTS_MAX_RECEIVES:
+                sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"])
+                handled += 1
+            else:
+                # Another process may be watching the job; let it see the event soon
+                sqs.change_message_visibility(QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"],
+                                              VisibilityTimeout=TRANSCRIBE_EVENTS_RETRY_DELAY)
+        return handled
+
+    def _handle_event(self, body: str) -> bool:
+        """
+        Complete the jobs an S3 event message names. False if it names a
+        transcript output this process isn't watching, so the message stays queued.
+        """
+        try:
+            body = json.loads(body)
+            if "Message" in body:  # delivered through SNS
+                body = json.loads(body["Message"])
+            outputs = [
+                (record["s3"]["bucket"]["name"], record["s3"]["object"]["key"])
+                for record in body.get("Records", []) if "s3" in record
+            ]
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning("Dropping malformed transcription event: %s", e)
+            return True
+
+        done = True
+        for bucket, key in outputs:
+            if key.endswith(".json") and not self.notify_output_object(bucket, key):
+                done = False
+        return done
+
+    def _ensure_threads(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="transcribe-poller", daemon=True)
+                self._thread.start()
+            if TRANSCRIBE_EVENTS_QUEUE_URL and self._events_thread is None:
+                self._events_thread = threading.Thread(target=self._run_events, name="transcribe-events", daemon=True)
+                self._events_thread.start()
 
-    max_wait_time = 600  # seconds (10 minutes max)
-    poll_interval = 5    # seconds
-    max_attempts = max_wait_time // poll_interval
 
-    for attempt in range(max_attempts):
-        status = transcribe.get_transcription_job(TranscriptionJobName=job_name)
-        job_status = status["TranscriptionJob"]["TranscriptionJobStatus"]
-        print(f"[Attempt {attempt+1}] Transcription job status: {job_status}")
+_manager = None
+_manager_lock = threading.Lock()
 
-        if job_status == "COMPLETED":
-            break
-        elif job_status == "FAILED":
-            raise Exception("Transcription job failed.")
 
-        time.sleep(poll_interval)
-    else:
-        # Loop finished without breaking (i.e., timeout)
-        raise TimeoutError(f"Transcription job timed out after {max_wait_time} seconds.")
+def transcription_manager() -> TranscriptionManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = TranscriptionManager()
+        return _manager
 
 
-    if job_status == "FAILED":
-        raise Exception("Transcription job failed.")
+def fetch_transcript_text(output_bucket: str, job_name: str) -> str:
+    s3 = get_client("s3")
+    result_key = f"{job_name}.json"
 
-    print("Transcription job completed. Fetching transcript from S3...")
+    logger.debug("Fetching transcript %s from s3://%s", result_key, output_bucket)
 
     try:
         obj = s3.get_object(Bucket=output_bucket, Key= result_key)
         transcript_json = json.load(obj["Body"])
         transcript_text = transcript_json["results"]["transcripts"][0]["transcript"]
-    except Exception as e:
-        print(f"Error reading transcript from S3: {e}")
+    except Exception:
+        logger.exception("Could not read transcript s3://%s/%s", output_bucket, result_key)
         raise
 
-    print("Generating summary...")
-
     # DELETE raw .json to avoid clutter
     try:
         s3.delete_object(Bucket=output_bucket, Key=result_key)
-        print(f"[CLEANUP] Deleted raw transcript JSON: {result_key}")
+        logger.debug("Deleted raw transcript JSON: %s", result_key)
     except Exception as e:
-        print(f"[WARNING] Could not delete raw JSON: {e}")
+        logger.warning("Could not delete raw transcript JSON %s: %s", result_key, e)
+
+    return transcript_text
+
+
+def transcribe_amazon(audio_s3_uri, output_bucket, output_key=None, key_prefix="", media_format="mp4", language_code="en-US"):
+    """
+    Blocking helper for scripts. The ingest pipeline uses transcription_manager()
+    directly so no worker thread waits on Transcribe.
+    """
+    done = threading.Event()
+    outcome = {}
+
+    def on_done(job_name, status, reason):
+        outcome.update(status=status, reason=reason)
+        done.set()
+
+    job_name = transcription_manager().start_job(
+        audio_s3_uri, output_bucket, on_done, output_key=output_key,
+        media_format=media_format, language_code=language_code,
+    )
+    done.wait()
+
+    if outcome["status"] != "COMPLETED":
+        raise Exception(f"Transcription job failed: {outcome['reason']}")
 
-    return transcript_text # Or return both transcript_text, summary_s3_uri
\ No newline at end of file
+    return fetch_transcript_text(output_bucket, job_name)
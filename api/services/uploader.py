@@ -1,11 +1,24 @@
-from api.services.config import get_aws_session
+from api.services.config import lazy_client
 from api.services.docx_parser import convert_docx_to_clean_text
-from .config import UPLOAD_BUCKET, AWS_REGION
-import boto3
-from botocore.exceptions import NoCredentialsError, ClientError
+from .config import UPLOAD_BUCKET
+import os
+import logging
+from boto3.s3.transfer import TransferConfig
 
-session = get_aws_session()
-s3_client = session.client("s3")
+logger = logging.getLogger(__name__)
+
+s3_client = lazy_client("s3")
+
+# Large uploads go up as multipart with parts sent in parallel, read straight
+# from the staged file so memory use stays at max_concurrency * chunksize.
+UPLOAD_MULTIPART_CHUNK_MB = int(os.getenv("UPLOAD_MULTIPART_CHUNK_MB", "16"))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "8"))
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=UPLOAD_MULTIPART_CHUNK_MB * 1024 * 1024,
+    max_concurrency=UPLOAD_MAX_CONCURRENCY,
+    use_threads=True,
+)
 
 def upload_file_to_s3(file, filename: str, content_type: str) -> str:
     try:
@@ -13,17 +26,76 @@ def upload_file_to_s3(file, filename: str, content_type: str) -> str:
             file,
             UPLOAD_BUCKET,
             filename,
-            ExtraArgs={"ContentType": content_type}
+            ExtraArgs={"ContentType": content_type},
+            Config=TRANSFER_CONFIG,
         )
         s3_uri = f"s3://{UPLOAD_BUCKET}/{filename}"
-        print(f"[DEBUG] Uploaded to S3: {s3_uri}")
+        logger.debug("Uploaded to S3: %s", s3_uri)
         return s3_uri
-    except Exception as e:
-        print(f"[ERROR] Upload failed: {e}")
+    except Exception:
+        logger.exception("Upload to s3://%s/%s failed", UPLOAD_BUCKET, filename)
         return False
 
+# Direct-to-S3 uploads: the client PUTs parts to presigned URLs, so file bytes
+# never pass through the app server.
+PRESIGNED_URL_EXPIRES = int(os.getenv("PRESIGNED_URL_EXPIRES", "3600"))
+S3_MAX_PARTS = 10000
+
+
+def create_presigned_upload(key: str, content_type: str, size: int) -> dict:
+    """
+    Start a multipart upload to UPLOAD_BUCKET and presign a PUT URL per part.
+    """
+    part_size = max(UPLOAD_MULTIPART_CHUNK_MB * 1024 * 1024, -(-size // S3_MAX_PARTS))
+    part_count = max(1, -(-size // part_size))
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=UPLOAD_BUCKET, Key=key, ContentType=content_type or "application/octet-stream"
+    )["UploadId"]
+
+    parts = [
+        {
+            "part_number": number,
+            "url": s3_client.generate_presigned_url(
+                "upload_part",
+                Params={"Bucket": UPLOAD_BUCKET, "Key": key, "UploadId": upload_id, "PartNumber": number},
+                ExpiresIn=PRESIGNED_URL_EXPIRES,
+            ),
+        }
+        for number in range(1, part_count + 1)
+    ]
+    logger.debug("Presigned %d parts for s3://%s/%s", part_count, UPLOAD_BUCKET, key)
+    return {"upload_id": upload_id, "key": key, "part_size": part_size, "parts": parts}
+
+
+def complete_presigned_upload(key: str, upload_id: str, parts: list) -> str:
+    """
+    Assemble the uploaded parts ([{part_number, etag}]) and return the object's S3 URI.
+    """
+    s3_client.complete_multipart_upload(
+        Bucket=UPLOAD_BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": [
+            {"PartNumber": int(part["part_number"]), "ETag": part["etag"]}
+            for part in sorted(parts, key=lambda part: int(part["part_number"]))
+        ]},
+    )
+    s3_uri = f"s3://{UPLOAD_BUCKET}/{key}"
+    logger.info("Completed direct upload: %s", s3_uri)
+    return s3_uri
+
+
+def abort_presigned_upload(key: str, upload_id: str):
+    s3_client.abort_multipart_upload(Bucket=UPLOAD_BUCKET, Key=key, UploadId=upload_id)
+
+
+def download_from_s3(s3_uri: str, path: str):
+    bucket, key = s3_uri[len("s3://"):].split("/", 1)
+    s3_client.download_file(bucket, key, path, Config=TRANSFER_CONFIG)
+
+
 def upload_docx_transcript_and_return_text(file_obj, kb_id: str, file_key: str) -> str:
-    from api.services.kb_query import KB_CONFIG
+    from api.services.kb_config import KB_CONFIG
     conf = KB_CONFIG[kb_id]
     transcripts_bucket = conf["buckets"]["transcripts"]
     prefix = conf["prefix"]
@@ -39,11 +111,11 @@ def upload_docx_transcript_and_return_text(file_obj, kb_id: str, file_key: str)
         Body=text.encode("utf-8"),
         ContentType="text/plain"
     )
-    print(f"[DEBUG] Uploaded DOCX as transcript: s3://{transcripts_bucket}/{s3_key}")
+    logger.debug("Uploaded DOCX as transcript: s3://%s/%s", transcripts_bucket, s3_key)
     return text
 
 def upload_txt_transcript_and_return_text(file_obj, kb_id: str, file_key: str) -> str:
-    from api.services.kb_query import KB_CONFIG
+    from api.services.kb_config import KB_CONFIG
     conf = KB_CONFIG[kb_id]
     transcripts_bucket = conf["buckets"]["transcripts"]
     prefix = conf["prefix"]
@@ -58,5 +130,5 @@ def upload_txt_transcript_and_return_text(file_obj, kb_id: str, file_key: str) -
         Body=text.encode("utf-8"),
         ContentType="text/plain"
     )
-    print(f"[DEBUG] Uploaded TXT as transcript: s3://{transcripts_bucket}/{s3_key}")
+    logger.debug("Uploaded TXT as transcript: s3://%s/%s", transcripts_bucket, s3_key)
     return text
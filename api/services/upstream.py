@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from api.services.telemetry import record_span
+
+# Process-wide caps on concurrent API calls per upstream service, shared by every
+# request thread, ingest worker and async view. Calls over the cap wait for a
+# slot instead of piling onto Bedrock throttling or overflowing the S3
+# connection pool. A streamed Bedrock answer holds its slot until its response
+# headers arrive. Services without a limit are not capped.
+UPSTREAM_LIMITS = {
+    "bedrock-runtime": int(os.getenv("BEDROCK_MAX_CONCURRENCY", "16")),
+    "s3": int(os.getenv("S3_MAX_CONCURRENCY", os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))),
+}
+# Waits shorter than this aren't worth a "<service>.queue" span
+QUEUE_SPAN_MIN_SECONDS = 0.001
+
+# Threads the async views run blocking service code on (boto3, FAISS, langchain)
+ASYNC_BRIDGE_THREADS = int(os.getenv("ASYNC_BRIDGE_THREADS", "256"))
+
+_slots = {service: threading.BoundedSemaphore(limit) for service, limit in UPSTREAM_LIMITS.items() if limit > 0}
+_bridge = ThreadPoolExecutor(max_workers=ASYNC_BRIDGE_THREADS, thread_name_prefix="aima-async")
+
+
+def _acquire_slot(model, context, **kwargs):
+    service = model.service_model.service_name
+    slot = _slots.get(service)
+    if slot is None:
+        return
+    started = time.perf_counter()
+    slot.acquire()
+    context["upstream_slot"] = slot
+    waited = time.perf_counter() - started
+    if waited >= QUEUE_SPAN_MIN_SECONDS:
+        record_span(f"{service}.queue", waited)
+
+
+def _release_slot(context, **kwargs):
+    slot = context.pop("upstream_slot", None)
+    if slot is not None:
+        slot.release()
+
+
+def limit_client(client):
+    """
+    Make the boto3 client's API calls wait for a slot under UPSTREAM_LIMITS.
+    """
+    events = client.meta.events
+    events.register("before-call", _acquire_slot)
+    events.register("after-call", _release_slot)
+    events.register("after-call-error", _release_slot)
+    return client
+
+
+def run_blocking(func):
+    """
+    Async wrapper running func on the bridge pool, so a coroutine can call
+    blocking service code without holding up the event loop. Context variables
+    (the trace id) carry over.
+    """
+    return sync_to_async(func, thread_sensitive=False, executor=_bridge)
+
+
+_DONE = object()
+
+
+async def iterate_blocking(iterator):
+    """
+    Async iterator over a blocking one (e.g. a Bedrock answer stream), each
+    next() running on the bridge pool.
+    """
+    step = run_blocking(lambda: next(iterator, _DONE))
+    while True:
+        item = await step()
+        if item is _DONE:
+            return
+        yield item
@@ -1,3 +1,958 @@
-from django.test import TestCase
+import io
+import os
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import boto3
+from moto import mock_aws
+from urllib3.response import HTTPResponse
+from botocore.awsrequest import AWSResponse
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory
+from django.utils import timezone
+
+from api import views, async_views
+from api.models import IngestJob
+from api.benchmarks import FakeBedrockRuntime, FakeTranscribe, MeetingCorpus
+from api.services import config, jobs, manifests, transcriber, upstream
+from api.services.index_cache import index_cache
+from api.services.telemetry import span_metrics
+
+# Service tests run against moto (S3, DynamoDB, SQS) and local stubs for Bedrock
+# and Transcribe: pip install 'moto[s3,dynamodb,sqs]'
+
+
+class AwsMixin:
+    """
+    moto-backed AWS with the credentials table get_aws_session() reads, a fresh
+    shared session and client registry, and the buckets listed in `buckets`.
+    """
+
+    buckets = ()
+
+    def setUp(self):
+        super().setUp()
+        environ = mock.patch.dict(os.environ, {
+            "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing", "AWS_SESSION_TOKEN": "testing",
+        })
+        environ.start()
+        self.addCleanup(environ.stop)
+        os.environ.pop("ENV", None)
+
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        for patch in (mock.patch.object(config, "_session", None), mock.patch.object(config, "_default_chain_session", None),
+                      mock.patch.object(config, "_clients", {}), mock.patch.dict(manifests._cache, clear=True)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        index_cache.clear()
+
+        boto3.resource("dynamodb", region_name=config.AWS_REGION).create_table(
+            TableName="aima-aws-credentials",
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        ).put_item(Item={"id": "default", "access_key": "testing", "secret_key": "testing"})
+        self.s3 = config.get_client("s3")
+        for bucket in self.buckets:
+            self.s3.create_bucket(Bucket=bucket)
+
+
+class AwsTestCase(AwsMixin, SimpleTestCase):
+    pass
+
+
+class KbMixin(AwsMixin):
+    """
+    The KB buckets, with Bedrock faked (benchmarks.FakeBedrockRuntime) and the
+    embedding cache, answer cache, ingest registry and index store in a scratch dir.
+    """
+
+    kb_id = "coalition-kb"
+
+    def setUp(self):
+        from api.services import answer_cache, embeddings, index_store, ingest_registry, rag_engine, summarizer
+        from api.services.kb_config import KB_CONFIG
+
+        self.buckets = tuple(
+            set(KB_CONFIG[self.kb_id]["buckets"].values()) | {config.VECTOR_S3_BUCKET, config.UPLOAD_BUCKET}
+        )
+        super().setUp()
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.bedrock = FakeBedrockRuntime()
+        for patch in (
+            mock.patch.object(index_store, "INDEX_STORE_DIR", os.path.join(scratch.name, "index-store")),
+            mock.patch.object(embeddings, "_embeddings", embeddings.CachedBedrockEmbeddings(
+                client=self.bedrock, cache=embeddings.EmbeddingCache(os.path.join(scratch.name, "embeddings.sqlite3")),
+            )),
+            mock.patch.object(answer_cache, "_answer_cache",
+                              answer_cache.AnswerCache(os.path.join(scratch.name, "answers.sqlite3"))),
+            mock.patch.object(ingest_registry, "_ingest_registry",
+                              ingest_registry.IngestRegistry(os.path.join(scratch.name, "registry.sqlite3"))),
+            mock.patch.object(rag_engine.bedrock_runtime, "_client", self.bedrock),
+            mock.patch.object(summarizer.bedrock_runtime, "_client", self.bedrock),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.conf = KB_CONFIG[self.kb_id]
+
+
+class KbTestCase(KbMixin, SimpleTestCase):
+    pass
+
+
+def stub_http_response(request, body: dict) -> AWSResponse:
+    raw = HTTPResponse(body=io.BytesIO(json.dumps(body).encode("utf-8")), preload_content=False)
+    return AWSResponse(request.url, 200, {"content-type": "application/json"}, raw)
+
+
+class AwsSessionTests(AwsTestCase):
+    def test_session_uses_the_stored_credentials_over_the_environment(self):
+        boto3.resource("dynamodb", region_name=config.AWS_REGION).Table("aima-aws-credentials").put_item(
+            Item={"id": "default", "access_key": "stored-key", "secret_key": "stored-secret"}
+        )
+        with mock.patch.object(config, "_session", None):
+            credentials = config.get_aws_session().get_credentials()
+
+        self.assertEqual(credentials.method, "aima-credentials")
+        self.assertEqual((credentials.access_key, credentials.secret_key), ("stored-key", "stored-secret"))
+
+    def test_expired_credentials_are_fetched_again(self):
+        with mock.patch.object(config, "_session", None), mock.patch.object(config, "AWS_CREDENTIALS_TTL", 0):
+            credentials = config.get_aws_session().get_credentials()
+        boto3.resource("dynamodb", region_name=config.AWS_REGION).Table("aima-aws-credentials").put_item(
+            Item={"id": "default", "access_key": "rotated-key", "secret_key": "rotated-secret"}
+        )
+
+        self.assertEqual(credentials.get_frozen_credentials().access_key, "rotated-key")
+
+    def test_bedrock_signs_with_the_default_chain(self):
+        from api.services import rag_engine
+
+        boto3.resource("dynamodb", region_name=config.AWS_REGION).Table("aima-aws-credentials").put_item(
+            Item={"id": "default", "access_key": "stored-key", "secret_key": "stored-secret"}
+        )
+        signed = []
+
+        def send(request, **kwargs):
+            signed.append(request.headers["Authorization"].decode())
+            return stub_http_response(request, {})
+
+        client = rag_engine.bedrock_runtime._factory()
+        client.meta.events.register("before-send.bedrock-runtime", send)
+        self.addCleanup(client.meta.events.unregister, "before-send.bedrock-runtime", send)
+        client.invoke_model(body=b"{}", modelId="test-model")
+
+        self.assertIn(f"Credential={os.environ['AWS_ACCESS_KEY_ID']}/", signed[0])
+
+
+class UpstreamLimitTests(AwsTestCase):
+    def assert_throttled(self, client, call, limit=2, calls=6):
+        """
+        Run call() from `calls` threads against the real botocore client, with a
+        before-send hook standing in for the network (signing, retries and every
+        other hook still run), and check at most `limit` requests were in flight.
+        """
+        state = {"in_flight": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def send(request, **kwargs):
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(0.05)
+            with lock:
+                state["in_flight"] -= 1
+            return stub_http_response(request, {"embedding": [0.1, 0.2], "inputTextTokenCount": 1})
+
+        span_metrics.clear()
+        client.meta.events.register("before-send.bedrock-runtime", send)
+        self.addCleanup(client.meta.events.unregister, "before-send.bedrock-runtime", send)
+        with mock.patch.dict(upstream._slots, {"bedrock-runtime": threading.BoundedSemaphore(limit)}):
+            with ThreadPoolExecutor(max_workers=calls) as pool:
+                list(pool.map(lambda i: call(), range(calls)))
+
+        self.assertEqual(state["peak"], limit)
+        self.assertIn('span="bedrock-runtime.queue"', span_metrics.render())
+        self.assertIn('span="bedrock-runtime.InvokeModel"', span_metrics.render())
+
+    def test_embedding_calls_wait_for_a_slot(self):
+        from api.services.embeddings import CachedBedrockEmbeddings, EmbeddingCache
+
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        embeddings = CachedBedrockEmbeddings(max_workers=8, cache=EmbeddingCache(os.path.join(scratch.name, "e.sqlite3")))
+        texts = iter(f"text {i}" for i in range(100))
+        self.assert_throttled(embeddings.client, lambda: embeddings.embed_documents([next(texts)]))
+
+    def test_answer_and_summary_clients_wait_for_a_slot(self):
+        from api.services import rag_engine, summarizer
+
+        for runtime in (rag_engine.bedrock_runtime, summarizer.bedrock_runtime):
+            client = runtime._factory()
+            self.assert_throttled(client, lambda: client.invoke_model(body=b"{}", modelId="test-model"))
+
+
+class AsyncViewTests(AwsTestCase):
+    """
+    The async views must answer exactly like the DRF views they stand in for.
+    """
+
+    buckets = ("aima-meeting-embeddings", "aima-meeting-transcripts")
+
+    def both(self, name, request, *args):
+        sync_response = getattr(views, name)(request, *args)
+        if hasattr(sync_response, "render"):
+            sync_response.render()
+        async_response = async_to_sync(getattr(async_views, name))(request, *args)
+        return sync_response, async_response
+
+    def test_missing_parameters(self):
+        factory = RequestFactory()
+        for name, path in (("ask_question", "/ask/"), ("ask_question_stream", "/ask/stream/"),
+                           ("kb_ask_question", "/api/kb/ask/"), ("kb_ask_question_stream", "/api/kb/ask/stream/")):
+            with self.subTest(name):
+                sync_response, async_response = self.both(
+                    name, factory.post(path, {"question": "what?"}, content_type="application/json")
+                )
+                self.assertEqual(sync_response.status_code, 400)
+                self.assertEqual((async_response.status_code, json.loads(async_response.content)),
+                                 (sync_response.status_code, json.loads(sync_response.content)))
+
+    def test_kb_files_etag_and_304(self):
+        self.s3.put_object(Bucket="aima-meeting-transcripts", Key="coalition-kb/standup.txt", Body=b"hello")
+        factory = RequestFactory()
+        sync_response, async_response = self.both("list_kb_files", factory.get("/api/kb/coalition-kb/files/"), "coalition-kb")
+        self.assertEqual(json.loads(sync_response.content), {"files": ["standup"]})
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        self.assertEqual(async_response["ETag"], sync_response["ETag"])
+
+        request = factory.get("/api/kb/coalition-kb/files/", HTTP_IF_NONE_MATCH=sync_response["ETag"])
+        sync_response, async_response = self.both("list_kb_files", request, "coalition-kb")
+        self.assertEqual((sync_response.status_code, async_response.status_code), (304, 304))
+
+        sync_response, async_response = self.both("list_kb_files", factory.get("/api/kb/nope/files/"), "nope")
+        self.assertEqual((sync_response.status_code, async_response.status_code), (400, 400))
+
+    def test_stream_is_served_as_an_async_iterator(self):
+        request = RequestFactory().post("/api/kb/ask/stream/", {"kb_id": "coalition-kb", "files": ["a"], "question": "q"})
+        with mock.patch("api.services.kb_query.stream_kb_answer", return_value=iter(["Hello", " world"])):
+            response = async_to_sync(async_views.kb_ask_question_stream)(request)
+
+            async def body():
+                return [chunk async for chunk in response.streaming_content]
+
+            span_metrics.clear()
+            with self.assertLogs("api.views", "INFO") as logs:
+                chunks = async_to_sync(body)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(b"".join(chunks), b'data: {"text": "Hello"}\n\ndata: {"text": " world"}\n\nevent: done\ndata: {}\n\n')
+        # Time to first token, once per response
+        self.assertIn("/api/kb/ask/stream/ first token after", logs.output[0])
+        self.assertIn('aima_span_seconds_count{span="first_token /api/kb/ask/stream/",status="ok"} 1', span_metrics.render())
+
+
+def stub_transcription_manager(s3, latency: float = 0.0, **kwargs):
+    """
+    A TranscriptionManager on the stub Transcribe service, with its poller and
+    events threads left unstarted so tests drive poll_once() themselves.
+    """
+    stub = FakeTranscribe(s3, lambda media_uri: f"Transcript of {media_uri}", latency=latency)
+    manager = transcriber.TranscriptionManager(client=stub, min_interval=0, max_interval=0.05, **kwargs)
+    manager._ensure_threads = lambda: None
+    return manager
+
+
+class TranscriptionManagerTests(AwsTestCase):
+    buckets = ("aima-meeting-transcripts",)
+
+    def setUp(self):
+        super().setUp()
+        self.done = []
+        self.finished = threading.Event()
+
+    def callback(self, expected: int, delay: float = 0.0):
+        def on_done(job_name, status, reason):
+            time.sleep(delay)
+            self.done.append((job_name, status, reason, threading.current_thread().name))
+            if len(self.done) == expected:
+                self.finished.set()
+        return on_done
+
+    def test_due_jobs_share_one_list_call_and_callbacks_run_off_the_poller(self):
+        manager = stub_transcription_manager(self.s3)
+        names = [manager.start_job(f"s3://uploads/meeting-{i}.mp4", "aima-meeting-transcripts", self.callback(3))
+                 for i in range(3)]
+
+        started = time.perf_counter()
+        manager.poll_once()
+        self.assertTrue(self.finished.wait(5))
+
+        self.assertEqual(sorted(name for name, *_ in self.done), sorted(names))
+        self.assertTrue(all(status == "COMPLETED" for _, status, _, _ in self.done))
+        self.assertTrue(all(thread.startswith("transcribe-callback") for *_, thread in self.done))
+        self.assertEqual((manager.stats["list_calls"], manager.stats["get_calls"]), (1, 0))
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(manager.pending(), [])
+        self.assertEqual(transcriber.fetch_transcript_text("aima-meeting-transcripts", names[0]),
+                         "Transcript of s3://uploads/meeting-0.mp4")
+
+    def test_slow_callbacks_do_not_hold_up_the_poller(self):
+        manager = stub_transcription_manager(self.s3)
+        manager.start_job("s3://uploads/meeting-1.mp4", "aima-meeting-transcripts", self.callback(1, delay=1.0))
+
+        started = time.perf_counter()
+        manager.poll_once()
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(self.finished.wait(5))
+
+    def test_jobs_fail_after_max_wait(self):
+        manager = stub_transcription_manager(self.s3, latency=60, max_wait=0)
+        manager.start_job("s3://uploads/meeting-1.mp4", "aima-meeting-transcripts", self.callback(1))
+        manager.poll_once()
+        self.assertTrue(self.finished.wait(5))
+        self.assertEqual(self.done[0][1], "FAILED")
+        self.assertIn("Timed out", self.done[0][2])
+
+    def test_events_complete_watched_jobs_and_leave_others_queued(self):
+        manager = stub_transcription_manager(self.s3, latency=60)
+        name = manager.start_job("s3://uploads/meeting-1.mp4", "aima-meeting-transcripts", self.callback(1))
+        sqs = boto3.client("sqs", region_name=config.AWS_REGION)
+        queue_url = sqs.create_queue(QueueName="transcripts")["QueueUrl"]
+
+        def event(key):
+            return json.dumps({"Records": [{"s3": {"bucket": {"name": "aima-meeting-transcripts"}, "object": {"key": key}}}]})
+
+        sqs.send_message(QueueUrl=queue_url, MessageBody="not json")
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps({"Message": event(f"{name}.json")}))  # via SNS
+        sqs.send_message(QueueUrl=queue_url, MessageBody=event("someone-elses-job.json"))
+
+        handled = 0
+        for _ in range(3):
+            handled += manager.poll_events_once(sqs, queue_url, wait_seconds=0)
+        self.assertEqual(handled, 2)
+        self.assertTrue(self.finished.wait(5))
+        self.assertEqual(self.done[0][:2], (name, "COMPLETED"))
+
+        attributes = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["All"])["Attributes"]
+        self.assertEqual(attributes["ApproximateNumberOfMessagesNotVisible"], "1")
+
+    def test_events_nobody_claims_are_dropped_after_max_receives(self):
+        manager = stub_transcription_manager(self.s3)
+        sqs = boto3.client("sqs", region_name=config.AWS_REGION)
+        queue_url = sqs.create_queue(QueueName="transcripts")["QueueUrl"]
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps({"Records": [
+            {"s3": {"bucket": {"name": "aima-meeting-transcripts"}, "object": {"key": "finished-long-ago.json"}}}
+        ]}))
+
+        with mock.patch.object(transcriber, "TRANSCRIBE_EVENTS_MAX_RECEIVES", 1):
+            self.assertEqual(manager.poll_events_once(sqs, queue_url, wait_seconds=0), 1)
+        attributes = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["All"])["Attributes"]
+        self.assertEqual((attributes["ApproximateNumberOfMessages"], attributes["ApproximateNumberOfMessagesNotVisible"]), ("0", "0"))
+
+
+class JobAdoptionTests(AwsMixin, TestCase):
+    buckets = ("aima-meeting-transcripts",)
+
+    def setUp(self):
+        super().setUp()
+        self.manager = stub_transcription_manager(self.s3, latency=60)
+        patch = mock.patch.object(transcriber, "_manager", self.manager)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(jobs._watched.clear)
+
+    def waiting_job(self, seconds_ago: float, status=IngestJob.WAITING) -> IngestJob:
+        job = IngestJob.objects.create(
+            filename="meeting.mp4", file_key="meeting", file_type="video", status=status,
+            context={"transcription_job": "meeting-1234"},
+        )
+        IngestJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timezone.timedelta(seconds=seconds_ago))
+        return job
+
+    def test_orphaned_jobs_are_adopted_once(self):
+        job = self.waiting_job(seconds_ago=10 * jobs.JOB_WATCH_HEARTBEAT)
+        self.assertEqual(jobs.adopt_orphaned_jobs(), 1)
+        self.assertEqual(self.manager.pending(), ["meeting-1234"])
+        self.assertIn(job.pk, jobs._watched)
+        # Its adoption counts as a heartbeat, so nobody else takes it
+        self.assertEqual(jobs.adopt_orphaned_jobs(), 0)
+
+    def test_heartbeats_keep_watched_jobs(self):
+        job = self.waiting_job(seconds_ago=10 * jobs.JOB_WATCH_HEARTBEAT)
+        jobs.watch_job(job.pk)
+        self.assertEqual(jobs.heartbeat_watched_jobs(), 1)
+        self.assertEqual(jobs.adopt_orphaned_jobs(), 0)
+        self.assertEqual(self.manager.pending(), [])
+
+    def test_only_jobs_nobody_is_running_are_requeued(self):
+        running = self.waiting_job(seconds_ago=2 * jobs.JOB_STALE_AFTER, status=IngestJob.RUNNING)
+        orphaned = self.waiting_job(seconds_ago=2 * jobs.JOB_STALE_AFTER, status=IngestJob.RUNNING)
+        with mock.patch.object(jobs, "_running", {running.pk}):
+            self.assertEqual(jobs.heartbeat_running_jobs(), 1)
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        running.refresh_from_db()
+        orphaned.refresh_from_db()
+        self.assertEqual((running.status, orphaned.status), (IngestJob.RUNNING, IngestJob.QUEUED))
+
+
+class KnownContentTests(KbTestCase):
+    def test_copied_index_is_keyed_by_its_own_file_name(self):
+        from api.services import kb_builder
+        from api.services.chunking import chunk_ids
+        from api.services.embeddings import get_embeddings
+        from api.services.index_store import load_faiss_store, stored_artifacts
+
+        text = MeetingCorpus(turns=60).transcript(1)
+        bucket = self.conf["buckets"]["embeddings"]
+        kb_builder.build_and_store_embedding(text, self.kb_id, "original")
+        embed_calls = self.bedrock.stats["embed_calls"]
+
+        artifacts, chunks = kb_builder.copy_embedding_into_kb(self.kb_id, "copy", bucket, f"{self.kb_id}/original")
+        store = load_faiss_store(self.s3, bucket, f"{self.kb_id}/copy", get_embeddings())
+        texts = [store.docstore.search(store.index_to_docstore_id[row]).page_content for row in range(chunks)]
+        self.assertEqual(list(store.index_to_docstore_id.values()), chunk_ids("copy", texts))
+        self.assertEqual(self.bedrock.stats["embed_calls"], embed_calls)
+
+        # Re-ingesting the copy's content finds every chunk already there
+        reingested, _ = kb_builder.build_and_store_embedding(text, self.kb_id, "copy")
+        self.assertEqual(reingested, artifacts)
+        self.assertEqual(stored_artifacts(self.s3, bucket, f"{self.kb_id}/copy"), artifacts)
+
+    def test_large_objects_are_not_hashed_server_side(self):
+        import hashlib
+        from api.services.ingest_registry import hash_s3_object
+
+        body = b"x" * 4096
+        self.s3.put_object(Bucket=config.VECTOR_S3_BUCKET, Key="upload.mp4", Body=body)
+        uri = f"s3://{config.VECTOR_S3_BUCKET}/upload.mp4"
+        self.assertEqual(hash_s3_object(uri, max_bytes=4096), hashlib.sha256(body).hexdigest())
+        self.assertIsNone(hash_s3_object(uri, max_bytes=4095))
+
+
+class S3LeaseTests(AwsTestCase):
+    buckets = ("aima-locks",)
+
+    def test_lease_is_renewed_while_held(self):
+        from api.services.locks import s3_lease
+
+        with s3_lease(self.s3, "aima-locks", "kb.lock", ttl=0.3, wait=0) as lease:
+            first = lease.etag
+            time.sleep(0.5)
+            self.assertNotEqual(lease.etag, first)
+            # Still ours after outliving the ttl, so nobody can take it over
+            with self.assertRaises(TimeoutError):
+                with s3_lease(self.s3, "aima-locks", "kb.lock", ttl=0.3, wait=0):
+                    pass
+        self.assertEqual(self.s3.list_objects_v2(Bucket="aima-locks").get("KeyCount"), 0)
+
+    def test_lost_lease_fences_writes(self):
+        from api.services.locks import s3_lease, LeaseLost
+
+        with s3_lease(self.s3, "aima-locks", "kb.lock", ttl=60, wait=0) as lease:
+            # Another worker broke the lease and took the lock
+            self.s3.put_object(Bucket="aima-locks", Key="kb.lock", Body=b"{}")
+            with self.assertRaises(LeaseLost):
+                lease.renew()
+        self.assertEqual(self.s3.get_object(Bucket="aima-locks", Key="kb.lock")["Body"].read(), b"{}")
+
+
+class ChunkStoreTests(KbTestCase):
+    def test_chunk_store_round_trip(self):
+        from langchain_core.documents import Document
+        from api.services.chunk_store import ChunkStore, write_chunk_store
+
+        documents = [
+            Document(page_content="Budget review — naïve forecast 📈", metadata={"file_id": "q3", "page": 2}),
+            Document(page_content="", metadata={}),
+            Document(page_content="Hiring plan", metadata={"file_id": "q3", "tags": ["hr", "plan"]}),
+        ]
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        path = os.path.join(scratch.name, "index.chunks")
+        write_chunk_store(path, ["a", "ü-2", "c"], documents)
+
+        chunks = ChunkStore(path)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks.ids(), ["a", "ü-2", "c"])
+        self.assertEqual([chunks.document(row) for row in range(3)], documents)
+
+    def test_faiss_store_round_trip_through_s3(self):
+        from langchain_community.vectorstores import FAISS
+        from api.services.embeddings import get_embeddings
+        from api.services.index_store import upload_faiss_store, load_faiss_store, private_store_copy
+
+        embeddings = get_embeddings()
+        texts = ["budget forecast for the quarter", "hiring candidate interview", "release rollback plan"]
+        store = FAISS.from_texts(texts, embeddings, metadatas=[{"file_id": f"f{i}"} for i in range(3)],
+                                 ids=["x", "y", "z"])
+        artifacts = upload_faiss_store(self.s3, store, config.VECTOR_S3_BUCKET, "single-uploads/meeting")
+        self.assertEqual(set(artifacts), {"index", "chunks"})
+
+        before = self.client.get("/api/cache/stats/").json()["index_store"]
+        for _ in range(2):
+            loaded = load_faiss_store(self.s3, config.VECTOR_S3_BUCKET, "single-uploads/meeting", embeddings,
+                                      etag=artifacts["index"]["etag"])
+        after = self.client.get("/api/cache/stats/").json()["index_store"]
+        self.assertGreater(after["misses"], before["misses"])
+        self.assertGreater(after["hits"], before["hits"])
+        self.assertEqual(loaded.index_to_docstore_id, {0: "x", 1: "y", 2: "z"})
+        hit = loaded.similarity_search("hiring interview", k=1)[0]
+        self.assertEqual((hit.page_content, hit.metadata), ("hiring candidate interview", {"file_id": "f1"}))
+
+        # The loaded store is mmapped and read-only; its private copy can be changed
+        copy = private_store_copy(loaded)
+        copy.delete(["y"])
+        self.assertEqual(copy.index.ntotal, 2)
+        self.assertEqual(loaded.index.ntotal, 3)
+
+
+class JobResumeTests(KbMixin, TransactionTestCase):
+    """
+    A job interrupted in any stage (a worker restart requeues it) picks up at
+    that stage with the context the earlier stages left, without re-running them.
+    Transactional, since transcription callbacks resume jobs from their own thread.
+    """
+
+    text = MeetingCorpus(turns=40).transcript(3)
+
+    def setUp(self):
+        super().setUp()
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.scratch = scratch.name
+
+    def text_job(self, **fields) -> IngestJob:
+        path = os.path.join(self.scratch, f"{time.monotonic_ns()}.txt")
+        with open(path, "w") as f:
+            f.write(self.text)
+        return IngestJob.objects.create(**{
+            "kb_id": self.kb_id, "filename": "standup.txt", "file_key": "standup", "file_type": "text",
+            "content_type": "text/plain", "source_path": path, "status": IngestJob.RUNNING, **fields,
+        })
+
+    def recording_pipeline(self, calls: list, contexts: dict = None):
+        from api.services import ingest
+
+        def record(name, stage):
+            def run(job, context):
+                calls.append(name)
+                outcome = stage(job, context)
+                if contexts is not None:
+                    contexts[name] = json.loads(json.dumps(context))
+                return outcome
+            return run
+
+        return mock.patch.object(ingest, "PIPELINE", [(name, record(name, stage)) for name, stage in ingest.PIPELINE])
+
+    def test_jobs_resume_at_the_interrupted_stage(self):
+        from api.services.ingest import PIPELINE
+        from api.services.ingest_registry import ingest_registry
+
+        calls, contexts = [], {}
+        with self.recording_pipeline(calls, contexts):
+            job = self.text_job()
+            jobs.run_job(job)
+        names = [name for name, _ in PIPELINE]
+        self.assertEqual((job.status, calls), (IngestJob.SUCCEEDED, names))
+        expected = job.result
+
+        for position, name in enumerate(names):
+            with self.subTest(stage=name):
+                # Otherwise the dedup stage would reuse the first run's artifacts
+                ingest_registry().forget(self.kb_id, "standup")
+                calls = []
+                job = self.text_job(
+                    stage=name,
+                    stages=[{"name": done, "status": "succeeded"} for done in names[:position]]
+                           + [{"name": name, "status": "running"}],
+                    context=contexts[names[position - 1]] if position else {},
+                )
+                with self.recording_pipeline(calls):
+                    jobs.run_job(job)
+                job.refresh_from_db()
+                self.assertEqual(job.status, IngestJob.SUCCEEDED, job.error)
+                self.assertEqual(calls, names[position:])
+                self.assertEqual(job.result, expected)
+
+    def test_reused_content_is_still_indexed_in_its_own_stage(self):
+        from api.services.kb_manifest import load_kb_manifest
+
+        jobs.run_job(self.text_job())
+        chat_calls = self.bedrock.stats["chat_calls"]
+
+        job = self.text_job(filename="standup-copy.txt", file_key="standup-copy")
+        jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestJob.SUCCEEDED, job.error)
+        self.assertEqual(job.result["reused_from"], f"{self.kb_id}/standup")
+        self.assertEqual(self.bedrock.stats["chat_calls"], chat_calls)
+        self.assertEqual([(stage["name"], stage["status"]) for stage in job.stages], [
+            ("dedup", "succeeded"), ("upload", "skipped"), ("transcript", "skipped"),
+            ("summarize", "skipped"), ("index", "succeeded"),
+        ])
+        self.assertIn("duration_ms", job.stages[-1])
+        self.assertIn("standup-copy", load_kb_manifest(self.kb_id)[0]["files"])
+
+    def test_waiting_job_resumes_when_transcription_finishes(self):
+        manager = stub_transcription_manager(self.s3)
+        patch = mock.patch.object(transcriber, "_manager", manager)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(jobs._watched.clear)
+
+        job = IngestJob.objects.create(
+            kb_id=self.kb_id, filename="standup.mp4", file_key="standup", file_type="video", status=IngestJob.RUNNING,
+            context={"s3_uri": f"s3://{config.UPLOAD_BUCKET}/{self.kb_id}/standup.mp4", "content_hash": "0" * 64},
+        )
+        with mock.patch.object(jobs, "_wakeup"):
+            jobs.run_job(job)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.stage), (IngestJob.WAITING, "transcript"))
+            self.assertIn(job.pk, jobs._watched)
+
+            manager.poll_once()
+            manager._callbacks.shutdown(wait=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestJob.QUEUED)
+        self.assertEqual(job.context["transcription_status"], "COMPLETED")
+        self.assertNotIn(job.pk, jobs._watched)
+
+        job.status = IngestJob.RUNNING
+        jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestJob.SUCCEEDED, job.error)
+        self.assertEqual([(stage["name"], stage["status"]) for stage in job.stages], [
+            ("dedup", "succeeded"), ("upload", "succeeded"), ("transcript", "succeeded"),
+            ("summarize", "succeeded"), ("index", "succeeded"),
+        ])
+
+
+class ManifestWriteTests(KbTestCase):
+    bucket, key = "aima-meeting-summaries", "coalition-kb/_summaries.json"
+
+    def test_concurrent_writers_lose_no_updates(self):
+        def add(number):
+            def mutate(data):
+                data = data or {"items": []}
+                time.sleep(0.01)  # widen the read-modify-write window
+                data["items"].append(number)
+                return data
+            manifests.update_manifest(self.s3, self.bucket, self.key, mutate)
+
+        with mock.patch.object(manifests, "MANIFEST_MAX_ATTEMPTS", 50):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(add, range(16)))
+        manifests._cache.clear()
+        data, _ = manifests.read_manifest(self.s3, self.bucket, self.key)
+        self.assertEqual(sorted(data["items"]), list(range(16)))
+
+    def test_write_retries_after_losing_the_race(self):
+        seen = []
+
+        def mutate(data):
+            seen.append(json.loads(json.dumps(data)))
+            if len(seen) == 1:
+                # Someone else creates the manifest between our read and our put
+                self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=b'{"items": ["theirs"]}')
+            data = data or {"items": []}
+            data["items"].append("ours")
+            return data
+
+        data = manifests.update_manifest(self.s3, self.bucket, self.key, mutate)
+        self.assertEqual(seen, [None, {"items": ["theirs"]}])
+        self.assertEqual(data, {"items": ["theirs", "ours"]})
+
+    def test_summaries_manifest_is_built_once_then_updated(self):
+        from api.services.summaries import record_summary, list_kb_summaries
+
+        prefix = self.conf["prefix"]
+        self.s3.put_object(Bucket=self.bucket, Key=f"{prefix}/old.md", Body=b"# Old")
+        self.assertEqual([s["recording_id"] for s in list_kb_summaries(self.kb_id)], ["old"])
+
+        record_summary(self.kb_id, f"{prefix}/new.md", "# New", etag="abc")
+        summaries = {s["recording_id"]: s for s in list_kb_summaries(self.kb_id)}
+        self.assertEqual(sorted(summaries), ["new", "old"])
+        self.assertEqual(summaries["new"]["summary_markdown"], "# New")
+
+
+class KbManifestTests(KbTestCase):
+    def test_reads_revalidate_with_conditional_gets(self):
+        bucket, key = "aima-meeting-embeddings", "coalition-kb/_manifest.json"
+        manifests.update_manifest(self.s3, bucket, key, lambda _: {"version": 1, "files": {}})
+        manifests._cache.clear()
+        s3 = mock.Mock(wraps=self.s3)
+
+        data, etag = manifests.read_manifest(s3, bucket, key)
+        self.assertEqual(manifests.read_manifest(s3, bucket, key), (data, etag))
+        self.assertEqual(s3.get_object.call_args_list[1], mock.call(Bucket=bucket, Key=key, IfNoneMatch=f'"{etag}"'))
+        # Within max_age the local copy is served without asking S3
+        manifests.read_manifest(s3, bucket, key, max_age=60)
+        self.assertEqual(s3.get_object.call_count, 2)
+
+        self.s3.put_object(Bucket=bucket, Key=key, Body=b'{"version": 1, "files": {"a": {}}}')
+        data, new_etag = manifests.read_manifest(s3, bucket, key)
+        self.assertEqual((data["files"], new_etag != etag), ({"a": {}}, True))
+
+    def test_first_record_backfills_existing_files(self):
+        from api.services.kb_manifest import record_kb_file, load_kb_manifest
+
+        prefix, embeddings_bucket = self.conf["prefix"], self.conf["buckets"]["embeddings"]
+        for suffix in (".index.faiss", ".index.chunks"):
+            self.s3.put_object(Bucket=embeddings_bucket, Key=f"{prefix}/old{suffix}", Body=b"x")
+        self.s3.put_object(Bucket=embeddings_bucket, Key=f"{prefix}/_kb.index.faiss", Body=b"x")
+
+        record_kb_file(self.kb_id, "new", {"index": {"key": f"{prefix}/new.index.faiss"}}, chunks=3)
+        manifest, etag = load_kb_manifest(self.kb_id, max_age=0)
+        self.assertEqual(sorted(manifest["files"]), ["new", "old"])
+        self.assertEqual(manifest["files"]["new"]["chunks"], 3)
+        self.assertEqual(sorted(manifest["files"]["old"]["artifacts"]), ["chunks", "index"])
+        head = self.s3.head_object(Bucket=embeddings_bucket, Key=f"{prefix}/_manifest.json")
+        self.assertEqual(etag, head["ETag"].strip('"'))
+
+
+class DirectUploadTests(AwsMixin, TestCase):
+    buckets = (config.UPLOAD_BUCKET,)
+
+    def setUp(self):
+        super().setUp()
+        # No workers picking the jobs up; 5MB is S3's smallest multipart part
+        for patch in (mock.patch.object(jobs, "ensure_workers"),
+                      mock.patch("api.services.uploader.UPLOAD_MULTIPART_CHUNK_MB", 5)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def post(self, path, body):
+        return self.client.post(path, json.dumps(body), content_type="application/json")
+
+    def test_presigned_multipart_upload_queues_a_job(self):
+        import hashlib
+        import requests
+
+        data = os.urandom(6 * 1024 * 1024)
+        target = {"filename": "all hands.mp4", "kb_id": "coalition-kb", "content_type": "video/mp4"}
+        upload = self.post("/uploads/", {**target, "size": len(data)}).json()
+        self.assertEqual(upload["key"], "coalition-kb/all-hands.mp4")
+        self.assertEqual([part["part_number"] for part in upload["parts"]], [1, 2])
+
+        parts = []
+        for part in upload["parts"]:
+            offset = (part["part_number"] - 1) * upload["part_size"]
+            put = requests.put(part["url"], data=data[offset:offset + upload["part_size"]])
+            put.raise_for_status()
+            parts.append({"part_number": part["part_number"], "etag": put.headers["ETag"]})
+
+        complete = {**target, "key": upload["key"], "upload_id": upload["upload_id"], "parts": parts[::-1]}
+        self.assertEqual(self.post("/uploads/complete/", {**complete, "key": "elsewhere.mp4"}).status_code, 400)
+
+        # A client-sent hash is ignored; the dedup stage hashes the object itself
+        response = self.post("/uploads/complete/", {**complete, "content_hash": hashlib.sha256(b"other").hexdigest()})
+        self.assertEqual(response.status_code, 202)
+        stored = self.s3.get_object(Bucket=config.UPLOAD_BUCKET, Key=upload["key"])["Body"].read()
+        self.assertEqual(stored, data)
+
+        job = IngestJob.objects.get(pk=response.json()["job_id"])
+        self.assertEqual((job.kb_id, job.file_type, job.status), ("coalition-kb", "video", IngestJob.QUEUED))
+        self.assertEqual(job.context["s3_uri"], f"s3://{config.UPLOAD_BUCKET}/{upload['key']}")
+        self.assertNotIn("content_hash", job.context)
+
+    def test_uploads_are_validated_and_can_be_aborted(self):
+        self.assertEqual(self.post("/uploads/", {"filename": "notes.exe", "size": 10}).status_code, 400)
+        self.assertEqual(self.post("/uploads/", {"filename": "notes.txt", "kb_id": "nope", "size": 10}).status_code, 400)
+        self.assertEqual(self.post("/uploads/", {"filename": "notes.txt", "size": 0}).status_code, 400)
+
+        upload = self.post("/uploads/", {"filename": "notes.txt", "size": 10}).json()
+        self.assertEqual(upload["key"], "single-uploads/notes.txt")
+        aborted = self.post("/uploads/abort/", {"filename": "notes.txt", "upload_id": upload["upload_id"]})
+        self.assertEqual(aborted.json(), {"aborted": True})
+        self.assertNotIn("Uploads", self.s3.list_multipart_uploads(Bucket=config.UPLOAD_BUCKET))
+
+
+class ReingestDiffTests(KbTestCase):
+    def kb_ids(self, filename: str) -> set:
+        from api.services.embeddings import get_embeddings
+        from api.services.kb_index import load_kb_index
+
+        kb_index = load_kb_index(self.kb_id, get_embeddings(), max_age=0)
+        return {kb_index.store.index_to_docstore_id[int(row)] for row in kb_index.rows_by_file[filename]}
+
+    def test_reingest_embeds_only_changed_chunks(self):
+        from api.services import kb_builder
+        from api.services.chunking import split_into_chunks, chunk_ids
+        from api.services.embeddings import get_embeddings
+        from api.services.index_store import load_faiss_store
+
+        corpus = MeetingCorpus(turns=80)
+        original = corpus.transcript(5)
+        kb_builder.build_and_store_embedding(corpus.transcript(6), self.kb_id, "other")
+        kb_builder.build_and_store_embedding(original, self.kb_id, "standup")
+        other_ids = self.kb_ids("other")
+
+        # A corrected transcript: one line fixed, one dropped
+        lines = original.splitlines()
+        lines[10] = lines[10] + " (corrected)"
+        del lines[40]
+        corrected = "\n".join(lines)
+        old_ids = set(chunk_ids("standup", split_into_chunks(original)))
+        new_texts = split_into_chunks(corrected)
+        new_ids = chunk_ids("standup", new_texts)
+        added = [text for text, chunk_id in zip(new_texts, new_ids) if chunk_id not in old_ids]
+        self.assertTrue(0 < len(added) < len(new_texts) / 2)
+
+        embeddings = get_embeddings()
+        with mock.patch.object(embeddings, "embed_documents", wraps=embeddings.embed_documents) as embed:
+            _, chunks = kb_builder.build_and_store_embedding(corrected, self.kb_id, "standup")
+        self.assertEqual(chunks, len(new_texts))
+        self.assertEqual(embed.call_args_list, [mock.call(added)])
+
+        store = load_faiss_store(self.s3, self.conf["buckets"]["embeddings"], f"{self.kb_id}/standup", embeddings)
+        self.assertEqual(set(store.index_to_docstore_id.values()), set(new_ids))
+        self.assertEqual(self.kb_ids("standup"), set(new_ids))
+        self.assertEqual(self.kb_ids("other"), other_ids)
+
+    def test_long_lines_are_chunked_on_content(self):
+        import re
+        from api.services.chunking import split_into_chunks, CHUNK_MAX_CHARS
+
+        transcript = " ".join(MeetingCorpus(turns=200).transcript(5).splitlines())
+        # A transcript on a single line, with and without sentence punctuation
+        for text in (transcript, re.sub(r"[.:]", "", transcript)):
+            with self.subTest(punctuated=text is transcript):
+                words = text.split()
+                words[len(words) // 2] += "s"
+                original, edited = split_into_chunks(text), split_into_chunks(" ".join(words))
+                self.assertGreater(len(original), 50)
+                self.assertLessEqual(max(map(len, original)), CHUNK_MAX_CHARS)
+                self.assertEqual(" ".join(original).split(), text.split())
+                self.assertLessEqual(len(set(edited) - set(original)), 3)
+
+
+class HybridSearchTests(KbTestCase):
+    def test_tokens_keep_identifiers_whole(self):
+        from api.services.lexical import tokenize
+
+        self.assertEqual(tokenize("Fix INC-4821 in v2.1"), ["fix", "inc-4821", "inc", "4821", "in", "v2.1", "v2", "1"])
+
+    def test_bm25_ranks_rare_terms_and_filters_files(self):
+        from api.services.lexical import LexicalIndex
+
+        texts = ["the budget review went long", "INC-4821 broke the deploy", "the deploy and the budget", "INC-4821"]
+        index = LexicalIndex.build(["a", "b", "c", "d"], texts, ["f1", "f1", "f1", "f2"])
+        self.assertEqual(index.search("deploy INC-4821", k=3), ["b", "d", "c"])
+        self.assertEqual(index.search("deploy INC-4821", k=3, file_ids=["f2"]), ["d"])
+        self.assertEqual(index.search("nothing matches", k=3), [])
+
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        path = os.path.join(scratch.name, "index.bm25")
+        index.save(path)
+        self.assertEqual(LexicalIndex.load(path).search("deploy INC-4821", k=3), ["b", "d", "c"])
+
+    def test_rank_fusion_prefers_ids_both_retrievers_agree_on(self):
+        from api.services.lexical import reciprocal_rank_fusion
+
+        self.assertEqual(reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "e"]]), ["b", "a", "d", "c", "e"])
+        self.assertEqual(reciprocal_rank_fusion([[], ["x"]]), ["x"])
+
+    def test_kb_search_finds_exact_identifiers_in_selected_files(self):
+        from api.services import kb_builder
+        from api.services.embeddings import get_embeddings
+        from api.services.kb_index import load_kb_index
+
+        corpus = MeetingCorpus(turns=60)
+        for number, name in ((1, "standup"), (2, "retro")):
+            lines = corpus.transcript(number).splitlines()
+            lines.insert(30, f"Priya: the outage ticket is INC-4821, assigned to {name}.")
+            kb_builder.build_and_store_embedding("\n".join(lines), self.kb_id, name)
+
+        kb_index = load_kb_index(self.kb_id, get_embeddings(), max_age=0)
+        docs = kb_index.select(["retro"]).similarity_search("Who owns INC-4821?", k=3)
+        self.assertTrue(any("INC-4821, assigned to retro" in doc.page_content for doc in docs))
+        self.assertEqual({doc.metadata["file_id"] for doc in docs}, {"retro"})
+        # Vector search alone misses it
+        with mock.patch("api.services.kb_index.HYBRID_SEARCH", False):
+            docs = kb_index.select(["retro"]).similarity_search("Who owns INC-4821?", k=3)
+        self.assertFalse(any("INC-4821" in doc.page_content for doc in docs))
+
+
+class ContextPackingTests(SimpleTestCase):
+    def doc(self, text, file_id="f1"):
+        from langchain_core.documents import Document
+
+        return Document(page_content=text, metadata={"file_id": file_id})
+
+    def test_dedupe_drops_repeats_and_stitches_overlaps(self):
+        from api.services.context_builder import dedupe_chunks
+
+        first = "Alex: the budget review moved to Thursday because finance needs the numbers."
+        second = "finance needs the numbers. Sam: then hiring gets the Friday slot instead."
+        other = "finance needs the numbers. Priya: the vendor renewal is due too."
+        docs, removed = dedupe_chunks([
+            self.doc(first), self.doc(second), self.doc(first), self.doc("the budget review moved"),
+            self.doc(second, file_id="f2"), self.doc(other, file_id="f2"),
+        ])
+        self.assertEqual(removed, 4)
+        self.assertEqual([(doc.page_content, doc.metadata["file_id"]) for doc in docs], [
+            ("Alex: the budget review moved to Thursday because finance needs the numbers. "
+             "Sam: then hiring gets the Friday slot instead.", "f1"),
+            (other, "f2"),  # overlaps only stitch within a file
+        ])
+
+    def test_chunks_and_summaries_fit_the_budget(self):
+        from api.services.context_builder import build_context
+        from api.services.tokens import count_tokens
+
+        docs = [self.doc(f"Chunk {i}: " + "budget forecast numbers " * 20, file_id=f"f{i % 3}") for i in range(12)]
+        summaries = {"f0": "Budget summary. " * 80, "f1": "Hiring summary. " * 80, "f2": None}
+        for budget in (0, 1, 40, 300, 1000, 100000):
+            with self.subTest(budget=budget):
+                summary_text, context = build_context("What is the budget forecast?", summaries, docs, budget=budget)
+                sections = summary_text.split("\n\n--- Summary for ")[1:]
+                used = sum(count_tokens(section.split(" ---\n", 1)[1]) for section in sections)
+                self.assertLessEqual(used + sum(count_tokens(chunk) for chunk in context.split("\n\n") if chunk),
+                                     budget)
+
+        # With room for everything nothing is truncated, and a missing summary says so
+        with self.assertLogs("api.services.context_builder", "INFO") as logs:
+            summary_text, context = build_context("What is the budget forecast?", summaries, docs, budget=100000)
+        self.assertIn("12/12 chunks", logs.output[0])
+        self.assertIn("of 100000", logs.output[0])
+        self.assertNotIn("[...]", summary_text)
+        self.assertIn("--- Summary for f2 ---\n(No summary available)", summary_text)
+        self.assertEqual(context.count("Chunk "), 12)
+
+    def test_zero_budget_packs_nothing(self):
+        from api.services.context_builder import build_context
+
+        docs = [self.doc("Chunk: budget forecast numbers")]
+        self.assertEqual(build_context("budget?", {"f1": None, "f2": "Summary"}, docs, budget=0), ("", ""))
+        self.assertEqual(build_context("budget?", "", docs, budget=0), ("", ""))
+
+
+class JsonLogTests(SimpleTestCase):
+    def test_logs_and_spans_share_the_json_stream(self):
+        import logging
+        from api.services import telemetry
+
+        formatter = telemetry.JsonLogFormatter()
+        with self.assertLogs("api.services", "INFO") as logs, self.assertLogs("api.spans", "INFO") as spans:
+            with telemetry.trace("req-1"), mock.patch.object(telemetry, "SPAN_LOGS", "traced"):
+                logging.getLogger("api.services.jobs").warning("Requeued %d stale running jobs", 2)
+                telemetry.record_span("embed", 0.25, texts=3)
+                lines = [json.loads(formatter.format(record)) for record in logs.records + spans.records]
+
+        self.assertEqual(
+            {key: lines[0][key] for key in ("type", "level", "logger", "message", "trace_id")},
+            {"type": "log", "level": "WARNING", "logger": "api.services.jobs",
+             "message": "Requeued 2 stale running jobs", "trace_id": "req-1"},
+        )
+        self.assertEqual(
+            {key: lines[1][key] for key in ("type", "span", "status", "duration_ms", "texts", "trace_id")},
+            {"type": "span", "span": "embed", "status": "ok", "duration_ms": 250.0, "texts": 3, "trace_id": "req-1"},
+        )
@@ -0,0 +1,22 @@
+import hashlib
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads to a temp file like Django's handler, hashing the bytes on the
+    way through so ingest can recognise known content without re-reading it.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.sha256.hexdigest()
+        return file
@@ -1,13 +1,24 @@
 from django.urls import path
 from django.contrib import admin
-from . import views
+from . import views, async_views
+
+# Under ASGI (ASYNC_VIEWS=1, set by asgi.py) the ask and list endpoints are coroutines
+ask_views = async_views if async_views.ASYNC_VIEWS else views
 
 urlpatterns = [
     path("upload/", views.upload_file),
-    path("ask/", views.ask_question),
-    path("api/kb/<str:kb_id>/files/", views.list_kb_files),
-    path("api/kb/<str:kb_id>/summaries/", views.list_kb_summaries),
-    path("api/kb/ask/", views.kb_ask_question),
+    path("uploads/", views.start_direct_upload),
+    path("uploads/complete/", views.complete_direct_upload),
+    path("uploads/abort/", views.abort_direct_upload),
+    path("jobs/<uuid:job_id>/", views.job_status),
+    path("ask/", ask_views.ask_question),
+    path("ask/stream/", ask_views.ask_question_stream),
+    path("api/kb/<str:kb_id>/files/", ask_views.list_kb_files),
+    path("api/kb/<str:kb_id>/summaries/", ask_views.list_kb_summaries),
+    path("api/kb/ask/", ask_views.kb_ask_question),
+    path("api/kb/ask/stream/", ask_views.kb_ask_question_stream),
     path("api/login/", views.api_login),
+    path("api/cache/stats/", views.cache_stats),
+    path("metrics", views.metrics),
     path("admin/", admin.site.urls),
 ]
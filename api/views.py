@@ -1,21 +1,21 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate
-from .services.uploader import upload_file_to_s3, upload_docx_transcript_and_return_text, upload_txt_transcript_and_return_text
-from .services.transcriber import transcribe_amazon
-from .services.summarizer import summarize_with_claude
-from .services.rag_engine import chunk_transcript, embed_transcript_and_upload, retrieve_context, answer_question_rag
+from django.utils.http import parse_etags
+from .models import IngestJob
 from .services.utils import get_file_type
-from .services.kb_query import load_kb_vectorstore
-from .services.kb_builder import add_file_to_kb
-from api.services.config import get_aws_session
-from api.services.kb_query import KB_CONFIG
+from .services.summaries import list_kb_summaries as load_kb_summary_list
+from .services.kb_manifest import load_kb_manifest
+from .services.index_cache import index_cache
+from .services.telemetry import span_metrics, record_span
+from .services.jobs import submit_upload, submit_s3_upload, ensure_workers, safe_upload_name, upload_key
+from api.services.kb_config import KB_CONFIG
 import re
+import json
+import time
 import logging
-from io import BytesIO
 
 
 logger = logging.getLogger(__name__)
@@ -42,149 +42,288 @@ def upload_file(request):
     if not file:
         return Response({"error": "No file uploaded"}, status=400)
 
-    try:
-        safe_filename = re.sub(r"[^a-zA-Z0-9._-]", "-", file.name)
-        file_type = get_file_type(file.name)
-        file_key = safe_filename.rsplit(".", 1)[0]
-        s3_prefix = kb_id if kb_id else "single-uploads"
-        s3_filename = f"{s3_prefix}/{safe_filename}"
-        
-
-        # Read file into memory
-        file_bytes = file.read()
-        file.seek(0)  # reset for S3 upload
-
-        # Upload original file to S3
-        s3_uri = upload_file_to_s3(file, s3_filename, file.content_type)
-        if not s3_uri:
-            return Response({"error": "Failed to upload to S3"}, status=500)
-
-        # Handle different types
-        if file_type == "video":
-            transcript_text = transcribe_amazon(
-                s3_uri,
-                output_bucket="aima-meeting-transcripts",
-                key_prefix=file_key,
-            )
-            
-        elif file_type == "docx":
-            if kb_id:
-                transcript_text = upload_docx_transcript_and_return_text(BytesIO(file_bytes), kb_id, file_key)
-            else:
-                from api.services.docx_parser import convert_docx_to_clean_text
-                transcript_text = convert_docx_to_clean_text(BytesIO(file_bytes))
-                from api.services.config import get_aws_session
-                s3 = get_aws_session().client("s3")
-                s3.put_object(
-                    Bucket="aima-meeting-transcripts",
-                    Key=f"{s3_prefix}/{file_key}.txt",
-                    Body=transcript_text.encode("utf-8"),
-                    ContentType="text/plain"
-                )
-        elif file_type == "text":
-            transcript_text = file_bytes.decode("utf-8")
-            from api.services.config import get_aws_session
-            s3 = get_aws_session().client("s3")
-            s3.put_object(
-                Bucket="aima-meeting-transcripts",
-                Key=f"{s3_prefix}/{file_key}.txt",
-                Body=transcript_text.encode("utf-8"),
-                ContentType="text/plain"
-            )
-        else:
-            return Response({"error": f"Unsupported file type: {file_type}"}, status=400)
-
-        if not transcript_text:
-            return Response({"error": "Transcript extraction failed."}, status=500)
-
-        summary = summarize_with_claude(transcript_text)
-        docs = chunk_transcript(transcript_text)
-
-        if kb_id:
-            add_file_to_kb(kb_id, file_key, transcript_text, summary)
-        else:
-            embed_transcript_and_upload(docs, key_prefix=f"single-uploads/{file_key}")
-
-        return Response({"summary": summary}, status=200)
+    file_type = get_file_type(file.name)
+    if file_type == "unknown":
+        return Response({"error": f"Unsupported file type: {file_type}"}, status=400)
 
+    try:
+        # Transcription, summarization and indexing run on the ingest workers
+        job = submit_upload(file, kb_id)
     except Exception as e:
         logger.exception("Upload failed.")
         return Response({"error": f"Unexpected error: {str(e)}"}, status=500)
 
+    return Response(
+        {"job_id": str(job.id), "status": job.status, "status_url": f"/jobs/{job.id}/"},
+        status=202,
+    )
+
+
+def _direct_upload_target(request):
+    """
+    (kb_id, filename, key) for a direct upload, or an error Response. The key is
+    always derived here so clients can only write where /upload/ would.
+    """
+    filename = request.data.get("filename")
+    kb_id = request.data.get("kb_id") or None
+    if not filename:
+        return Response({"error": "filename is required"}, status=400)
+    if get_file_type(filename) == "unknown":
+        return Response({"error": f"Unsupported file type: {filename}"}, status=400)
+    if kb_id and kb_id not in KB_CONFIG:
+        return Response({"error": f"Unknown KB: {kb_id}"}, status=400)
+    return kb_id, filename, upload_key(kb_id, safe_upload_name(filename))
 
 
 @api_view(["POST"])
-def ask_question(request):
-    question = request.data.get("question")
-    kb_id = request.data.get("kb_id")
-    files = request.data.get("files", [])
-    summary_text = request.data.get("summary")
+def start_direct_upload(request):
+    from .services.uploader import create_presigned_upload
+
+    target = _direct_upload_target(request)
+    if isinstance(target, Response):
+        return target
+    _, _, key = target
+
+    try:
+        size = int(request.data.get("size", 0))
+    except (TypeError, ValueError):
+        return Response({"error": "size must be an integer"}, status=400)
+    if size <= 0:
+        return Response({"error": "size must be positive"}, status=400)
+
+    try:
+        upload = create_presigned_upload(key, request.data.get("content_type", ""), size)
+    except Exception as e:
+        logger.exception("Could not start direct upload.")
+        return Response({"error": f"Unexpected error: {str(e)}"}, status=500)
+    return Response(upload)
+
+
+@api_view(["POST"])
+def complete_direct_upload(request):
+    from .services.uploader import complete_presigned_upload
+
+    target = _direct_upload_target(request)
+    if isinstance(target, Response):
+        return target
+    kb_id, filename, key = target
+
+    upload_id = request.data.get("upload_id")
+    parts = request.data.get("parts")
+    if not upload_id or not parts:
+        return Response({"error": "upload_id and parts are required"}, status=400)
+    if request.data.get("key", key) != key:
+        return Response({"error": "key does not match filename/kb_id"}, status=400)
+
+    try:
+        s3_uri = complete_presigned_upload(key, upload_id, parts)
+        job = submit_s3_upload(s3_uri, filename, request.data.get("content_type", ""), kb_id)
+    except Exception as e:
+        logger.exception("Could not complete direct upload.")
+        return Response({"error": f"Unexpected error: {str(e)}"}, status=500)
+
+    return Response(
+        {"job_id": str(job.id), "status": job.status, "status_url": f"/jobs/{job.id}/"},
+        status=202,
+    )
+
+
+@api_view(["POST"])
+def abort_direct_upload(request):
+    from .services.uploader import abort_presigned_upload
+
+    target = _direct_upload_target(request)
+    if isinstance(target, Response):
+        return target
+    upload_id = request.data.get("upload_id")
+    if not upload_id:
+        return Response({"error": "upload_id is required"}, status=400)
+
+    try:
+        abort_presigned_upload(target[2], upload_id)
+    except Exception as e:
+        logger.exception("Could not abort direct upload.")
+        return Response({"error": f"Unexpected error: {str(e)}"}, status=500)
+    return Response({"aborted": True})
+
+
+@api_view(["GET"])
+def job_status(request, job_id):
+    try:
+        job = IngestJob.objects.get(pk=job_id)
+    except IngestJob.DoesNotExist:
+        return Response({"error": "Unknown job"}, status=404)
+
+    ensure_workers()  # pick up queued jobs if this process has not started its workers yet
+    return Response(job.to_dict())
+
+
+def _json_response(body, status=200) -> JsonResponse:
+    return JsonResponse(body, status=status, safe=False)
+
+
+def _ask_response(data, respond=_json_response):
+    """
+    Answer a /ask/ request (shared by the DRF view and its async counterpart).
+    respond builds the response from (body, status): DRF's Response for the DRF
+    view, a plain JsonResponse for the async one.
+    """
+    # langchain/FAISS load on first question rather than at URLconf import
+    from .services.rag_engine import retrieve_context, answer_question_rag
+    from .services.kb_query import answer_kb_question
+
+    question = data.get("question")
+    kb_id = data.get("kb_id")
+    files = data.get("files", [])
+    summary_text = data.get("summary")
 
     if kb_id and files:
-        vectorstore, summary = load_kb_vectorstore(kb_id, files)
-        context_docs = vectorstore.similarity_search(question)
-        answer = answer_question_rag(summary, context_docs, question)
-        return Response({"answer": answer})
+        answer = answer_kb_question(kb_id, files, question)
+        return respond({"answer": answer})
 
     if summary_text:
-        context_docs = retrieve_context(request.data.get("file_key"), question)
+        context_docs = retrieve_context(data.get("file_key"), question)
         answer = answer_question_rag(summary_text, context_docs, question)
-        return Response({"answer": answer})
+        return respond({"answer": answer})
+
+    return respond({"error": "Missing parameters"}, status=400)
+
+
+@api_view(["POST"])
+def ask_question(request):
+    return _ask_response(request.data, Response)
+
+
+def _sse_response(chunks, started: float, label: str) -> StreamingHttpResponse:
+    """
+    Wrap a text generator (or async iterator, for the async views) as a
+    server-sent event stream: one `data: {"text": ...}` event per delta, then `event: done`.
+    Time to first token is logged and exported as the "first_token <label>" span.
+    """
+    def event(text, first):
+        if first:
+            waited = time.perf_counter() - started
+            record_span(f"first_token {label}", waited)
+            logger.info("%s first token after %d ms", label, round(waited * 1000))
+        return f"data: {json.dumps({'text': text})}\n\n"
+
+    def events():
+        first = True
+        for text in chunks:
+            yield event(text, first)
+            first = False
+        yield "event: done\ndata: {}\n\n"
+
+    async def async_events():
+        first = True
+        async for text in chunks:
+            yield event(text, first)
+            first = False
+        yield "event: done\ndata: {}\n\n"
+
+    body = async_events() if hasattr(chunks, "__aiter__") else events()
+    response = StreamingHttpResponse(body, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
+
+def _ask_stream_response(data, started: float, stream=iter):
+    """
+    Streaming /ask/stream/ response. stream wraps the answer's text iterator
+    (the async views pass upstream.iterate_blocking).
+    """
+    from .services.rag_engine import retrieve_context, stream_answer_rag
+    from .services.kb_query import stream_kb_answer
+
+    question = data.get("question")
+    kb_id = data.get("kb_id")
+    files = data.get("files", [])
+    summary_text = data.get("summary")
+
+    if kb_id and files:
+        return _sse_response(stream(stream_kb_answer(kb_id, files, question)), started, "/ask/stream/")
+
+    if summary_text:
+        context_docs = retrieve_context(data.get("file_key"), question)
+        return _sse_response(stream(stream_answer_rag(summary_text, context_docs, question)), started, "/ask/stream/")
 
-    return Response({"error": "Missing parameters"}, status=400)
+    return JsonResponse({"error": "Missing parameters"}, status=400)
+
+
+@api_view(["POST"])
+def ask_question_stream(request):
+    return _ask_stream_response(request.data, time.perf_counter())
 
 
 @api_view(["GET"])
-def list_kb_files(request, kb_id):
-    if not kb_id or kb_id not in KB_CONFIG:
-        return Response({"error": "Invalid KB ID"}, status=400)
+def cache_stats(request):
+    from .services.answer_cache import get_answer_cache
+    from .services.embeddings import get_embeddings
+    from .services import index_store
 
-    session = get_aws_session()
-    s3 = session.client("s3")
+    return Response({
+        "answers": get_answer_cache().stats(),
+        "indexes": index_cache.stats(),
+        "index_store": index_store.stats(),
+        "embeddings": get_embeddings().stats(),
+    })
 
-    prefix = f"{KB_CONFIG[kb_id]['prefix']}/"
 
-    # Get .index.faiss files (videos + docx, embedded)
-    embedding_bucket = KB_CONFIG[kb_id]['buckets']['embeddings']
-    transcript_bucket = KB_CONFIG[kb_id]['buckets']['transcripts']
-    all_files = set()
+def metrics(request):
+    # Prometheus text format; plain Django view so DRF content negotiation stays out of the way
+    return HttpResponse(span_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    try:
-        embedding_response = s3.list_objects_v2(Bucket=embedding_bucket, Prefix=prefix)
-        if 'Contents' in embedding_response:
-            for obj in embedding_response['Contents']:
-                key = obj['Key']
-                if key.endswith(".index.faiss"):
-                    filename = key.replace(".index.faiss", "").split("/")[-1]
-                    all_files.add(filename)
-
-        transcript_response = s3.list_objects_v2(Bucket=transcript_bucket, Prefix=prefix)
-        if 'Contents' in transcript_response:
-            for obj in transcript_response['Contents']:
-                key = obj['Key']
-                if key.endswith(".txt"):
-                    filename = key.replace(".txt", "").split("/")[-1]
-                    all_files.add(filename)
-
-        return Response({"files": sorted(all_files)})
 
+def _kb_files_response(kb_id, if_none_match: str, details: bool, respond=_json_response) -> HttpResponse:
+    if not kb_id or kb_id not in KB_CONFIG:
+        return respond({"error": "Invalid KB ID"}, status=400)
+
+    try:
+        manifest, manifest_etag = load_kb_manifest(kb_id)
     except Exception as e:
-        return Response({"error": f"S3 error: {str(e)}"}, status=500)
+        return respond({"error": f"S3 error: {str(e)}"}, status=500)
 
+    # The manifest's ETag changes with every ingest, so clients can revalidate cheaply
+    etag = f'"{manifest_etag}"'
+    if etag in parse_etags(if_none_match):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+
+    body = {"files": sorted(manifest["files"])}
+    if details:
+        body["details"] = manifest["files"]
+    response = respond(body)
+    response["ETag"] = etag
+    return response
+
+
+@api_view(["GET"])
+def list_kb_files(request, kb_id):
+    return _kb_files_response(kb_id, request.headers.get("If-None-Match", ""), bool(request.GET.get("details")), Response)
 
-@api_view(["POST"])
-def kb_ask_question(request):
-    kb_id = request.POST.get("kb_id")
-    files = request.POST.getlist("files")
-    question = request.POST.get("question")
+
+def _kb_ask_response(form) -> HttpResponse:
+    from .services.kb_query import answer_kb_question
+
+    kb_id = form.get("kb_id")
+    files = form.getlist("files")
+    question = form.get("question")
 
     if not (kb_id and files and question):
         return JsonResponse({"error": "Missing inputs"}, status=400)
 
-    vectorstore, summary = load_kb_vectorstore(kb_id, files)
-    context_docs = vectorstore.similarity_search(question)
-    answer = answer_question_rag(summary, context_docs, question)
+    answer = answer_kb_question(kb_id, files, question)
+    return _answer_html(answer)
+
+
+@api_view(["POST"])
+def kb_ask_question(request):
+    return _kb_ask_response(request.POST)
 
+
+def _answer_html(answer: str) -> HttpResponse:
     if "```mermaid" in answer:
         match = re.search(r"```mermaid\s+(.*?)```", answer, re.DOTALL)
         if match:
@@ -200,54 +339,34 @@ def kb_ask_question(request):
     return HttpResponse(f"<div class='chat-message assistant'>{answer}</div>")
 
 
-@api_view(["GET"])
-def list_kb_summaries(request, kb_id):
-    session = get_aws_session()
-    s3 = session.client("s3")
+def _kb_ask_stream_response(form, started: float, stream=iter):
+    from .services.kb_query import stream_kb_answer
+
+    kb_id = form.get("kb_id")
+    files = form.getlist("files")
+    question = form.get("question")
+
+    if not (kb_id and files and question):
+        return JsonResponse({"error": "Missing inputs"}, status=400)
+
+    return _sse_response(stream(stream_kb_answer(kb_id, files, question)), started, "/api/kb/ask/stream/")
+
+
+@api_view(["POST"])
+def kb_ask_question_stream(request):
+    return _kb_ask_stream_response(request.POST, time.perf_counter())
+
+
+def _kb_summaries_response(kb_id, respond=_json_response):
     if not kb_id or kb_id not in KB_CONFIG:
-        return Response({"error": "Invalid KB ID"}, status=400)
- 
-    prefix = KB_CONFIG[kb_id]["prefix"]
-    bucket = KB_CONFIG[kb_id]["buckets"]["summaries"]
- 
+        return respond({"error": "Invalid KB ID"}, status=400)
+
     try:
-        response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        summaries = []
-       
-        for obj in response.get("Contents", []):
-            key = obj["Key"]
-            # Check for both .txt and .md files
-            if not (key.endswith(".txt") or key.endswith(".md")):
-                continue
-               
-            summary_resp = s3.get_object(Bucket=bucket, Key=key)
-            summary_text = summary_resp["Body"].read().decode("utf-8")
-           
-            # Extract file_id by removing extension
-            file_id = key.split("/")[-1]
-            if file_id.endswith(".txt"):
-                file_id = file_id[:-4]
-            elif file_id.endswith(".md"):
-                file_id = file_id[:-3]
-           
-            # Extract recording_id and title
-            if "_" in file_id:
-                recording_id = file_id.split("_")[0]
-                title = " ".join(file_id.split("_")[1:])
-            else:
-                recording_id = file_id
-                title = file_id
-           
-            summaries.append({
-                "recording_id": recording_id,
-                "title": title,
-                "summary_markdown": summary_text,
-                "transcript_url": f"https://{KB_CONFIG[kb_id]['buckets']['transcripts']}.s3.amazonaws.com/{prefix}/{file_id}.txt",
-                "video_url": f"https://{KB_CONFIG[kb_id]['buckets']['uploads']}.s3.amazonaws.com/{prefix}/{file_id}.mp4"
-            })
-       
-        return Response(summaries)
+        return respond(load_kb_summary_list(kb_id))
     except Exception as e:
-        return Response({"error": str(e)}, status=500)
+        return respond({"error": str(e)}, status=500)
 
 
+@api_view(["GET"])
+def list_kb_summaries(request, kb_id):
+    return _kb_summaries_response(kb_id, Response)
@@ -3,19 +3,23 @@ import requests
 import os
 import re
 import json
-import boto3
-from api.services.kb_query import KB_CONFIG
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from api.services.kb_config import KB_CONFIG
  
 # CONFIG
 DJANGO_API = os.getenv("DJANGO_API", "http://localhost:8000")
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Give up on an ingest job that hasn't finished after this long (transcription alone may take 2h)
+JOB_WAIT_TIMEOUT = float(os.getenv("JOB_WAIT_TIMEOUT", str(3 * 60 * 60)))
+# Parts PUT to S3 at once by direct uploads
+UPLOAD_PART_CONCURRENCY = int(os.getenv("UPLOAD_PART_CONCURRENCY", "4"))
+# Files uploaded and processed at once from the uploader
+UI_INGEST_CONCURRENCY = int(os.getenv("UI_INGEST_CONCURRENCY", "3"))
+# Send an X-Trace-Id with each upload and question so the backend logs its spans
+UI_TRACE_REQUESTS = os.getenv("UI_TRACE_REQUESTS", "0") == "1"
  
-# Load KB Config
-kb_config_path = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "api", "services", "kb_config.json")
-)
- 
-with open(kb_config_path) as f:
-    KB_CONFIG = json.load(f)
 kb_list = list(KB_CONFIG.keys())
  
 # Domain categories
@@ -374,12 +378,24 @@ def fetch_kb_summaries(kb_id):
         return []
    
  
-@st.cache_data(ttl=600)  # Cache data
+@st.cache_resource
+def _kb_files_cache():
+    return {}  # kb_id -> (etag, files), shared across sessions
+
+
 def list_kb_files(kb_id):
+    cache = _kb_files_cache()
+    cached = cache.get(kb_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
     try:
-        res = requests.get(f"{DJANGO_API}/api/kb/{kb_id}/files/")
+        res = requests.get(f"{DJANGO_API}/api/kb/{kb_id}/files/", headers=headers)
+        if res.status_code == 304 and cached:
+            return cached[1]  # unchanged since last fetch
         if res.headers.get("Content-Type", "").startswith("application/json"):
-            return res.json().get("files", [])
+            files = res.json().get("files", [])
+            if res.status_code == 200 and res.headers.get("ETag"):
+                cache[kb_id] = (res.headers["ETag"], files)
+            return files
         else:
             st.warning("⚠️ Non-JSON response from backend. Showing raw content below.")
             st.text(res.text)
@@ -636,14 +652,12 @@ def login_page():
        
  
 
+MERMAID_BLOCK = re.compile(r"```mermaid\s+(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
 def render_mermaid_block(answer: str):
-    patterns = [r"```mermaid\s+(.*?)```"]
-    mermaid_code = None
-    for pattern in patterns:
-        match = re.search(pattern, answer, re.DOTALL | re.IGNORECASE)
-        if match:
-            mermaid_code = match.group(1).strip()
-            break
+    match = MERMAID_BLOCK.search(answer)
+    mermaid_code = match.group(1).strip() if match else None
  
     if mermaid_code:
         try:
@@ -702,6 +716,147 @@ def get_kb_summary_data(kb_id):
         st.error(f"Error: {e}")
         return []
     
+def trace_headers(label):
+    """
+    A fresh X-Trace-Id header when UI_TRACE_REQUESTS is on (else no headers).
+    The id is printed so a slow upload or answer can be found in the backend logs.
+    """
+    if not UI_TRACE_REQUESTS:
+        return {}
+    trace_id = uuid.uuid4().hex
+    print(f"[TRACE] {label}: {trace_id}")
+    return {"X-Trace-Id": trace_id}
+
+
+def wait_for_job(job_id, on_progress=None, headers=None):
+    """
+    Poll an ingest job until it succeeds or fails, reporting each update.
+    Raises TimeoutError if it is still unfinished after JOB_WAIT_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + JOB_WAIT_TIMEOUT
+    while True:
+        res = requests.get(f"{DJANGO_API}/jobs/{job_id}/", headers=headers, timeout=30)
+        res.raise_for_status()
+        job = res.json()
+        if on_progress:
+            on_progress(job)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Job {job_id} still {job['status']} after {JOB_WAIT_TIMEOUT / 60:.0f} minutes")
+        time.sleep(JOB_POLL_SECONDS)
+
+
+def direct_upload(file, kb_id=None, headers=None):
+    """
+    Upload a file straight to S3 through presigned multipart URLs, then queue
+    its ingest job. Returns the /uploads/complete/ response (job_id etc.).
+    """
+    target = {"filename": file.name, "kb_id": kb_id, "content_type": file.type or ""}
+    res = requests.post(f"{DJANGO_API}/uploads/", json={**target, "size": file.size}, headers=headers, timeout=30)
+    res.raise_for_status()
+    upload = res.json()
+    data = file.getbuffer()
+    part_size = upload["part_size"]
+
+    def put_part(part):
+        offset = (part["part_number"] - 1) * part_size
+        put = requests.put(part["url"], data=bytes(data[offset:offset + part_size]), timeout=(10, 300))
+        put.raise_for_status()
+        return {"part_number": part["part_number"], "etag": put.headers["ETag"]}
+
+    try:
+        with ThreadPoolExecutor(max_workers=UPLOAD_PART_CONCURRENCY) as pool:
+            parts = list(pool.map(put_part, upload["parts"]))
+    except Exception:
+        requests.post(f"{DJANGO_API}/uploads/abort/", json={**target, "upload_id": upload["upload_id"]},
+                      headers=headers, timeout=30)
+        raise
+
+    res = requests.post(
+        f"{DJANGO_API}/uploads/complete/",
+        json={**target, "key": upload["key"], "upload_id": upload["upload_id"], "parts": parts},
+        headers=headers,
+        timeout=60,
+    )
+    res.raise_for_status()
+    return res.json()
+
+
+def ingest_files(files, kb_id=None):
+    """
+    Upload and process files concurrently (at most UI_INGEST_CONCURRENCY at a
+    time), showing live per-file progress. Yields (file, finished job or
+    exception) in completion order, so one failure doesn't hold up the rest.
+    """
+    # Worker threads have no Streamlit context; they only record progress here
+    progress = {file.name: "queued" for file in files}
+    placeholders = {file.name: st.empty() for file in files}
+
+    def ingest(file):
+        def on_progress(job):
+            progress[file.name] = format_job_progress(job)
+
+        progress[file.name] = "uploading"
+        headers = trace_headers(f"upload {file.name}")
+        upload = direct_upload(file, kb_id, headers)
+        return wait_for_job(upload["job_id"], on_progress, headers)
+
+    with ThreadPoolExecutor(max_workers=UI_INGEST_CONCURRENCY) as pool:
+        pending = {pool.submit(ingest, file): file for file in files}
+        while pending:
+            done, _ = wait(pending, timeout=JOB_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                file = pending.pop(future)
+                placeholders[file.name].empty()
+                yield file, future.exception() or future.result()
+            for future, file in pending.items():
+                placeholders[file.name].info(f"⏳ {file.name}: {progress[file.name]}")
+
+
+def stream_answer(payload):
+    """
+    Yield answer text from /ask/stream/ as it is generated (server-sent events).
+    """
+    headers = trace_headers(f"question {payload['question'][:40]!r}")
+    with requests.post(f"{DJANGO_API}/ask/stream/", json=payload, headers=headers, stream=True, timeout=(10, 300)) as res:
+        res.raise_for_status()
+        event = "message"
+        for line in res.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                if event == "done":
+                    return
+                yield json.loads(line[len("data:"):])["text"]
+            elif not line:
+                event = "message"
+
+
+def write_answer_stream(payload):
+    """
+    Stream the answer into a placeholder, swapping the raw text for the rendered
+    flowchart once the answer turns out to hold a mermaid block.
+    """
+    placeholder = st.empty()
+    with placeholder.container():
+        answer = st.write_stream(stream_answer(payload))
+    if MERMAID_BLOCK.search(answer):
+        with placeholder.container():
+            render_mermaid_block(answer)
+            st.markdown("✅ Flowchart rendered above.")
+    return answer
+
+
+def format_job_progress(job):
+    done = [f"{s['name']} ({s['duration_ms'] / 1000:.1f}s)" for s in job["stages"] if s.get("status") == "succeeded"]
+    if job["status"] == "waiting":
+        current = f"waiting on {job['stage']}"
+    else:
+        current = f"running {job['stage']}" if job.get("stage") else job["status"]
+    return " → ".join(done + [current])
+
+
 # MAIN INTERFACE 
 def upload_interface():
     # Safe init
@@ -738,26 +893,22 @@ def upload_interface():
     new_files = [file for file in uploaded_files if file.name not in processed_files] if uploaded_files else []
 
     if new_files:
-        with st.spinner("🔄 Processing new files to generate summary..."):
-            for file in new_files:
-                files = {"file": file}
-                data = {"kb_id": kb_id} if kb_id else {}
-                try:
-                    res = requests.post(f"{DJANGO_API}/upload/", files=files, data=data)
-                    if res.status_code == 200:
-                        summary = res.json().get("summary", "")
-                        st.session_state["summaries"].append({
-                            "filename": file.name,
-                            "summary": summary,
-                            "file_key": file.name.rsplit(".", 1)[0]
-                        })
-                        if mode == "KnowledgeBase Uploads":
-                            st.session_state["uploaded_kb_summary"] = summary
-                        st.success(f"✅ {file.name} processed successfully")
-                    else:
-                        st.error(f"❌ {file.name} failed to process")
-                except Exception as e:
-                    st.error(f"❌ Upload failed for {file.name}: {e}")
+        with st.spinner(f"🔄 Processing {len(new_files)} new file(s) to generate summaries..."):
+            for file, outcome in ingest_files(new_files, kb_id):
+                if isinstance(outcome, Exception):
+                    st.error(f"❌ Upload failed for {file.name}: {outcome}")
+                elif outcome["status"] == "succeeded":
+                    summary = outcome["result"].get("summary", "")
+                    st.session_state["summaries"].append({
+                        "filename": file.name,
+                        "summary": summary,
+                        "file_key": file.name.rsplit(".", 1)[0]
+                    })
+                    if mode == "KnowledgeBase Uploads":
+                        st.session_state["uploaded_kb_summary"] = summary
+                    st.success(f"✅ {file.name} processed successfully")
+                else:
+                    st.error(f"❌ {file.name} failed to process: {outcome.get('error', '')}")
 
     # SINGLE UPLOAD MODE
     if mode == "Single Upload":
@@ -810,24 +961,18 @@ def upload_interface():
 
                     # Show assistant thinking and get response
                     with st.chat_message("assistant"):
-                        with st.spinner("_Generating answer..._"):
-                            try:
-                                res = requests.post(f"{DJANGO_API}/ask/", json=payload)
-                                if res.status_code == 200:
-                                    answer = res.json()["answer"]
-                                    if render_mermaid_block(answer):
-                                        st.markdown("✅ Flowchart rendered above.")
-                                    else:
-                                        st.markdown(answer)
-                                    st.session_state["chat_history"].append({"role": "assistant", "content": answer})
-                                else:
-                                    error_msg = "❌ Failed to fetch answer."
-                                    st.error(error_msg)
-                                    st.session_state["chat_history"].append({"role": "assistant", "content": error_msg})
-                            except Exception as e:
-                                error_msg = f"❌ Error: {str(e)}"
-                                st.error(error_msg)
-                                st.session_state["chat_history"].append({"role": "assistant", "content": error_msg})
+                        try:
+                            # Tokens render as Claude generates them
+                            answer = write_answer_stream(payload)
+                            st.session_state["chat_history"].append({"role": "assistant", "content": answer})
+                        except requests.HTTPError:
+                            error_msg = "❌ Failed to fetch answer."
+                            st.error(error_msg)
+                            st.session_state["chat_history"].append({"role": "assistant", "content": error_msg})
+                        except Exception as e:
+                            error_msg = f"❌ Error: {str(e)}"
+                            st.error(error_msg)
+                            st.session_state["chat_history"].append({"role": "assistant", "content": error_msg})
         else:
             st.markdown("⚠️ Upload one or more meeting files to start.")
 
@@ -904,27 +1049,25 @@ def upload_interface():
                 # Add user message to history
                 st.session_state[chat_key].append({"role": "user", "content": kb_question})
                 
-                # Process KB query
-                with st.spinner("_Generating answer..._"):
-                    payload = {
-                        "question": kb_question,
-                        "kb_id": kb_id,
-                        "files": selected_files
-                    }
+                # Process KB query, rendering the answer as it streams in
+                payload = {
+                    "question": kb_question,
+                    "kb_id": kb_id,
+                    "files": selected_files
+                }
+                with st.chat_message("assistant"):
                     try:
-                        res = requests.post(f"{DJANGO_API}/ask/", json=payload)
-                        if res.status_code == 200:
-                            answer = res.json()["answer"]
-                            st.session_state[chat_key].append({"role": "assistant", "content": answer})
-                        else:
-                            error_msg = "❌ KB Query failed."
-                            st.session_state[chat_key].append({"role": "assistant", "content": error_msg})
+                        answer = write_answer_stream(payload)
+                        st.session_state[chat_key].append({"role": "assistant", "content": answer})
+                    except requests.HTTPError:
+                        error_msg = "❌ KB Query failed."
+                        st.session_state[chat_key].append({"role": "assistant", "content": error_msg})
                     except Exception as e:
                         error_msg = f"❌ KB Error: {str(e)}"
                         st.session_state[chat_key].append({"role": "assistant", "content": error_msg})
-                    
-                    # Force a rerun to update the chat history display
-                    st.rerun()
+
+                # Force a rerun to update the chat history display
+                st.rerun()
             else:
                 st.warning("⚠️ Please select at least one meeting file before asking.")
 